@@ -0,0 +1,4 @@
+"""Performance benchmarks using a local mock of the Groups Web Service
+
+See ``benchmarks/run.py``.
+"""
@@ -0,0 +1,351 @@
+"""Local stand-in for the Groups Web Service (/group_sws/v3)
+
+Implements the subset of the API used by ``uwgroups``: creating,
+reading and deleting groups, reading and modifying membership
+(including conditional requests using ETags), searching by member
+or name, and setting affiliates. State is kept in memory. Clients
+authenticate using certificates created by ``make_certs()``.
+
+Example::
+
+    certs = make_certs('/tmp/certs')
+    with MockGWS(certs, latency=0.01) as server:
+        server.add_group('u_foo_bar', members=['a', 'b'])
+        with UWGroups(certs['client'], **server.client_args()) as conn:
+            conn.get_members('u_foo_bar')
+
+"""
+
+import json
+import logging
+import os
+import random
+import ssl
+import subprocess
+import threading
+import time
+from fnmatch import fnmatchcase
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from os import path
+from urllib.parse import urlsplit, parse_qs, unquote
+
+log = logging.getLogger(__name__)
+
+API_PATH = '/group_sws/v3'
+
+CLIENT_SUBJECT = ('/C=US/ST=Washington/L=Seattle/O=University of Washington'
+                  '/OU=Testing/CN=mock.client.uw.edu/emailAddress=mockuser@uw.edu')
+
+
+def make_certs(dirname):
+    """Create (if necessary) a CA, a server certificate for localhost,
+    and a client certificate with private key in ``dirname`` using
+    the openssl command line tool. Returns a dict with keys 'ca',
+    'server', 'server_key' and 'client' (certificate and key in a
+    single file) providing paths to each.
+
+    """
+
+    certs = {
+        'ca': path.join(dirname, 'ca.pem'),
+        'server': path.join(dirname, 'server.pem'),
+        'server_key': path.join(dirname, 'server.key'),
+        'client': path.join(dirname, 'client.pem'),
+    }
+    if all(path.exists(pth) for pth in certs.values()):
+        return certs
+
+    os.makedirs(dirname, exist_ok=True)
+
+    def openssl(*args):
+        subprocess.run(['openssl'] + list(args), cwd=dirname, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    openssl('req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '3650',
+            '-keyout', 'ca.key', '-out', 'ca.pem', '-subj', '/CN=mockgws-ca')
+    with open(path.join(dirname, 'server.ext'), 'w') as f:
+        f.write('subjectAltName=DNS:localhost,IP:127.0.0.1\n')
+
+    for name, subject, ext in [('server', '/CN=localhost', ['-extfile', 'server.ext']),
+                               ('client', CLIENT_SUBJECT, [])]:
+        openssl('req', '-newkey', 'rsa:2048', '-nodes', '-keyout',
+                name + '.key', '-out', name + '.csr', '-subj', subject)
+        openssl('x509', '-req', '-in', name + '.csr', '-CA', 'ca.pem',
+                '-CAkey', 'ca.key', '-CAcreateserial', '-days', '3650',
+                '-out', name + '.crt', *ext)
+
+    with open(certs['server'], 'w') as out, \
+            open(path.join(dirname, 'server.crt')) as f:
+        out.write(f.read())
+
+    with open(certs['client'], 'w') as out:
+        for fname in ['client.key', 'client.crt']:
+            with open(path.join(dirname, fname)) as f:
+                out.write(f.read())
+
+    return certs
+
+
+def member_type(member_id):
+    """Guess the type of a member from its id"""
+    if '@' in member_id:
+        return 'eppn'
+    elif '_' in member_id:
+        return 'group'
+    elif '.' in member_id:
+        return 'dns'
+    return 'uwnetid'
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    @property
+    def timeout(self):
+        # idle keep-alive connections are closed after this interval
+        return self.server.keepalive_timeout
+
+    def log_message(self, fmt, *args):
+        log.debug(fmt % args)
+
+    def send(self, status, obj=None, headers=None):
+        body = json.dumps(obj).encode('utf-8') if obj is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for key, val in (headers or {}).items():
+            self.send_header(key, val)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def handle_request(self, method):
+        server = self.server
+        length = int(self.headers.get('Content-Length') or 0)
+        payload = self.rfile.read(length) if length else b''
+
+        with server.lock:
+            server.requests += 1
+        if server.latency:
+            time.sleep(server.latency)
+        with server.lock:
+            failure = server.failures.pop(0) if server.failures else None
+        if failure:
+            status, headers = failure
+            return self.send(status, {'errors': [{'detail': 'failure'}]}, headers)
+        if server.error_rate and random.random() < server.error_rate:
+            return self.send(503, {'errors': [{'detail': 'service unavailable'}]})
+
+        url = urlsplit(self.path)
+        if not url.path.startswith(API_PATH + '/'):
+            return self.send(404)
+
+        parts = [unquote(p) for p in url.path[len(API_PATH) + 1:].split('/')]
+        query = parse_qs(url.query)
+        with server.lock:
+            return self.send(*server.dispatch(
+                method, parts, query, payload, self.headers))
+
+    def do_GET(self):
+        self.handle_request('GET')
+
+    def do_PUT(self):
+        self.handle_request('PUT')
+
+    def do_DELETE(self):
+        self.handle_request('DELETE')
+
+
+class MockGWS(ThreadingHTTPServer):
+    """HTTPS server on localhost (on a random port unless ``port`` is
+    specified) implementing the Groups Web Service API. ``certs`` is
+    a dict returned by ``make_certs()``. Each request is delayed by
+    ``latency`` seconds, and fails with status 503 with probability
+    ``error_rate``; use ``fail()`` to make the next requests fail.
+    Connections idle for ``keepalive_timeout`` seconds are closed.
+
+    The server runs in a background thread between ``start()`` and
+    ``stop()`` (or within a with block). The number of requests
+    received is available as ``requests``.
+
+    """
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, certs, latency=0, error_rate=0, port=0,
+                 keepalive_timeout=None):
+        super().__init__(('127.0.0.1', port), Handler)
+        context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        context.load_cert_chain(certs['server'], certs['server_key'])
+        context.load_verify_locations(certs['ca'])
+        context.verify_mode = ssl.CERT_REQUIRED
+        self.socket = context.wrap_socket(self.socket, server_side=True)
+
+        self.certs = certs
+        self.latency = latency
+        self.error_rate = error_rate
+        self.keepalive_timeout = keepalive_timeout
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.failures = []
+        self.groups = {}
+        self._regid = 0
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        log.info('mock GWS listening on port {}'.format(self.port))
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        self._thread.join()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def client_args(self):
+        """Return a dict of keyword arguments for ``UWGroups`` or
+        ``AsyncUWGroups`` to connect to this server
+
+        """
+
+        return {'host': 'localhost', 'port': self.port,
+                'cafile': self.certs['ca']}
+
+    def reset(self):
+        """Delete all groups and reset the request count"""
+        with self.lock:
+            self.groups.clear()
+            self.failures = []
+            self.requests = 0
+
+    def fail(self, status, count=1, retry_after=None):
+        """Respond to the next ``count`` requests with ``status``,
+        including a Retry-After header if ``retry_after`` is provided
+
+        """
+
+        headers = {'Retry-After': str(retry_after)} if retry_after is not None else {}
+        with self.lock:
+            self.failures.extend([(status, headers)] * count)
+
+    def add_group(self, group_name, members=(), affiliates=None):
+        """Create a group directly (without checking for parents)"""
+        with self.lock:
+            self._create(group_name, members, affiliates)
+
+    def _create(self, group_name, members=(), affiliates=None, admins=()):
+        # caller must hold the lock
+        self._regid += 1
+        self.groups[group_name] = {
+            'members': {m: member_type(m) for m in members},
+            'affiliates': dict(affiliates or {}),
+            'admins': list(admins),
+            'version': 1,
+            'regid': '{:032x}'.format(self._regid),
+        }
+
+    def get_members(self, group_name):
+        """Return the ids of members of ``group_name``"""
+        with self.lock:
+            return list(self.groups[group_name]['members'])
+
+    def dispatch(self, method, parts, query, payload, headers):
+        """Return a tuple (status, obj[, headers]); called with the lock
+        held
+
+        """
+
+        groups = self.groups
+
+        if parts == ['search']:
+            if 'member' in query:
+                netid = query['member'][0]
+                names = [name for name, group in groups.items()
+                         if netid in group['members']]
+            else:
+                pattern = query.get('name', ['*'])[0]
+                names = [name for name in groups if fnmatchcase(name, pattern)]
+            return 200, {'data': [{'id': name} for name in sorted(names)]}
+
+        if len(parts) < 2 or parts[0] != 'group':
+            return 404, None
+
+        group_name = parts[1]
+        group = groups.get(group_name)
+        if len(parts) == 2:
+            return self.dispatch_group(method, group_name, group, payload)
+
+        if group is None:
+            return 404, None
+
+        if parts[2] == 'member':
+            etag = '"{}"'.format(group['version'])
+            if len(parts) == 3:
+                if method != 'GET':
+                    return 405, None
+                if headers.get('If-None-Match') == etag:
+                    return 304, None, {'ETag': etag}
+                data = [{'id': member_id, 'type': member_type}
+                        for member_id, member_type in group['members'].items()]
+                return 200, {'meta': {'regid': group['regid']}, 'data': data}, \
+                    {'ETag': etag}
+
+            member_ids = parts[3].split(',')
+            if method == 'PUT':
+                for member_id in member_ids:
+                    group['members'][member_id] = member_type(member_id)
+            elif method == 'DELETE':
+                for member_id in member_ids:
+                    group['members'].pop(member_id, None)
+            else:
+                return 405, None
+            group['version'] += 1
+            return 200, {}
+
+        if parts[2] == 'affiliate' and len(parts) == 4 and method == 'PUT':
+            group['affiliates'][parts[3]] = query.get('status', ['active'])[0]
+            return 200, {}
+
+        return 404, None
+
+    def dispatch_group(self, method, group_name, group, payload):
+        groups = self.groups
+
+        if method == 'GET':
+            if group is None:
+                return 404, None
+            affiliates = [{'name': name, 'status': status}
+                          for name, status in sorted(group['affiliates'].items())]
+            return 200, {'data': {'id': group_name, 'regid': group['regid'],
+                                  'admins': group['admins'],
+                                  'affiliates': affiliates}}
+        elif method == 'PUT':
+            if group is not None:
+                return 412, {'errors': [{'detail': 'group exists'}]}
+            parent = group_name.rsplit('_', 1)[0]
+            if parent.count('_') and parent not in groups:
+                return 404, {'errors': [{'detail': 'parent does not exist'}]}
+            data = json.loads(payload)['data']
+            self._create(group_name, admins=data.get('admins', []))
+            return 201, {'data': {'id': group_name}}
+        elif method == 'DELETE':
+            if group is None:
+                return 404, None
+            if any(name.startswith(group_name + '_') for name in groups):
+                return 412, {'errors': [{'detail': 'group has children'}]}
+            del groups[group_name]
+            return 200, {}
+
+        return 405, None
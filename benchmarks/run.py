@@ -0,0 +1,314 @@
+"""Benchmark uwgroups against a local mock Groups Web Service
+
+Each benchmark is run at a range of scales (number of members or
+groups) against the server in ``benchmarks/mockgws.py``. For each
+case, the best of --repeat runs is reported, along with the number of
+API requests, throughput (items per second) and request latency
+percentiles.
+
+Results may be saved using -o/--outfile and compared to a previous run
+using --compare; cases that are slower than the baseline by more than
+--threshold (a fraction) are reported as regressions, and the exit
+status is 1.
+
+Run from the top level of the repository::
+
+    python -m benchmarks.run                  # quick scales
+    python -m benchmarks.run --scale full -o results.json
+    python -m benchmarks.run --latency 0.02 -j 8 sync_groups
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+from uwgroups.api import UWGroups
+from uwgroups.metrics import Metrics
+from uwgroups.scheduler import RequestScheduler
+from uwgroups.utils import imap_concurrent, read_groupfile
+
+from benchmarks.mockgws import MockGWS, make_certs
+
+log = logging.getLogger(__name__)
+
+# number of members or groups for each benchmark
+SCALES = {
+    'quick': {
+        'get_members': [10, 1000, 10000],
+        'sync_members': [10, 1000, 10000],
+        'sync_groups': [1, 100, 1000],
+        'search_user': [10, 100, 1000],
+    },
+    'full': {
+        'get_members': [10, 1000, 10000, 100000],
+        'sync_members': [10, 1000, 10000, 100000],
+        'sync_groups': [1, 100, 1000, 10000],
+        'search_user': [10, 100, 1000, 10000],
+    },
+}
+
+# members of each group in sync_groups and search_user
+GROUP_SIZE = 20
+
+
+def netids(count, start=0):
+    return ['n{:07d}'.format(i) for i in range(start, start + count)]
+
+
+def percentile(values, q):
+    """Return the ``q`` quantile of sorted list ``values``"""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def bench_get_members(server, conn, args, size):
+    """Fetch the membership of a group with ``size`` members"""
+
+    group_name = 'u_bench_get'
+    server.add_group('u_bench')
+    server.add_group(group_name, members=netids(size))
+
+    def run():
+        members = conn.get_members(group_name)
+        assert len(members) == size
+        return size
+
+    return run
+
+
+def bench_sync_members(server, conn, args, size):
+    """Synchronize a group with ``size`` members, of which 10% are
+    replaced
+
+    """
+
+    group_name = 'u_bench_sync'
+    server.add_group('u_bench')
+    server.add_group(group_name, members=netids(size))
+    changed = max(1, size // 10)
+    members = netids(size, start=changed)
+
+    def run():
+        conn.sync_members(group_name, members)
+        return size
+
+    return run
+
+
+def bench_sync_groups(server, conn, args, size):
+    """Synchronize ``size`` groups read from a groupfile, creating half
+    of them
+
+    """
+
+    server.add_group('u_bench')
+    groups = {}
+    for i in range(size):
+        group_name = 'u_bench_g{:05d}'.format(i)
+        groups[group_name] = netids(GROUP_SIZE, start=i)
+        if i % 2:
+            server.add_group(group_name, members=netids(GROUP_SIZE, start=i + 1))
+
+    fd, groupfile = tempfile.mkstemp(suffix='.json')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(groups, f)
+
+    def run():
+        try:
+            with open(groupfile) as f:
+                results = imap_concurrent(
+                    lambda item: conn.sync_members(*item),
+                    read_groupfile(f), jobs=args.jobs)
+                for _, _, err in results:
+                    if err:
+                        raise err
+        finally:
+            os.remove(groupfile)
+        return size
+
+    return run
+
+
+def bench_search_user(server, conn, args, size):
+    """Search for the groups containing each of 100 users among ``size``
+    groups
+
+    """
+
+    server.add_group('u_bench')
+    for i in range(size):
+        server.add_group('u_bench_g{:05d}'.format(i),
+                         members=netids(GROUP_SIZE, start=i))
+    users = netids(100)
+
+    def run():
+        results = imap_concurrent(conn.search_user, users, jobs=args.jobs)
+        for _, _, err in results:
+            if err:
+                raise err
+        return len(users)
+
+    return run
+
+
+BENCHMARKS = {
+    'get_members': bench_get_members,
+    'sync_members': bench_sync_members,
+    'sync_groups': bench_sync_groups,
+    'search_user': bench_search_user,
+}
+
+
+def run_case(server, certs, args, name, size):
+    """Run benchmark ``name`` at scale ``size`` args.repeat times and
+    return a dict describing the fastest run
+
+    """
+
+    best = None
+    for _ in range(args.repeat):
+        server.reset()
+        latencies = []
+        metrics = Metrics(callbacks=[
+            lambda event, elapsed=None, **kwargs:
+            latencies.append(elapsed) if event == 'request' else None])
+        conn = UWGroups(certs['client'], environment='DEV',
+                        pool_size=args.jobs, metrics=metrics,
+                        scheduler=RequestScheduler(backoff=0.05),
+                        **server.client_args())
+        with conn:
+            run = BENCHMARKS[name](server, conn, args, size)
+            # establish a connection so that a TLS handshake is not
+            # included in the timing of single-request cases
+            conn.search_groups('u_bench')
+            del latencies[:]
+            requests = server.requests
+            start = time.perf_counter()
+            items = run()
+            elapsed = time.perf_counter() - start
+            requests = server.requests - requests
+
+        if best is None or elapsed < best['seconds']:
+            latencies.sort()
+            best = {
+                'benchmark': name,
+                'size': size,
+                'seconds': round(elapsed, 4),
+                'requests': requests,
+                'items_per_s': round(items / elapsed, 1),
+                'p50_ms': round(1000 * percentile(latencies, 0.5), 2),
+                'p95_ms': round(1000 * percentile(latencies, 0.95), 2),
+                'retries': metrics.retries,
+            }
+    return best
+
+
+def print_results(results, fobj=sys.stdout):
+    columns = ['benchmark', 'size', 'seconds', 'requests', 'items_per_s',
+               'p50_ms', 'p95_ms', 'retries', 'change']
+    rows = [columns] + [[str(r.get(c, '')) for c in columns] for r in results]
+    widths = [max(len(row[i]) for row in rows) for i in range(len(columns))]
+    for row in rows:
+        print('  '.join([row[0].ljust(widths[0])] +
+                        [v.rjust(w) for v, w in zip(row[1:], widths[1:])]),
+              file=fobj)
+
+
+def compare(results, baseline, threshold):
+    """Annotate ``results`` with the relative change in time from
+    ``baseline`` and return a list of cases slower by more than
+    ``threshold``
+
+    """
+
+    previous = {(r['benchmark'], r['size']): r['seconds'] for r in baseline}
+    regressions = []
+    for result in results:
+        seconds = previous.get((result['benchmark'], result['size']))
+        if not seconds:
+            continue
+        change = result['seconds'] / seconds - 1
+        result['change'] = '{:+.0%}'.format(change)
+        if change > threshold:
+            regressions.append(result)
+    return regressions
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        'benchmarks', nargs='*', metavar='name',
+        help='benchmarks to run [all]; choose from {}'.format(
+            ', '.join(sorted(BENCHMARKS))))
+    parser.add_argument('-s', '--scale', choices=sorted(SCALES), default='quick',
+                        help='[%(default)s]')
+    parser.add_argument('--sizes', type=lambda s: [int(x) for x in s.split(',')],
+                        help='comma-delimited list of sizes overriding --scale')
+    parser.add_argument('-j', '--jobs', type=int, default=4,
+                        help='concurrent requests where applicable [%(default)s]')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='number of runs of each case [%(default)s]')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='server response delay in seconds [%(default)s]')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='fraction of requests failing with status 503 '
+                        '[%(default)s]')
+    parser.add_argument('--certs', default=os.path.join(
+        tempfile.gettempdir(), 'uwgroups-benchmark-certs'),
+        help='directory for generated certificates [%(default)s]')
+    parser.add_argument('-o', '--outfile', help='write results as json')
+    parser.add_argument('--compare', metavar='FILE',
+                        help='json output of a previous run')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='report cases slower than the baseline by more '
+                        'than this fraction [%(default)s]')
+    parser.add_argument('-v', '--verbose', action='store_true')
+
+    args = parser.parse_args(argv)
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error('unknown benchmark(s): {}'.format(', '.join(sorted(unknown))))
+    return args
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.ERROR,
+                        format='%(message)s')
+
+    certs = make_certs(args.certs)
+    names = args.benchmarks or sorted(BENCHMARKS)
+    results = []
+    with MockGWS(certs, latency=args.latency, error_rate=args.error_rate) as server:
+        for name in names:
+            for size in args.sizes or SCALES[args.scale][name]:
+                result = run_case(server, certs, args, name, size)
+                log.info(result)
+                results.append(result)
+
+    regressions = []
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+
+    print_results(results)
+
+    if args.outfile:
+        with open(args.outfile, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if regressions:
+        print('\n{} regression(s) exceeding {:.0%}'.format(
+            len(regressions), args.threshold), file=sys.stderr)
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,100 @@
+"""Measure the startup time of the uwgroups command line interface
+
+Each command is run --repeat times in a new interpreter; the median
+wall time is reported along with the overhead relative to starting an
+interpreter that does nothing, and the uwgroups modules imported. The
+exit status is 1 if the overhead of any command exceeds --budget
+milliseconds.
+
+Run from the top level of the repository::
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --budget 50 'members -h'
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+COMMANDS = ['-h', 'members -h', 'sync_groups -h', 'help create']
+
+SCRIPT = """\
+import sys
+from uwgroups.scripts.main import main
+try:
+    main(sys.argv[1:])
+except SystemExit:
+    pass
+print(' '.join(sorted(m for m in sys.modules if m.startswith('uwgroups'))),
+      file=sys.stderr)
+"""
+
+
+def timed_run(argv):
+    """Run ``argv`` and return (elapsed seconds, stderr)"""
+    start = time.perf_counter()
+    proc = subprocess.run(argv, stdout=subprocess.DEVNULL,
+                          stderr=subprocess.PIPE, text=True, check=True)
+    return time.perf_counter() - start, proc.stderr
+
+
+def median_ms(argv, repeat):
+    results = [timed_run(argv) for _ in range(repeat)]
+    return 1000 * statistics.median(t for t, _ in results), results[-1][1]
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('commands', nargs='*', metavar='command',
+                        help='arguments to uwgroups, quoted [{}]'.format(
+                            ', '.join(repr(c) for c in COMMANDS)))
+    parser.add_argument('-r', '--repeat', type=int, default=20,
+                        help='number of runs of each command [%(default)s]')
+    parser.add_argument('--budget', type=float, default=80.0, metavar='MS',
+                        help='maximum startup overhead in milliseconds '
+                        '[%(default)s]')
+    parser.add_argument('-o', '--outfile', help='write results as json')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+
+    baseline, _ = median_ms([sys.executable, '-c', 'pass'], args.repeat)
+    print('interpreter: {:.1f} ms'.format(baseline))
+
+    results = []
+    for command in args.commands or COMMANDS:
+        elapsed, stderr = median_ms(
+            [sys.executable, '-c', SCRIPT] + command.split(), args.repeat)
+        modules = stderr.strip().splitlines()[-1].split()
+        results.append({
+            'command': command,
+            'ms': round(elapsed, 1),
+            'overhead_ms': round(elapsed - baseline, 1),
+            'modules': modules,
+        })
+        print('{:<20} {:6.1f} ms (+{:.1f} ms)  {}'.format(
+            command, elapsed, elapsed - baseline,
+            ' '.join(m for m in modules if m.count('.') > 1
+                     or m == 'uwgroups.api')))
+
+    if args.outfile:
+        with open(args.outfile, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    over = [r for r in results if r['overhead_ms'] > args.budget]
+    if over:
+        print('{} command(s) exceed the budget of {:.0f} ms: {}'.format(
+            len(over), args.budget, ', '.join(r['command'] for r in over)),
+            file=sys.stderr)
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -42,7 +42,7 @@ params = {'author': 'Noah Hoffman',
           'description': 'UW Groups API',
           'url': 'https://github.com/nhoffman/uwgroups',
           'name': 'uwgroups',
-          'packages': find_packages(),
+          'packages': find_packages(exclude=['benchmarks']),
           'package_dir': {'uwgroups': 'uwgroups'},
           'entry_points': {
               'console_scripts': ['uwgroups = uwgroups.scripts.main:main']
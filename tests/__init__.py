@@ -2,6 +2,7 @@ import sys
 import logging
 import os
 from os import path
+import shutil
 import unittest
 
 from uwgroups.utils import mkdir
@@ -55,6 +56,30 @@ class TestBase(unittest.TestCase):
         mkdir(outdir, clobber)
         return outdir
 
+
+@unittest.skipUnless(shutil.which('openssl'), 'openssl is required')
+class MockGWSTestBase(TestBase):
+    """
+    Base class for tests using a local mock of the Groups Web Service
+    (``self.server``), started once per class with certificates in
+    ``self.certs``; all groups are deleted before each test.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        from benchmarks.mockgws import MockGWS, make_certs
+        cls.certs = make_certs(path.join(outputdir, 'certs'))
+        cls.server = MockGWS(cls.certs)
+        cls.server.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        super().setUp()
+        self.server.reset()
+
 class TestCaseSuppressOutput(unittest.TestCase):
 
     def setUp(self):
@@ -0,0 +1,100 @@
+"""
+Test AsyncUWGroups against a local mock of the Groups Web Service.
+"""
+
+import asyncio
+import logging
+import socket
+from unittest import mock
+
+from uwgroups.aio import AsyncUWGroups
+from uwgroups.api import APIError, MissingResourceError, User
+
+from benchmarks.mockgws import MockGWS
+
+from .__init__ import MockGWSTestBase
+log = logging.getLogger(__name__)
+
+
+class TestAsyncUWGroups(MockGWSTestBase):
+
+    def run_client(self, func, **kwargs):
+        async def main():
+            async with AsyncUWGroups(self.certs['client'], **kwargs) as conn:
+                return await func(conn)
+        return asyncio.run(main())
+
+    def test01(self):
+        self.server.add_group('u_foo', ['a', 'b'])
+
+        async def func(conn):
+            return await asyncio.gather(conn.get_members('u_foo'),
+                                        conn.group_exists('u_bar'))
+
+        members, exists = self.run_client(func, **self.server.client_args())
+        self.assertEqual(sorted(members), [User('a'), User('b')])
+        self.assertFalse(exists)
+
+    def test02(self):
+        # siblings created concurrently share the parent u_foo_bar
+        names = ['u_foo_bar_{}'.format(i) for i in range(5)]
+
+        async def func(conn):
+            await asyncio.gather(*[conn.sync_members(name, ['a', 'b'])
+                                   for name in names])
+
+        self.run_client(func, **self.server.client_args())
+        for name in names:
+            self.assertEqual(sorted(self.server.get_members(name)), ['a', 'b'])
+        self.assertIn('u_foo_bar', self.server.groups)
+
+    def test03(self):
+        async def func(conn):
+            await conn.get_members('u_foo')
+
+        with self.assertRaises(MissingResourceError):
+            self.run_client(func, **self.server.client_args())
+
+    def test04(self):
+        # a refused connection is retried, then reported as APIError
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+
+        async def func(conn):
+            await conn._request('GET', 'group/u_foo', attempts=2)
+
+        kwargs = dict(self.server.client_args(), port=port)
+        with self.assertRaises(APIError):
+            self.run_client(func, **kwargs)
+
+    def test05(self):
+        # idle connections closed by the server are replaced without
+        # counting as failed attempts
+        with MockGWS(self.certs, latency=0.05, keepalive_timeout=0.2) as server:
+            server.add_group('u_foo', ['a'])
+
+            async def func(conn):
+                await asyncio.gather(*[conn.get_members('u_foo') for _ in range(4)])
+                self.assertEqual(len(conn._idle), 4)
+                await asyncio.sleep(0.5)
+                return [await conn._request('GET', 'group/u_foo/member', attempts=1)
+                        for _ in range(4)]
+
+            self.assertEqual(len(self.run_client(func, idle_timeout=60,
+                                                 **server.client_args())), 4)
+
+    def test06(self):
+        # connections idle for longer than idle_timeout are not reused
+        async def func(conn):
+            await conn.get_members('u_foo_a')
+            await asyncio.sleep(0.2)
+            await conn.get_members('u_foo_a')
+            return conn._idle
+
+        self.server.add_group('u_foo_a')
+        with mock.patch.object(AsyncUWGroups, '_open', autospec=True,
+                               side_effect=AsyncUWGroups._open) as _open:
+            idle = self.run_client(func, idle_timeout=0.1, **self.server.client_args())
+        self.assertEqual(_open.call_count, 2)
+        self.assertEqual(len(idle), 1)
@@ -0,0 +1,373 @@
+"""
+Test UWGroups against a local mock of the Groups Web Service.
+"""
+
+import logging
+import time
+from unittest import mock
+from os import path
+
+from uwgroups import api
+from uwgroups.api import (UWGroups, User, MissingResourceError, AuthorizationError,
+                          APIError, member_changes)
+from uwgroups.index import MembershipIndex, export_index
+from uwgroups.journal import SyncJournal, members_digest
+from uwgroups.scheduler import RequestScheduler
+from uwgroups.utils import imap_concurrent
+
+from benchmarks.mockgws import MockGWS
+
+from .__init__ import TestBase, MockGWSTestBase
+log = logging.getLogger(__name__)
+
+
+class TestUser(TestBase):
+
+    def test01(self):
+        self.assertEqual(User.from_id('a'), User('a', 'uwnetid'))
+        self.assertEqual(User.from_id('u_foo').type, 'group')
+        self.assertEqual(User.from_id('host.uw.edu').type, 'dns')
+        self.assertEqual(User.from_id('a@uw.edu').type, 'eppn')
+
+    def test02(self):
+        user = User('a', 'dns')
+        self.assertEqual(user.id, 'a')
+        self.assertNotEqual(user, User('a'))
+        self.assertEqual(len({user, User('a', 'dns'), User('a')}), 2)
+        self.assertFalse(hasattr(user, '__dict__'))
+        with self.assertRaises(ValueError):
+            User('a', 'foo')
+
+    def test03(self):
+        # member ids are compared by id only
+        current = {User('a'), User('b'), User('host.uw.edu', 'uwnetid'),
+                   User('u_foo.bar', 'group')}
+        add, remove = member_changes(
+            'u_foo', current, ['b', 'c', 'host.uw.edu', 'u_foo.bar'])
+        self.assertEqual(add, ['c'])
+        self.assertEqual(remove, ['a'])
+
+    def test04(self):
+        # User objects are compared by id and type
+        current = {User('a'), User('host.uw.edu', 'uwnetid')}
+        add, remove = member_changes(
+            'u_foo', current, [User('host.uw.edu', 'dns'), User('b')])
+        self.assertEqual(add, ['b', 'host.uw.edu'])
+        self.assertEqual(remove, ['a'])
+        self.assertEqual(User.from_id('u_foo.bar').type, 'group')
+
+
+class TestUWGroups(MockGWSTestBase):
+
+    def setUp(self):
+        super().setUp()
+        self.conn = UWGroups(self.certs['client'], **self.server.client_args())
+        self.conn.connect()
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test00(self):
+        certfile = self.certs['client']
+        admins = [User('mock.client.uw.edu', 'dns'), User('mockuser')]
+        self.assertEqual(api.get_admins(certfile), admins)
+        # the same data is obtained using openssl
+        data = api._openssl_subject(certfile)
+        self.assertEqual(data['CN'], 'mock.client.uw.edu')
+        self.assertEqual(data['emailAddress'], 'mockuser@uw.edu')
+        # results are cached until the file is modified
+        with mock.patch('uwgroups.api._decode_subject') as decode:
+            self.assertEqual(api.get_admins(certfile), admins)
+            decode.assert_not_called()
+        # if the private decoder changes, openssl is used instead
+        with mock.patch('ssl._ssl._test_decode_cert', create=True,
+                        return_value={'issuer': []}):
+            self.assertIsNone(api._decode_subject(certfile))
+            api._admins_cache.clear()
+            self.assertEqual(api.get_admins(certfile), admins)
+
+    def test01(self):
+        self.server.add_group('u_foo')
+        self.conn.sync_members('u_foo_bar', ['a', 'b'])
+        self.assertEqual(sorted(self.conn.get_members('u_foo_bar')),
+                         [User('a'), User('b')])
+        self.conn.sync_members('u_foo_bar', ['b', 'c'])
+        self.assertEqual(sorted(self.server.get_members('u_foo_bar')), ['b', 'c'])
+
+    def test02(self):
+        self.assertFalse(self.conn.group_exists('u_foo'))
+        with self.assertRaises(MissingResourceError):
+            self.conn.get_members('u_foo')
+
+    def test03(self):
+        self.conn.create_group('u_foo_bar_baz')
+        self.assertEqual(self.conn.search_groups('u_foo*'),
+                         ['u_foo', 'u_foo_bar', 'u_foo_bar_baz'])
+
+    def test04(self):
+        self.server.add_group('u_foo')
+        self.server.add_group('u_foo_a')
+        names = ['u_foo_a_{}'.format(i) for i in range(5)] + ['u_foo_b_c']
+        result = self.conn.create_groups(names, jobs=4)
+        self.assertEqual(result['exists'], ['u_foo', 'u_foo_a'])
+        self.assertEqual(sorted(result['created']), sorted(names + ['u_foo_b']))
+        # existence of u_foo_b_c is not checked because u_foo_b is missing
+        self.assertEqual(self.server.requests, 3 + 5 + 7)
+
+    def test05(self):
+        for name in ['u_foo_a_1', 'u_foo_a_2', 'u_foo_b_1']:
+            self.conn.create_group(name)
+        # each group is checked only once: 6 requests to create
+        # u_foo_a_1 and its parents, 2 for u_foo_a_2, 4 for u_foo_b_1
+        self.assertEqual(self.server.requests, 12)
+        self.conn.set_affiliate('u_foo_a', 'exchange')
+        self.assertEqual(self.conn.get_group('u_foo_a')['data']['affiliates'],
+                         [{'name': 'email', 'status': 'active'}])
+
+    def test06(self):
+        outdir = self.mkoutdir()
+        self.server.add_group('u_foo')
+        self.server.add_group('u_foo_a', members=['a', 'b'])
+        self.server.add_group('u_foo_b', members=['b', 'c'])
+        self.server.add_group('u_bar_c', members=['b'])
+        filename = path.join(outdir, 'index.db')
+        failures = export_index(self.conn, ['u_foo_*'], filename, jobs=2)
+        self.assertEqual(failures, {})
+        with MembershipIndex(filename) as index:
+            self.assertEqual(index.groups(), ['u_foo_a', 'u_foo_b'])
+            self.assertEqual(index.groups_for('b'), ['u_foo_a', 'u_foo_b'])
+            self.assertEqual(index.members_of('u_foo_b'), ['b', 'c'])
+            self.assertIsNone(index.members_of('u_bar_c'))
+
+    def test07(self):
+        members = ['n{:05d}'.format(i) for i in range(5000)]
+        self.server.add_group('u_foo')
+        self.server.add_group('u_foo_a', members=members)
+        self.assertEqual([u.id for u in self.conn.iter_members('u_foo_a')], members)
+        # the connection is reused after the response is consumed
+        self.assertEqual(sorted(u.id for u in self.conn.get_members('u_foo_a')),
+                         members)
+        self.assertEqual(self.conn.pool.stats()['handshakes'], 1)
+        with self.assertRaises(MissingResourceError):
+            list(self.conn.iter_members('u_foo_b'))
+
+    def test08(self):
+        self.server.add_group('u_foo')
+        self.server.add_group('u_foo_a', members=['a', 'u_foo_b', 'u_foo_c'])
+        self.server.add_group('u_foo_b', members=['b', 'u_foo_c'])
+        self.server.add_group('u_foo_c', members=['c', 'a', 'u_foo_a'])
+        self.assertEqual(self.conn.effective_members('u_foo_a', jobs=2),
+                         [User('a'), User('b'), User('c')])
+        # each group is fetched once
+        self.assertEqual(self.server.requests, 3)
+
+    def test09(self):
+        filename = path.join(self.mkoutdir(), 'journal.ndjson')
+        self.server.add_group('u_foo')
+        self.server.add_group('u_foo_a', members=['a'])
+        members = ['b', 'c', 'd']
+        # an interrupted run in which one of two batches was applied
+        with SyncJournal(filename) as journal:
+            digest = members_digest(members)
+            journal.plan('u_foo_a', digest, self.conn.plan_members('u_foo_a', members))
+            self.conn.add_members('u_foo_a', ['b', 'c'])
+            journal.batch('u_foo_a', 'add', ['b', 'c'])
+
+        requests = self.server.requests
+        with SyncJournal(filename) as journal:
+            self.assertTrue(journal.sync_members(self.conn, 'u_foo_a', members))
+            # membership is not downloaded again: 'd' is added, 'a' removed
+            self.assertEqual(self.server.requests - requests, 2)
+            self.assertFalse(journal.sync_members(self.conn, 'u_foo_a', members))
+        self.assertEqual(sorted(self.server.get_members('u_foo_a')), members)
+
+    def test10(self):
+        self.server.add_group('u_foo')
+        for _ in range(3):
+            self.conn.search_groups('u_foo')
+            self.conn.reset()
+        # connections after the first resume its TLS session
+        self.assertEqual(self.conn.pool.stats()['handshakes'], 3)
+        self.assertEqual(self.conn.pool.stats()['resumed'], 2)
+        # the session is retained when the pool is replaced
+        self.conn.connect()
+        self.conn.search_groups('u_foo')
+        self.assertEqual(self.conn.pool.stats()['resumed'], 1)
+
+    def test11(self):
+        self.server.add_group('u_foo')
+        self.server.add_group('u_foo_a', affiliates={'email': 'active'})
+        result = self.conn.create_groups(['u_foo_a', 'u_foo_b'],
+                                         group_admins={'u_foo_b': ['prof']})
+        self.assertEqual(result['created'], ['u_foo_b'])
+        self.assertIn({'id': 'prof', 'type': 'uwnetid'},
+                      self.conn.get_group('u_foo_b')['data']['admins'])
+
+        self.assertEqual(self.conn.get_affiliates('u_foo_a'),
+                         {'exchange': True, 'google': False})
+        requests = self.server.requests
+        # only affiliates that differ are set
+        self.assertEqual(self.conn.sync_affiliates(
+            'u_foo_a', {'exchange': True, 'google': True}), ['google'])
+        self.assertEqual(self.server.requests - requests, 1)
+        self.assertEqual(self.conn.get_affiliates('u_foo_a'),
+                         {'exchange': True, 'google': True})
+
+    def test12(self):
+        for name in ['u_foo', 'u_foo_a', 'u_foo_a_1', 'u_foo_a_2', 'u_foo_b',
+                     'u_foo_b_1_x', 'u_foobar']:
+            self.server.add_group(name)
+        result = self.conn.delete_tree('u_foo_a', dry_run=True)
+        self.assertEqual(result['levels'], [['u_foo_a_1', 'u_foo_a_2'], ['u_foo_a']])
+        self.assertEqual(result['deleted'], [])
+
+        result = self.conn.delete_tree('u_foo', jobs=3)
+        self.assertEqual(result['levels'],
+                         [['u_foo_b_1_x'], ['u_foo_a_1', 'u_foo_a_2'],
+                          ['u_foo_a', 'u_foo_b'], ['u_foo']])
+        self.assertEqual(len(result['deleted']), 6)
+        self.assertEqual(self.conn.search_groups('u_foo*'), ['u_foobar'])
+
+    def test13(self):
+        for name in ['u_foo', 'u_foo_a', 'u_foo_a_1', 'u_foo_b']:
+            self.server.add_group(name)
+        delete_group = self.conn.delete_group
+
+        def fail_a_1(group_name):
+            if group_name == 'u_foo_a_1':
+                raise AuthorizationError(group_name)
+            return delete_group(group_name)
+
+        with mock.patch.object(self.conn, 'delete_group', side_effect=fail_a_1):
+            result = self.conn.delete_tree('u_foo', jobs=2)
+        self.assertEqual(list(result['failed']), ['u_foo_a_1'])
+        self.assertEqual(result['skipped'], ['u_foo_a', 'u_foo'])
+        self.assertEqual(result['deleted'], ['u_foo_b'])
+
+    def test14(self):
+        # 503 responses are retried up to the limit of attempts
+        self.server.add_group('u_foo')
+        scheduler = RequestScheduler(attempts=3, backoff=0.01)
+        with UWGroups(self.certs['client'], scheduler=scheduler,
+                      **self.server.client_args()) as conn:
+            self.server.fail(503, count=2)
+            self.assertEqual(conn.get_group('u_foo')['data']['id'], 'u_foo')
+            self.assertEqual(scheduler.retries, 2)
+
+            self.server.fail(503, count=3)
+            with self.assertRaises(APIError):
+                conn.get_members('u_foo')
+            self.assertEqual(scheduler.retries, 4)
+
+    def test15(self):
+        # a 429 response is retried after the interval in Retry-After
+        self.server.add_group('u_foo', ['a'])
+        scheduler = RequestScheduler(backoff=0.01, max_backoff=1)
+        with UWGroups(self.certs['client'], scheduler=scheduler,
+                      **self.server.client_args()) as conn:
+            self.server.fail(429, retry_after=0.3)
+            started = time.monotonic()
+            self.assertEqual(conn.get_members('u_foo'), [User('a')])
+            self.assertGreaterEqual(time.monotonic() - started, 0.3)
+            self.assertEqual(scheduler.retries, 1)
+
+    def test16(self):
+        self.server.add_group('u_foo')
+        self.server.add_group('u_foo_a', ['a', 'b'])
+        plans = [self.conn.plan_members('u_foo_a', ['b', 'c']),
+                 self.conn.plan_members('u_foo_b', ['x'])]
+        self.assertEqual(plans, [
+            {'group': 'u_foo_a', 'create': False, 'add': ['c'], 'remove': ['a']},
+            {'group': 'u_foo_b', 'create': True, 'add': ['x'], 'remove': []},
+        ])
+        # planning does not modify groups
+        self.assertNotIn('u_foo_b', self.server.groups)
+
+        for plan in plans:
+            self.conn.apply_plan(plan, dry_run=True)
+        self.assertNotIn('u_foo_b', self.server.groups)
+
+        for plan in plans:
+            self.conn.apply_plan(plan)
+        self.assertEqual(sorted(self.server.get_members('u_foo_a')), ['b', 'c'])
+        self.assertEqual(self.server.get_members('u_foo_b'), ['x'])
+        self.assertEqual(self.conn.plan_members('u_foo_b', ['x']),
+                         {'group': 'u_foo_b', 'create': False, 'add': [], 'remove': []})
+
+    def test17(self):
+        # idle connections closed by the server are replaced without
+        # counting as failed attempts
+        scheduler = RequestScheduler(attempts=2)
+        with MockGWS(self.certs, latency=0.05, keepalive_timeout=0.2) as server, \
+                UWGroups(self.certs['client'], scheduler=scheduler, idle_timeout=60,
+                         **server.client_args()) as conn:
+            server.add_group('u_foo', ['a'])
+            list(imap_concurrent(conn.get_members, ['u_foo'] * 4, jobs=4))
+            self.assertEqual(conn.pool.stats()['idle'], 4)
+            time.sleep(0.5)
+            for _ in range(4):
+                self.assertEqual(conn.get_members('u_foo'), [User('a')])
+            self.assertEqual(scheduler.retries, 0)
+
+    def test18(self):
+        # a group that can't be checked fails without stopping the others
+        self.server.add_group('u_foo')
+        group_exists = self.conn.group_exists
+
+        def fail_a(group_name):
+            if group_name == 'u_foo_a':
+                raise AuthorizationError(group_name)
+            return group_exists(group_name)
+
+        with mock.patch.object(self.conn, 'group_exists', side_effect=fail_a):
+            result = self.conn.create_groups(['u_foo_a_1', 'u_foo_b'], jobs=2)
+        self.assertEqual(list(result['failed']), ['u_foo_a'])
+        self.assertEqual(result['skipped'], ['u_foo_a_1'])
+        self.assertEqual(result['created'], ['u_foo_b'])
+        self.assertNotIn('u_foo_a', self.server.groups)
+
+
+class TestDiffMembers(MockGWSTestBase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.other_server = MockGWS(cls.certs)
+        cls.other_server.start()
+        cls.servers = [cls.server, cls.other_server]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.other_server.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        self.other_server.reset()
+
+    def test01(self):
+        prod, evaluation = self.servers
+        prod.add_group('u_foo_a', ['a', 'b'])
+        prod.add_group('u_foo_b', ['a'])
+        prod.add_group('u_foo_c', ['c'])
+        evaluation.add_group('u_foo_a', ['b', 'c'])
+        evaluation.add_group('u_foo_b', ['a'])
+        evaluation.add_group('u_foo_d', ['d'])
+
+        conn, other = [UWGroups(self.certs['client'], **server.client_args())
+                       for server in self.servers]
+        with conn, other:
+            names = ['u_foo_a', 'u_foo_b', 'u_foo_c', 'u_foo_d']
+            for jobs in [1, 3]:
+                results = {group_name: record for group_name, record, err
+                           in api.diff_members(conn, other, names, jobs=jobs)}
+                self.assertEqual(results, {
+                    'u_foo_a': {'group': 'u_foo_a', 'create': False, 'missing': False,
+                                'add': ['c'], 'remove': ['a']},
+                    'u_foo_b': {'group': 'u_foo_b', 'create': False, 'missing': False,
+                                'add': [], 'remove': []},
+                    'u_foo_c': {'group': 'u_foo_c', 'create': False, 'missing': True,
+                                'add': [], 'remove': ['c']},
+                    'u_foo_d': {'group': 'u_foo_d', 'create': True, 'missing': False,
+                                'add': ['d'], 'remove': []},
+                })
@@ -0,0 +1,114 @@
+"""
+Test cache module.
+"""
+
+import logging
+import os
+import stat
+from os import path
+
+from uwgroups.api import UWGroups, User
+from uwgroups.cache import MembershipCache, GroupCache
+
+from .__init__ import TestBase, MockGWSTestBase
+log = logging.getLogger(__name__)
+
+
+class TestMembershipCache(TestBase):
+    def setUp(self):
+        self.outdir = self.mkoutdir()
+        self.cache = MembershipCache(path.join(self.outdir, 'members.db'))
+
+    def tearDown(self):
+        self.cache.close()
+
+    def test01(self):
+        members = [('a', 'uwnetid'), ('b.uw.edu', 'dns')]
+        self.cache.put('PROD', 'u_a', members, etag='"1"')
+        entry = self.cache.get('PROD', 'u_a')
+        self.assertEqual(entry.members, members)
+        self.assertEqual(entry.etag, '"1"')
+        self.assertIsNone(self.cache.get('EVAL', 'u_a'))
+
+    def test02(self):
+        self.cache.put('PROD', 'u_a', [('a', 'uwnetid')])
+        self.cache.ttl = -1
+        self.assertIsNone(self.cache.get('PROD', 'u_a'))
+
+    def test03(self):
+        self.cache.max_size = 10
+        self.cache.put('PROD', 'u_a', [('a', 'uwnetid')])
+        self.cache.put('PROD', 'u_b', [('b', 'uwnetid')])
+        self.assertIsNone(self.cache.get('PROD', 'u_a'))
+        self.assertIsNotNone(self.cache.get('PROD', 'u_b'))
+
+    def test04(self):
+        self.cache.put('PROD', 'u_a', [('a', 'uwnetid')])
+        self.cache.invalidate('PROD', 'u_a')
+        self.assertIsNone(self.cache.get('PROD', 'u_a'))
+
+    def test05(self):
+        # the database and its directory are accessible only by the owner
+        filename = path.join(self.outdir, 'cache', 'members.db')
+        MembershipCache(filename).close()
+        self.assertEqual(stat.S_IMODE(os.stat(filename).st_mode), 0o600)
+        self.assertEqual(stat.S_IMODE(os.stat(path.dirname(filename)).st_mode), 0o700)
+
+
+class TestMembershipCacheAPI(MockGWSTestBase):
+
+    def test01(self):
+        self.server.add_group('u_foo', ['a', 'b'])
+        cache = MembershipCache(path.join(self.mkoutdir(), 'members.db'))
+        with UWGroups(self.certs['client'], member_cache=cache,
+                      **self.server.client_args()) as conn:
+            members = conn.get_members('u_foo')
+            self.assertEqual(cache.hits, 0)
+
+            # revalidated using a conditional request (304 Not Modified)
+            requests = self.server.requests
+            self.assertEqual(conn.get_members('u_foo'), members)
+            self.assertEqual(cache.hits, 1)
+            self.assertEqual(self.server.requests, requests + 1)
+
+            # modifying the group invalidates the entry
+            conn.add_members('u_foo', ['c'])
+            self.assertIsNone(cache.get(conn.environment, 'u_foo'))
+            self.assertEqual(sorted(conn.get_members('u_foo')),
+                             [User('a'), User('b'), User('c')])
+            self.assertEqual(cache.hits, 1)
+        cache.close()
+
+
+class TestGroupCache(TestBase):
+    def test01(self):
+        cache = GroupCache()
+        self.assertEqual(cache.get('u_a'), (False, None))
+        cache.put('u_a', {'data': {'id': 'u_a'}})
+        cache.put('u_b', None)
+        self.assertEqual(cache.get('u_a'), (True, {'data': {'id': 'u_a'}}))
+        self.assertEqual(cache.get('u_b'), (True, None))
+        self.assertEqual(cache.stats(), {'hits': 2, 'misses': 1, 'entries': 2})
+
+    def test02(self):
+        cache = GroupCache(maxsize=2)
+        cache.put('u_a', {})
+        cache.put('u_b', {})
+        cache.get('u_a')
+        cache.put('u_c', {})
+        self.assertFalse(cache.get('u_b')[0])
+        self.assertTrue(cache.get('u_a')[0])
+
+    def test03(self):
+        cache = GroupCache(ttl=0)
+        cache.put('u_a', {})
+        self.assertFalse(cache.get('u_a')[0])
+
+    def test04(self):
+        cache = GroupCache()
+        cache.put_exists('u_a')
+        cache.put('u_b', None)
+        self.assertTrue(cache.exists('u_a'))
+        self.assertFalse(cache.get('u_a')[0])
+        self.assertFalse(cache.exists('u_b'))
+        self.assertIsNone(cache.exists('u_c'))
@@ -0,0 +1,65 @@
+"""
+Test the daemon module against a local mock of the Groups Web Service.
+"""
+
+import logging
+import threading
+from unittest import mock
+from os import path
+
+from uwgroups.api import UWGroups, User, MissingResourceError
+from uwgroups.daemon import Daemon, DaemonClient
+
+from .__init__ import MockGWSTestBase
+log = logging.getLogger(__name__)
+
+
+class TestDaemon(MockGWSTestBase):
+
+    def setUp(self):
+        super().setUp()
+        self.conn = UWGroups(self.certs['client'], environment='DEV',
+                             **self.server.client_args())
+        self.conn.connect()
+        self.filename = path.join(self.mkoutdir(), 'daemon.sock')
+        self.daemon = Daemon(self.conn, self.filename)
+        self.thread = threading.Thread(target=self.daemon.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.daemon.shutdown()
+        self.thread.join()
+        self.daemon.server_close()
+        self.conn.close()
+
+    def test01(self):
+        self.server.add_group('u_foo')
+        self.server.add_group('u_foo_a', members=['a', 'b.uw.edu'])
+        with DaemonClient(self.filename) as client:
+            self.assertEqual(client.environment, 'DEV')
+            self.assertEqual(client.get_members('u_foo_a'),
+                             [User('a'), User('b.uw.edu', 'dns')])
+            client.add_members('u_foo_a', ['c'])
+            self.assertEqual(client.search_user('c'), ['u_foo_a'])
+            with self.assertRaises(MissingResourceError):
+                client.get_members('u_foo_b')
+            with self.assertRaises(ValueError):
+                client.call('close')
+        # all requests used a single connection to the API
+        self.assertEqual(self.conn.pool.stats()['handshakes'], 1)
+
+    def test02(self):
+        self.assertTrue(DaemonClient.available(self.filename))
+        with self.assertRaises(OSError):
+            Daemon(self.conn, self.filename)
+        self.assertFalse(DaemonClient.available(self.filename + '.x'))
+
+    def test03(self):
+        # the server is not used with different credentials
+        from uwgroups import daemon
+        with mock.patch.object(daemon, 'socket_path', return_value=self.filename):
+            client = daemon.daemon_client('DEV', self.certs['client'])
+            self.assertEqual(client.timeout, daemon.CLIENT_TIMEOUT)
+            client.close()
+            self.assertIsNone(daemon.daemon_client('DEV', self.certs['server']))
+            self.assertIsNone(daemon.daemon_client('PROD'))
@@ -0,0 +1,66 @@
+"""
+Test journal module.
+"""
+
+import logging
+from os import path
+from unittest import mock
+
+from uwgroups.api import AuthorizationError
+from uwgroups.journal import SyncJournal, members_digest
+
+from .__init__ import TestBase
+log = logging.getLogger(__name__)
+
+
+class TestSyncJournal(TestBase):
+    def setUp(self):
+        self.outdir = self.mkoutdir()
+        self.filename = path.join(self.outdir, 'journal.ndjson')
+
+    def test01(self):
+        digest = members_digest(['a', 'b'])
+        self.assertEqual(digest, members_digest(['b', 'a', 'a']))
+        plan = {'group': 'u_a', 'create': True, 'add': ['a', 'b', 'c'], 'remove': []}
+        with SyncJournal(self.filename) as journal:
+            journal.plan('u_a', digest, plan)
+            journal.batch('u_a', 'add', ['a', 'b'])
+
+        with SyncJournal(self.filename) as journal:
+            self.assertFalse(journal.is_done('u_a', digest))
+            self.assertIsNone(journal.pending_plan('u_a', members_digest(['a'])))
+            self.assertEqual(journal.pending_plan('u_a', digest),
+                             dict(plan, create=False, add=['c']))
+            journal.finish('u_a', digest)
+
+        with SyncJournal(self.filename) as journal:
+            self.assertTrue(journal.is_done('u_a', digest))
+            self.assertIsNone(journal.pending_plan('u_a', digest))
+
+    def test02(self):
+        digest = members_digest(['a'])
+        with SyncJournal(self.filename) as journal:
+            journal.finish('u_a', digest)
+        # simulate a record interrupted while being written
+        with open(self.filename, 'a') as f:
+            f.write('{"event": "done", "gro')
+
+        with SyncJournal(self.filename) as journal:
+            self.assertTrue(journal.is_done('u_a', digest))
+            journal.finish('u_b', digest)
+
+        with SyncJournal(self.filename) as journal:
+            self.assertTrue(journal.is_done('u_b', digest))
+
+    def test03(self):
+        # a failure to compute the plan is recorded
+        conn = mock.Mock()
+        conn.plan_members.side_effect = AuthorizationError('GET u_a: 401')
+        with SyncJournal(self.filename) as journal:
+            with self.assertRaises(AuthorizationError):
+                journal.sync_members(conn, 'u_a', ['a'])
+        conn.apply_plan.assert_not_called()
+
+        with SyncJournal(self.filename) as journal:
+            self.assertIn('AuthorizationError', journal.failed['u_a'])
+            self.assertIsNone(journal.pending_plan('u_a', members_digest(['a'])))
@@ -0,0 +1,50 @@
+"""
+Test metrics module.
+"""
+
+import io
+import logging
+
+from uwgroups.metrics import Metrics, Histogram, endpoint_template
+
+from .__init__ import TestBase
+log = logging.getLogger(__name__)
+
+
+class TestEndpointTemplate(TestBase):
+    def test01(self):
+        self.assertEqual(endpoint_template('group/u_foo/member/a,b'),
+                         ('group/{group}/member/{ids}', 'u_foo'))
+        self.assertEqual(endpoint_template('group/u_foo'),
+                         ('group/{group}', 'u_foo'))
+
+    def test02(self):
+        self.assertEqual(endpoint_template('search?member=netid'),
+                         ('search?member', None))
+        self.assertEqual(
+            endpoint_template('group/u_foo/affiliate/email?status=active'),
+            ('group/{group}/affiliate/email?status', 'u_foo'))
+
+
+class TestHistogram(TestBase):
+    def test01(self):
+        hist = Histogram(buckets=(1, 2, 3, float('inf')))
+        for value in [0.5, 0.5, 1.5, 2.5]:
+            hist.add(value)
+        self.assertEqual(hist.quantile(0.5), 1)
+        self.assertEqual(hist.quantile(1), 2.5)
+
+
+class TestMetrics(TestBase):
+    def test01(self):
+        events = []
+        metrics = Metrics(callbacks=[lambda **kwargs: events.append(kwargs)])
+        metrics.request('GET', 'group/u_foo', 0.1, status=200, received=10)
+        metrics.request('GET', 'group/u_bar', 0.2, status=404)
+        rows = metrics.summary()
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['requests'], 2)
+        self.assertEqual(rows[0]['errors'], 1)
+        self.assertEqual(metrics.errors['HTTP 404'], 1)
+        self.assertEqual([e['group'] for e in events], ['u_foo', 'u_bar'])
+        metrics.report(io.StringIO())
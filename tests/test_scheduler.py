@@ -0,0 +1,49 @@
+"""
+Test scheduler module.
+"""
+
+import logging
+import time
+import email.utils
+
+from uwgroups.scheduler import RequestScheduler, parse_retry_after
+
+from .__init__ import TestBase
+log = logging.getLogger(__name__)
+
+
+class TestParseRetryAfter(TestBase):
+    def test01(self):
+        self.assertEqual(parse_retry_after('120'), 120)
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after('soon'))
+
+    def test02(self):
+        value = email.utils.formatdate(time.time() + 60, usegmt=True)
+        self.assertAlmostEqual(parse_retry_after(value), 60, delta=2)
+
+
+class TestRequestScheduler(TestBase):
+    def test01(self):
+        scheduler = RequestScheduler(rate=10, burst=2)
+        delays = [scheduler._delay() for i in range(4)]
+        self.assertEqual(delays[:2], [0, 0])
+        self.assertAlmostEqual(delays[2], 0.1, places=2)
+        self.assertAlmostEqual(delays[3], 0.2, places=2)
+
+    def test02(self):
+        scheduler = RequestScheduler()
+        self.assertTrue(scheduler.retryable(503))
+        self.assertTrue(scheduler.retryable(429))
+        self.assertFalse(scheduler.retryable(404))
+
+    def test03(self):
+        self.assertRaises(ValueError, RequestScheduler, attempts=0)
+
+    def test04(self):
+        # Retry-After is honored but limited to max_backoff
+        scheduler = RequestScheduler(max_backoff=0.05)
+        started = time.monotonic()
+        scheduler.wait(0, retry_after='3600')
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(scheduler.retries, 1)
@@ -2,10 +2,22 @@
 Test subcommands.
 """
 
+import io
+import json
 import logging
+import subprocess
+import sys
+from os import path
+from unittest import mock
 
+from uwgroups import subcommands
+from uwgroups.api import UWGroups
+from uwgroups.scheduler import RequestScheduler
 from uwgroups.scripts.main import main
-from .__init__ import TestCaseSuppressOutput, TestBase
+from uwgroups.subcommands import HELP_INDEX, itermodules
+from uwgroups.subcommands.apply import read_plan
+
+from .__init__ import TestCaseSuppressOutput, TestBase, MockGWSTestBase
 
 log = logging.getLogger(__name__)
 
@@ -17,3 +29,121 @@ class TestTemplate(TestCaseSuppressOutput, TestBase):
 
     def testExit02(self):
         self.assertRaises(SystemExit, main, ['-h'])
+
+    def testExit03(self):
+        for args in [['--rate', '0'], ['--rate', '-1'], ['--max-concurrency', '0'],
+                     ['--attempts', '0']]:
+            self.assertRaises(SystemExit, main, args + ['members', 'u_foo'])
+
+
+class TestHelpIndex(TestBase):
+
+    def test01(self):
+        # HELP_INDEX contains the first line of the docstring of each module
+        modules = dict(itermodules(subcommands.__path__[0]))
+        self.assertEqual(sorted(HELP_INDEX), sorted(modules))
+        for name, mod in modules.items():
+            self.assertEqual(HELP_INDEX[name], mod.__doc__.lstrip().split('\n', 1)[0])
+
+    def test02(self):
+        # only the selected subcommand is imported
+        script = ('import sys; from uwgroups.scripts.main import parse_arguments; '
+                  'parse_arguments(["-e", "DEV", "members", "u_foo"]); '
+                  'print(" ".join(sorted(sys.modules)))')
+        output = subprocess.run([sys.executable, '-c', script], capture_output=True,
+                                text=True, check=True).stdout.split()
+        self.assertIn('uwgroups.subcommands.members', output)
+        self.assertNotIn('uwgroups.subcommands.get', output)
+        self.assertNotIn('uwgroups.api', output)
+
+
+class TestMockCommands(MockGWSTestBase, TestCaseSuppressOutput):
+    """Run subcommands against a local mock of the Groups Web Service"""
+
+    def get_client(self, args, daemon=False, **kwargs):
+        scheduler = RequestScheduler(attempts=args.attempts)
+        return UWGroups(self.certs['client'], environment=args.environment,
+                        scheduler=scheduler, **self.server.client_args(), **kwargs)
+
+    def patch_client(self, *modules):
+        patches = [mock.patch('uwgroups.subcommands.{}.get_client'.format(name),
+                              self.get_client) for name in modules]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test01(self):
+        # plan, then apply
+        self.patch_client('plan', 'apply')
+        self.server.add_group('u_foo')
+        self.server.add_group('u_foo_a', ['a', 'b'])
+        outdir = self.mkoutdir()
+        groupfile = path.join(outdir, 'groups.json')
+        planfile = path.join(outdir, 'plan.jsonl')
+        with open(groupfile, 'w') as f:
+            json.dump({'u_foo_a': ['b', 'c'], 'u_foo_b': ['x'], 'u_foo': []}, f)
+
+        main(['-e', 'EVAL', 'plan', groupfile, '-o', planfile, '--no-cache'])
+        with open(planfile) as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual(records, [
+            {'environment': 'EVAL'},
+            {'group': 'u_foo_a', 'create': False, 'add': ['c'], 'remove': ['a']},
+            {'group': 'u_foo_b', 'create': True, 'add': ['x'], 'remove': []},
+        ])
+
+        main(['-e', 'EVAL', 'apply', planfile, '-j', '2'])
+        self.assertEqual(sorted(self.server.get_members('u_foo_a')), ['b', 'c'])
+        self.assertEqual(self.server.get_members('u_foo_b'), ['x'])
+
+    def test02(self):
+        # a plan computed for another environment is rejected
+        text = '{"environment": "EVAL"}\n{"group": "u_foo", "add": ["a"]}\n'
+        self.assertEqual(list(read_plan(io.StringIO(text), 'EVAL')),
+                         [{'group': 'u_foo', 'add': ['a']}])
+        with self.assertRaises(SystemExit):
+            list(read_plan(io.StringIO(text), 'PROD'))
+        # the header is required
+        with self.assertRaises(SystemExit):
+            list(read_plan(io.StringIO(text.split('\n', 1)[1]), 'EVAL'))
+
+        self.patch_client('apply')
+        self.server.add_group('u_foo')
+        planfile = path.join(self.mkoutdir(), 'plan.jsonl')
+        with open(planfile, 'w') as f:
+            f.write(text)
+        with self.assertRaises(SystemExit):
+            main(['-e', 'PROD', 'apply', planfile])
+        self.assertEqual(self.server.get_members('u_foo'), [])
+
+    def test03(self):
+        # netids read from stdin; a failed search is reported in its own line
+        self.patch_client('search_user')
+        self.server.add_group('u_foo', ['a', 'b'])
+        self.server.add_group('u_bar', ['a'])
+        self.server.fail(503)
+        stdin = io.StringIO('a\nb\n\nc\n')
+        with mock.patch('sys.stdin', stdin), \
+                mock.patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            status = main(['--attempts', '1', 'search_user', '-f', '-', '-j', '2'])
+        lines = sorted(line.split('\t') for line in stdout.getvalue().splitlines())
+        self.assertEqual(status, 1)
+        self.assertEqual([line[0] for line in lines], ['a', 'b', 'c'])
+        failed = [line for line in lines if len(line) == 3]
+        self.assertEqual(len(failed), 1)
+        self.assertEqual(failed[0][1], '')
+        self.assertIn('503', failed[0][2])
+        results = {netid: sorted(groups.split(',')) if groups else []
+                   for netid, groups in (line for line in lines if len(line) == 2)}
+        expected = {'a': ['u_bar', 'u_foo'], 'b': ['u_foo'], 'c': []}
+        self.assertEqual(results, {netid: expected[netid] for netid in results})
+
+    def test04(self):
+        # --dry-run requires --recursive and deletes nothing
+        self.patch_client('delete')
+        self.server.add_group('u_foo_a')
+        with self.assertRaises(SystemExit):
+            main(['delete', '-n', 'u_foo_a'])
+        self.assertIn('u_foo_a', self.server.groups)
+        main(['delete', '-r', '-n', 'u_foo_a'])
+        self.assertIn('u_foo_a', self.server.groups)
@@ -2,9 +2,14 @@
 Test utils module.
 """
 
+import io
+import json
 import logging
 
-from uwgroups.utils import reconcile, grouper
+from uwgroups.utils import (reconcile, grouper, parents, hierarchy_levels,
+                            imap_concurrent, iter_json_object, iter_json_array,
+                            read_groupfile, read_manifest, pack_count,
+                            AdaptiveBatchSize)
 
 from .__init__ import TestBase
 log = logging.getLogger(__name__)
@@ -65,3 +70,148 @@ class TestGrouper(TestBase):
         items = list(range(10))
         chunks = list(grouper(items, 4, fill=True))
         self.assertEqual(chunks[-1], (8, 9, None, None))
+
+
+class TestParents(TestBase):
+    def test01(self):
+        self.assertEqual(parents('u_ngh2'), [])
+
+    def test02(self):
+        self.assertEqual(parents('u_ngh2_foo_bar'), ['u_ngh2', 'u_ngh2_foo'])
+
+
+class TestHierarchyLevels(TestBase):
+    def test01(self):
+        self.assertEqual(hierarchy_levels(['u_a_b_c', 'u_a_d', 'u_a_b']),
+                         [['u_a'], ['u_a_b', 'u_a_d'], ['u_a_b_c']])
+
+    def test02(self):
+        self.assertEqual(hierarchy_levels(['u_a', 'u_b_c']),
+                         [['u_a', 'u_b'], ['u_b_c']])
+
+
+class TestImapConcurrent(TestBase):
+    def test01(self):
+        results = list(imap_concurrent(lambda x: x * 2, range(10), jobs=1))
+        self.assertEqual(results, [(x, x * 2, None) for x in range(10)])
+
+    def test02(self):
+        results = imap_concurrent(lambda x: x * 2, range(100), jobs=4)
+        self.assertEqual(sorted(results), [(x, x * 2, None) for x in range(100)])
+
+    def test03(self):
+        def func(x):
+            if x == 3:
+                raise ValueError(x)
+            return x
+
+        for jobs in [1, 4]:
+            errors = [(item, type(err))
+                      for item, _, err in imap_concurrent(func, range(10), jobs=jobs)
+                      if err]
+            self.assertEqual(errors, [(3, ValueError)])
+
+
+class TestIterJsonObject(TestBase):
+    data = {'u_a': ['a', 'b'], 'u_b': [], 'n': 12345, 'o': {'k': ['}', 1.5]}}
+
+    def test01(self):
+        text = json.dumps(self.data, indent=2)
+        for chunksize in [1, 3, 10, 2 ** 16]:
+            items = iter_json_object(io.StringIO(text), chunksize=chunksize)
+            self.assertEqual(dict(items), self.data)
+
+    def test02(self):
+        self.assertEqual(list(iter_json_object(io.StringIO(' {} '))), [])
+
+    def test03(self):
+        items = iter_json_object(io.StringIO('{"u_a": ["a", "b"'), chunksize=4)
+        self.assertRaises(ValueError, list, items)
+
+    def test04(self):
+        # numbers split across chunks, including within a fraction or exponent
+        text = '{"a": 0.5, "b": [1, -2.5e+10, 3E-2, 10], "c": -7}'
+        for chunksize in range(1, 12):
+            items = iter_json_object(io.StringIO(text), chunksize=chunksize)
+            self.assertEqual(dict(items), json.loads(text))
+
+
+class TestIterJsonArray(TestBase):
+    def test01(self):
+        data = {'meta': {'data': [0]}, 'data': [{'id': 'caf\u00e9'}, {'id': 'b'}],
+                'n': 1}
+        text = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        for chunksize in [1, 3, 2 ** 16]:
+            items = iter_json_array(io.BytesIO(text), 'data', chunksize=chunksize)
+            self.assertEqual(list(items), data['data'])
+
+    def test02(self):
+        text = '{"data": [1, -2.5e10, 0.125]}'
+        for chunksize in [1, 3, 4]:
+            items = iter_json_array(io.StringIO(text), 'data', chunksize=chunksize)
+            self.assertEqual(list(items), [1, -2.5e10, 0.125])
+
+    def test03(self):
+        self.assertEqual(list(iter_json_array(io.StringIO('{"data": []}'), 'data')), [])
+        self.assertEqual(list(iter_json_array(io.StringIO('{}'), 'data')), [])
+
+
+class TestReadGroupfile(TestBase):
+    def test01(self):
+        text = '{"u_a": ["a", "b"], "u_b": []}'
+        groups = list(read_groupfile(io.StringIO(text)))
+        self.assertEqual(groups, [('u_a', ['a', 'b']), ('u_b', [])])
+
+    def test02(self):
+        text = '{"group": "u_a", "members": ["a", "b"]}\n\n' \
+            '{"group": "u_b", "members": []}\n'
+        groups = list(read_groupfile(io.StringIO(text), fmt='ndjson'))
+        self.assertEqual(groups, [('u_a', ['a', 'b']), ('u_b', [])])
+
+
+class TestPackCount(TestBase):
+    def test01(self):
+        self.assertEqual(pack_count([], 10), 0)
+
+    def test02(self):
+        # 'aaa,bbb' fits in 7 characters; 'aaa,bbb,ccc' does not
+        self.assertEqual(pack_count(['aaa', 'bbb', 'ccc'], 7), 2)
+        self.assertEqual(pack_count(['aaa', 'bbb', 'ccc'], 7, max_items=1), 1)
+
+    def test03(self):
+        self.assertEqual(pack_count(['aaaaaaaaaa', 'b'], 5), 1)
+
+
+class TestAdaptiveBatchSize(TestBase):
+    def test01(self):
+        sizer = AdaptiveBatchSize(initial=10, maximum=20)
+        sizer.success(10, 0.1)
+        self.assertEqual(sizer.size, 15)
+        sizer.success(15, 0.1)
+        self.assertEqual(sizer.size, 20)
+
+    def test02(self):
+        sizer = AdaptiveBatchSize(initial=100, target_latency=1.0)
+        sizer.success(100, 4.0)
+        self.assertEqual(sizer.size, 25)
+        sizer.failure(25)
+        self.assertEqual(sizer.size, 12)
+        self.assertEqual(sizer.stats()['batches'], 1)
+
+
+class TestReadManifest(TestBase):
+
+    def test01(self):
+        text = '{"u_a": {"admins": ["x"], "google": true}, "u_b": {}}'
+        self.assertEqual(list(read_manifest(io.StringIO(text))),
+                         [('u_a', {'admins': ['x'], 'google': True}), ('u_b', {})])
+
+    def test02(self):
+        text = '{"group": "u_a", "exchange": false}\n\n{"group": "u_b"}\n'
+        self.assertEqual(list(read_manifest(io.StringIO(text), 'ndjson')),
+                         [('u_a', {'exchange': False}), ('u_b', {})])
+
+    def test03(self):
+        for text in ['{"u_a": {"exchange": "yes"}}', '{"u_a": {"owner": "x"}}']:
+            with self.assertRaises(ValueError):
+                list(read_manifest(io.StringIO(text)))
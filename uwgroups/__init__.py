@@ -8,14 +8,22 @@ DEV: dev.groups.uw.edu
 EVAL: eval.groups.uw.edu
 """
 
-import glob
 from os import path
 
 _data = path.join(path.dirname(__file__), 'data')
 
 
+# https://groups.uw.edu/group_sws/v3
+GWS_HOSTS = {
+    'PROD': 'groups.uw.edu',
+    'DEV': 'dev.groups.uw.edu',
+    'EVAL': 'eval.groups.uw.edu',
+}
+
 cert_var_name = 'UWGROUPS_CERT'
 key_var_name = 'UWGROUPS_KEY'
+cache_var_name = 'UWGROUPS_CACHE'
+socket_var_name = 'UWGROUPS_SOCKET'
 
 
 def package_data(fname, pattern=None):
@@ -27,6 +35,7 @@ def package_data(fname, pattern=None):
     """
 
     if pattern:
+        import glob
         return glob.glob(path.join(_data, pattern))
 
     pth = path.join(_data, fname)
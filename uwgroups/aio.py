@@ -0,0 +1,390 @@
+"""Asyncio client for the UW groups REST API.
+
+``AsyncUWGroups`` provides coroutine versions of the most commonly
+used ``UWGroups`` methods so that many requests can be in flight at
+once from a single event loop. Only the standard library is used: a
+minimal HTTP/1.1 client is implemented over ``asyncio`` streams,
+with a pool of keep-alive connections bounded by ``max_connections``.
+
+Example::
+
+    async with AsyncUWGroups(certfile='/path/to/cert.pem') as conn:
+        results = await asyncio.gather(
+            *[conn.get_members(name) for name in group_names])
+
+"""
+
+import asyncio
+import json
+import logging
+import time
+from collections import defaultdict
+from os import path
+
+from uwgroups.api import (GWS_HOSTS, GWS_PORT, API_PATH, APIError,
+                          MissingResourceError, AuthorizationError,
+                          User, get_admins, ssl_context, group_definition,
+                          member_changes)
+from uwgroups.utils import grouper, check_types, parents
+
+log = logging.getLogger(__name__)
+
+
+class _Response(object):
+    def __init__(self, status, reason, headers, body):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+
+
+class AsyncUWGroups(object):
+    """Asyncio counterpart of ``UWGroups``. Arguments ``certfile``,
+    ``keyfile``, ``environment``, ``timeout`` and
+    ``use_default_ciphers``, ``host``, ``port`` and ``cafile`` have
+    the same meaning as for ``UWGroups``. At most ``max_connections`` requests are sent
+    concurrently; additional requests wait for a free connection.
+    Idle connections are reused unless they have been idle for longer
+    than ``idle_timeout`` seconds; an idle connection closed by the
+    server is replaced without counting as a failed attempt.
+
+    """
+
+    def __init__(self, certfile, keyfile=None, environment='PROD', timeout=30,
+                 use_default_ciphers=False, max_connections=100, host=None,
+                 port=GWS_PORT, cafile=None, idle_timeout=5):
+
+        self.gws_host = host or GWS_HOSTS[environment]
+        self.gws_port = port
+        self.cafile = cafile
+        log.info(f'using {self.gws_host}')
+
+        if not certfile or not path.exists(certfile):
+            raise ValueError(
+                "'certfile' is required and must specify a readable file")
+
+        if keyfile and not path.exists(keyfile):
+            raise ValueError("'keyfile' must specify a readable file")
+
+        self.keyfile = keyfile
+        self.certfile = certfile
+        self.admins = get_admins(certfile)
+        log.info(self.admins)
+        self.timeout = timeout
+        self.use_default_ciphers = use_default_ciphers
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        self.context = None
+        self._idle = []
+        self._semaphore = None
+        self._create_locks = defaultdict(asyncio.Lock)
+
+    async def connect(self):
+        """Prepare the client for use. Connections are opened on demand,
+        so no network traffic occurs here. Must be called explicitly
+        if the object is not used as an async context manager.
+
+        """
+
+        self.context = ssl_context(
+            self.certfile, self.keyfile, self.use_default_ciphers, self.cafile)
+        self._semaphore = asyncio.Semaphore(self.max_connections)
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, type, value, tback):
+        await self.close()
+
+    async def close(self):
+        """Close all idle connections"""
+        idle, self._idle = self._idle, []
+        for reader, writer, last_used in idle:
+            writer.close()
+
+    async def _get(self):
+        """Return a tuple (reader, writer, reused), reusing the most
+        recently used idle connection unless it has been idle for
+        longer than ``idle_timeout``
+
+        """
+
+        now = time.monotonic()
+        while self._idle:
+            reader, writer, last_used = self._idle.pop()
+            if now - last_used <= self.idle_timeout and not writer.is_closing():
+                return reader, writer, True
+            writer.close()
+        reader, writer = await self._open()
+        return reader, writer, False
+
+    async def _open(self):
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(
+                self.gws_host, self.gws_port, ssl=self.context,
+                server_hostname=self.gws_host),
+            self.timeout)
+        log.debug(f'connected to {self.gws_host}:{self.gws_port}')
+        return reader, writer
+
+    async def _exchange(self, reader, writer, method, url, headers, body):
+        """Send a single request and return a tuple (response, keep_alive)"""
+
+        payload = body.encode('utf-8') if body else b''
+        lines = [f'{method} {url} HTTP/1.1', f'Host: {self.gws_host}',
+                 f'Content-Length: {len(payload)}']
+        lines.extend(f'{k}: {v}' for k, v in (headers or {}).items())
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + payload)
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError('connection closed by server')
+        version, status, *reason = status_line.decode('latin-1').split(None, 2)
+        status = int(status)
+        reason = reason[0].strip() if reason else ''
+
+        response_headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            key, value = line.decode('latin-1').split(':', 1)
+            response_headers[key.strip().lower()] = value.strip()
+
+        keep_alive = (version == 'HTTP/1.1' and
+                      response_headers.get('connection', '').lower() != 'close')
+
+        if status in (204, 304) or method == 'HEAD':
+            data = b''
+        elif response_headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    # discard trailers
+                    while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            data = b''.join(chunks)
+        elif 'content-length' in response_headers:
+            data = await reader.readexactly(int(response_headers['content-length']))
+        else:
+            data = await reader.read()
+            keep_alive = False
+
+        return _Response(status, reason, response_headers, data), keep_alive
+
+    @check_types(method=str, endpoint=str, headers=dict,
+                 body=str, expect_status=int, attempts=int)
+    async def _request(self, method, endpoint, headers=None, body=None,
+                       expect_status=200, attempts=5):
+        methods = {'GET', 'PUT', 'DELETE'}
+        if method not in methods:
+            raise ValueError(
+                'method must be one of {}'.format(', '.join(methods)))
+
+        if self._semaphore is None:
+            raise APIError('not connected; call connect() first')
+
+        url = path.join(API_PATH, endpoint)
+
+        async with self._semaphore:
+            for attempt in range(attempts):
+                writer = None
+                try:
+                    reader, writer, reused = await self._get()
+                    try:
+                        response, keep_alive = await asyncio.wait_for(
+                            self._exchange(reader, writer, method, url, headers, body),
+                            self.timeout)
+                    except ConnectionError as err:
+                        if not reused:
+                            raise
+                        # closed by the server while idle; use a new connection
+                        log.debug('idle connection was closed ({!r}); '
+                                  'reconnecting'.format(err))
+                        writer.close()
+                        writer = None
+                        reader, writer = await self._open()
+                        response, keep_alive = await asyncio.wait_for(
+                            self._exchange(reader, writer, method, url, headers, body),
+                            self.timeout)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError,
+                        OSError) as err:
+                    # the connection is unusable (or could not be
+                    # established); retry on a fresh one
+                    caught_err = err
+                    log.warning('failure on attempt {}: {!r}'.format(attempt, err))
+                    if writer is not None:
+                        writer.close()
+                else:
+                    if keep_alive:
+                        self._idle.append((reader, writer, time.monotonic()))
+                    else:
+                        writer.close()
+                    break
+            else:
+                msg = '{!r}: {} {}'.format(caught_err, method, url)
+                log.info(msg)
+                raise APIError(msg)
+
+        msg = '{} {}: {} {}'.format(method, url, response.status, response.reason)
+        log.info(msg)
+
+        if response.status == 404:
+            raise MissingResourceError(msg)
+        elif response.status == 401:
+            raise AuthorizationError(msg)
+        elif response.status != expect_status:
+            raise APIError(msg)
+
+        return response.body
+
+    @check_types(group_name=str)
+    async def group_exists(self, group_name):
+        """Return True if the group exists"""
+        try:
+            await self.get_group(group_name)
+        except MissingResourceError:
+            return False
+        else:
+            return True
+
+    @check_types(group_name=str)
+    async def get_group(self, group_name):
+        """Return deserialized json representation of a group"""
+        endpoint = path.join('group', group_name)
+        response = await self._request(
+            'GET', endpoint,
+            headers={"Accept": "application/json",
+                     "Content-Type": "application/json"})
+        return json.loads(response)
+
+    @check_types(group_name=str, admin_users=list)
+    async def create_group(self, group_name, admin_users=None):
+        """Create a group with name ``group_name``, creating parent
+        groups if necessary (see ``UWGroups.create_group``).
+
+        """
+
+        # concurrent attempts to create the same group (typically a
+        # shared parent) are serialized so that only one is made
+        async with self._create_locks[group_name]:
+            if await self.group_exists(group_name):
+                log.info(f'group {group_name} exists, skipping creation')
+                return {}
+
+            for parent in parents(group_name):
+                await self.create_group(parent, admin_users=admin_users or [])
+
+            endpoint = path.join('group', group_name)
+            body = group_definition(group_name, self.admins, admin_users)
+
+            response = await self._request(
+                'PUT', endpoint,
+                headers={"Accept": "application/json",
+                         "Content-Type": "application/json"},
+                body=json.dumps(body),
+                expect_status=201)
+            log.debug(response)
+            return response
+
+    @check_types(group_name=str)
+    async def delete_group(self, group_name):
+        endpoint = path.join('group', group_name)
+        response = await self._request('DELETE', endpoint)
+        return response
+
+    @check_types(group_name=str)
+    async def get_members(self, group_name):
+        """Return a list of ``User`` objects"""
+        endpoint = path.join('group', group_name, 'member')
+        response = await self._request(
+            'GET', endpoint, headers={'accept': 'application/json'})
+        data = json.loads(response)['data']
+        members = [User._from_api(d['id'], d.get('type', 'uwnetid')) for d in data]
+        return members
+
+    async def _modify_members(self, method, group_name, members, batchsize):
+        await asyncio.gather(*[
+            self._request(
+                method, path.join('group', group_name, 'member', ','.join(chunk)))
+            for chunk in grouper(members, batchsize)])
+
+    @check_types(group_name=str, members=list, batchsize=int)
+    async def add_members(self, group_name, members, batchsize=50):
+        """Add uwnetids in list ``members`` to the specified group in batches
+        of size ``batchsize``; batches are sent concurrently.
+
+        """
+        await self._modify_members('PUT', group_name, members, batchsize)
+
+    @check_types(group_name=str, members=list, batchsize=int)
+    async def delete_members(self, group_name, members, batchsize=50):
+        """Remove uwnetids in list ``members`` from the specified group in
+        batches of size ``batchsize``; batches are sent concurrently.
+
+        """
+        await self._modify_members('DELETE', group_name, members, batchsize)
+
+    @check_types(group_name=str, members=list)
+    async def sync_members(self, group_name, members, batchsize=50, dry_run=False):
+        """Add or remove users from the specified group as necessary so that
+        the group contains ``members`` (see ``UWGroups.sync_members``).
+
+        """
+
+        try:
+            current_members = set(await self.get_members(group_name))
+        except MissingResourceError:
+            current_members = set()
+            log.warning('creating group {}'.format(group_name))
+            if not dry_run:
+                await self.create_group(group_name)
+
+        log.info('{} current members'.format(len(current_members)))
+        to_add, to_delete = member_changes(group_name, current_members, members)
+
+        updates = []
+        if to_add:
+            log.info('[+] {}: {}'.format(group_name, ','.join(to_add)))
+            if not dry_run:
+                updates.append(self.add_members(
+                    group_name, sorted(to_add), batchsize=batchsize))
+
+        if to_delete:
+            log.info('[-] {}: {}'.format(group_name, ','.join(to_delete)))
+            if not dry_run:
+                updates.append(self.delete_members(
+                    group_name, sorted(to_delete), batchsize=batchsize))
+
+        await asyncio.gather(*updates)
+
+    @check_types(netid=str)
+    async def search_user(self, netid):
+        """Return groups in which `netid` is a member
+
+        """
+
+        endpoint = f'search?member={netid}'
+        response = await self._request('GET', endpoint)
+        data = json.loads(response)['data']
+        groups = [d['id'] for d in data]
+        return groups
+
+    @check_types(name=str)
+    async def search_groups(self, name):
+        """Return a list of group names matching pattern `name` (may
+        contain * as a wildcard).
+
+        """
+
+        endpoint = f'search?name={name}'
+        response = await self._request('GET', endpoint)
+        data = json.loads(response)['data']
+        groups = [d['id'] for d in data]
+        return groups
@@ -1,44 +1,76 @@
 import errno
+import functools
 import logging
 import http.client
+import os
 from os import path
 import socket
+import ssl
 import subprocess
 import json
-
-from uwgroups import package_data
-from uwgroups.utils import reconcile, grouper, check_types
+import threading
+import time
+from collections import defaultdict
+from itertools import chain
+
+from uwgroups import package_data, GWS_HOSTS
+from uwgroups.cache import GroupCache
+from uwgroups.models import APIError, MissingResourceError, AuthorizationError, User
+from uwgroups.pool import ConnectionPool
+from uwgroups.scheduler import RequestScheduler
+from uwgroups.utils import (reconcile, check_types, parents, pack_count,
+                            hierarchy_levels, imap_concurrent, iter_json_array,
+                            AdaptiveBatchSize)
 
 log = logging.getLogger(__name__)
 
-# https://groups.uw.edu/group_sws/v3
-GWS_HOSTS = {
-    'PROD': 'groups.uw.edu',
-    'DEV': 'dev.groups.uw.edu',
-    'EVAL': 'eval.groups.uw.edu',
-}
-
 GWS_PORT = 443
+
+# names of affiliates ({service: name}) used by the API
+AFFILIATES = {'exchange': 'email', 'google': 'google'}
 API_PATH = '/group_sws/v3'
 
 # https://certs.cac.washington.edu/?req=svpem
 UWCA_ROOT = package_data('root.cert')
 
 
-class APIError(Exception):
-    pass
+# attributes of the certificate subject as named by ssl.SSLSocket.getpeercert()
+_SUBJECT_FIELDS = {'commonName': 'CN', 'emailAddress': 'emailAddress'}
 
+# {certfile: (mtime, admins)}; see get_admins()
+_admins_cache = {}
 
-class MissingResourceError(APIError):
-    pass
 
+def _decode_subject(certfile):
+    """Return a dict of attributes of the subject of the certificate in
+    ``certfile`` (which may also contain a private key) using the
+    certificate decoder in the ``ssl`` module, or None if the decoder
+    is not available or fails.
 
-class AuthorizationError(APIError):
-    pass
+    """
 
-
-def get_admins(certfile):
-    """Returns [dns_user, uwnetid_user] given data in cert
+    # _test_decode_cert() is a private CPython helper intended for
+    # tests, so it may be removed or its signature or return value may
+    # change; any failure falls back to the openssl command line tool
+    decode = getattr(ssl._ssl, '_test_decode_cert', None)
+    if decode is None:
+        return None
+
+    data = {}
+    try:
+        for rdn in decode(certfile)['subject']:
+            for key, value in rdn:
+                if key in _SUBJECT_FIELDS:
+                    data[_SUBJECT_FIELDS[key]] = value
+    except (TypeError, KeyError, ValueError, ssl.SSLError) as err:
+        log.info('failed to decode {}: {!r}'.format(certfile, err))
+        return None
+    return data
+
+
+def _openssl_subject(certfile):
+    """Return a dict of attributes of the subject of the certificate in
+    ``certfile`` using the openssl command line tool
 
     """
 
@@ -55,28 +87,194 @@ def get_admins(certfile):
 
     text = output.stdout.replace('subject=', '').strip()
     char = '/' if text.startswith('/') else ','
-    data = {k.strip(): v.strip()
+    return {k.strip(): v.strip()
             for k, v in [e.split('=') for e in text.strip(char).split(char)]}
 
-    dns_user = User(uwnetid=data['CN'], type='dns')
-    uwnetid_user = User(
-        uwnetid=data['emailAddress'].split('@')[0], type='uwnetid')
 
-    return [dns_user, uwnetid_user]
+def get_admins(certfile):
+    """Returns [dns_user, uwnetid_user] given data in cert
+
+    The certificate is decoded in-process if possible (otherwise
+    using ``openssl x509``), and the result is cached until the
+    modification time of ``certfile`` changes.
+
+    """
+
+    certfile = path.abspath(certfile)
+    mtime = os.stat(certfile).st_mtime_ns
+    cached_mtime, admins = _admins_cache.get(certfile, (None, None))
+    if cached_mtime != mtime:
+        data = _decode_subject(certfile)
+        if data is None:
+            data = _openssl_subject(certfile)
+
+        dns_user = User(uwnetid=data['CN'], type='dns')
+        uwnetid_user = User(
+            uwnetid=data['emailAddress'].split('@')[0], type='uwnetid')
+
+        admins = [dns_user, uwnetid_user]
+        _admins_cache[certfile] = (mtime, admins)
+
+    return list(admins)
+
+
+def member_changes(group_name, current_members, members):
+    """Return sorted lists of member ids to add to and remove from
+    ``group_name`` so that a group containing ``current_members`` (a
+    set of ``User`` objects) contains ``members`` (member ids or
+    ``User`` objects). Members specified as ``User`` objects are
+    compared by both id and type; member ids are compared by id only,
+    since the type assigned by the API can't be known from the id.
+
+    """
+
+    typed = {m for m in members if isinstance(m, User)}
+    untyped = {m for m in members if not isinstance(m, User)}
+
+    to_add, _ = reconcile(current_members, typed)
+    add = sorted({user.id for user in to_add} |
+                 (untyped - {user.id for user in current_members}))
+    to_delete = {user for user in current_members
+                 if user not in typed and user.id not in untyped}
+
+    # a member whose type differs from the desired type is replaced
+    # by adding the id, so it must not also be removed
+    retyped = set(add).intersection(user.id for user in to_delete)
+    if retyped:
+        log.warning('{}: member type differs for {}'.format(
+            group_name, ', '.join(sorted(retyped))))
+    remove = sorted({user.id for user in to_delete} - retyped)
+    return add, remove
+
+
+def diff_members(conn, other, group_names, jobs=1):
+    """Compare the membership of each group in ``group_names`` using
+    clients ``conn`` and ``other`` (typically connected to different
+    environments), yielding tuples (group_name, record, exception) as
+    each comparison completes; exactly one of ``record`` or
+    ``exception`` is None. ``record`` is a dict as returned by
+    ``UWGroups.plan_members()`` describing the changes needed for the
+    group accessed using ``conn`` to match the group accessed using
+    ``other``, with an additional key 'missing' (True if the group
+    does not exist in ``other``). The membership of both groups is
+    fetched concurrently, with up to ``jobs`` groups in flight, and
+    ``group_names`` is consumed lazily.
+
+    """
+
+    def fetch(item):
+        _, group_name, client = item
+        try:
+            return set(client.get_members(group_name))
+        except MissingResourceError:
+            return None
+
+    items = ((i, group_name, client)
+             for i, group_name in enumerate(group_names)
+             for client in (conn, other))
+
+    # {index: (members, exception)} for groups with one side fetched
+    fetched = {}
+    for (i, group_name, client), members, err in imap_concurrent(
+            fetch, items, jobs=2 * jobs):
+        if i not in fetched:
+            fetched[i] = (members, err)
+            continue
+
+        first_members, first_err = fetched.pop(i)
+        err = first_err or err
+        if err:
+            yield group_name, None, err
+            continue
+
+        if client is conn:
+            current, desired = members, first_members
+        else:
+            current, desired = first_members, members
+
+        add, remove = member_changes(group_name, current or set(), desired or set())
+        yield group_name, {'group': group_name, 'create': current is None,
+                           'missing': desired is None,
+                           'add': add, 'remove': remove}, None
+
+
+def ssl_context(certfile, keyfile=None, use_default_ciphers=False,
+                cafile=None):
+    """Return an ``ssl.SSLContext`` configured for mutual TLS
+    authentication to the groups API using the certificate in
+    ``certfile`` (and private key in ``keyfile`` if provided), and
+    verifying the server against the UWCA root certificate (or the CA
+    certificate in ``cafile``). See ``UWGroups`` for a description of
+    ``use_default_ciphers``.
+
+    """
+
+    context = http.client.ssl.create_default_context()
+    context.load_cert_chain(certfile=certfile, keyfile=keyfile)
+    context.load_verify_locations(cafile or UWCA_ROOT)
+    if not use_default_ciphers:
+        context.set_ciphers('DEFAULT@SECLEVEL=1')
+    return context
+
 
+def group_definition(group_name, admins, admin_users=None):
+    """Return the request body used to create a group named
+    ``group_name``. ``admins`` is a list of ``User`` objects
+    (typically the users identified by the certificate), to which
+    users identified by uwnetid in ``admin_users`` are added.
 
-class User(object):
-    user_types = {'uwnetid', 'group', 'dns', 'eppn'}
+    """
 
-    def __init__(self, uwnetid, type):
-        if type not in self.user_types:
-            raise ValueError('user_type must be in {}'.format(self.user_types))
+    admins = admins[:]
+    if admin_users:
+        for uwnetid in admin_users:
+            admins.append(User(uwnetid, type='uwnetid'))
+
+    return {
+        "data": {
+            "id": group_name,
+            "displayName": group_name,
+            "description": group_name,
+            "contact": "ngh2",
+            "authnfactor": 1,
+            "classification": "u",
+            "admins": [{'id': u.uwnetid, 'type': u.type} for u in admins],
+            "updaters": [],
+            "creators": [],
+            "readers": [],
+            "optins": [],
+            "optouts": [],
+        }
+    }
 
-        self.uwnetid = uwnetid
-        self.type = type
 
-    def __repr__(self):
-        return 'User(uwnetid={}, type={})'.format(self.uwnetid, self.type)
+class ResponseStream(object):
+    """File-like object providing the body of ``response`` received on
+    ``connection``, which is returned to ``pool`` by ``close()``
+    (the connection is discarded unless the body was read
+    completely). May be used as a context manager.
+
+    """
+
+    def __init__(self, pool, connection, response):
+        self.pool = pool
+        self.connection = connection
+        self.response = response
+
+    def read(self, size=None):
+        return self.response.read(size)
+
+    def close(self):
+        if self.connection is not None:
+            complete = self.response.isclosed()
+            self.pool.put(self.connection, self.response if complete else None)
+            self.connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
 
 
 class UWGroups(object):
@@ -85,6 +283,47 @@ class UWGroups(object):
     the certificate and private keys, respectively. ``timeout`` is
     passed to ``httplib.HTTPSConnection()``
 
+    Requests are made using a thread-safe pool of keep-alive
+    connections (see ``uwgroups.pool.ConnectionPool``) that share a
+    single ``ssl.SSLContext``, so a ``UWGroups`` object may be used
+    from multiple threads. At most ``pool_size`` connections are open
+    at once; idle connections are closed after ``idle_timeout``
+    seconds, which should be less than the time for which the server
+    keeps idle connections open (an idle connection closed by the
+    server is replaced without counting as a failed attempt). Counts of TLS handshakes and requests are available from
+    ``UWGroups.pool.stats()``.
+
+    Members are added and removed in batches. Each request URL is no
+    longer than ``max_url_length`` characters; within that limit, the
+    number of members per request is adjusted according to the
+    response time: batches grow while requests complete within
+    ``batch_latency`` seconds, and shrink when requests are slower or
+    fail. Batch sizes are tallied by ``UWGroups.batch_sizer``.
+
+    Request rate, concurrency and retries are controlled by
+    ``scheduler`` (a ``uwgroups.scheduler.RequestScheduler`` object;
+    by default, requests are not rate limited and are attempted up to
+    5 times).
+
+    If ``metrics`` is provided (a ``uwgroups.metrics.Metrics``
+    object), each request, retry and TLS handshake is recorded.
+
+    If ``member_cache`` is provided (a ``uwgroups.cache.MembershipCache``
+    object), group membership is cached and revalidated using
+    conditional requests (see ``get_members()``).
+
+    Group metadata returned by ``get_group()`` (and hence the result
+    of ``group_exists()``, including for groups that do not exist) is
+    cached in memory for ``group_cache_ttl`` seconds (0 to disable);
+    the entry for a group is updated or discarded when it is created,
+    deleted or modified using this object. Hits and misses are counted by
+    ``UWGroups.group_cache.stats()``.
+
+    ``host``, ``port`` and ``cafile`` override the API host for
+    ``environment``, the port, and the CA certificate used to verify
+    the server; these are intended for use with a local stand-in for
+    the API (see ``benchmarks/mockgws.py``).
+
     As of 2022-06-28, the UWCA root cert is only 1024 bytes, which
     results in the error
 
@@ -100,12 +339,18 @@ class UWGroups(object):
     """
 
     def __init__(self, certfile, keyfile=None, environment='PROD', timeout=30,
-                 use_default_ciphers=False):
+                 use_default_ciphers=False, pool_size=10, idle_timeout=5,
+                 member_cache=None, max_url_length=2048, batch_latency=2.0,
+                 scheduler=None, metrics=None, group_cache_ttl=60, host=None,
+                 port=GWS_PORT, cafile=None):
         """Initialize the connection.
 
         """
 
-        self.gws_host = GWS_HOSTS[environment]
+        self.environment = environment
+        self.gws_host = host or GWS_HOSTS[environment]
+        self.gws_port = port
+        self.cafile = cafile
         log.info(f'using {self.gws_host}')
 
         if not certfile or not path.exists(certfile):
@@ -121,25 +366,44 @@ class UWGroups(object):
         log.info(self.admins)
         self.timeout = timeout
         self.use_default_ciphers = use_default_ciphers
+        self.pool_size = pool_size
+        self.idle_timeout = idle_timeout
+        self.member_cache = member_cache
+        self.group_cache = GroupCache(ttl=group_cache_ttl)
+        self.scheduler = scheduler or RequestScheduler()
+        self.metrics = metrics
+        self.max_url_length = max_url_length
+        self.batch_sizer = AdaptiveBatchSize(target_latency=batch_latency)
         self.context = None
-        self.connection = None
+        self.pool = None
+        self._create_locks = defaultdict(threading.Lock)
+        self._create_locks_lock = threading.Lock()
 
     def connect(self, timeout=None):
         """Establish a connection. If the ``UWGroups`` object is instantiated
         without a with block, must be called explicitly. ``timeout``
         overrides the value for ``timeout`` in the class constructor.
+        The SSL context is created on the first call and reused
+        thereafter; connections are opened as needed.
         """
-        self.context = http.client.ssl.create_default_context()
-        self.context.load_cert_chain(certfile=self.certfile, keyfile=self.keyfile)
-        self.context.load_verify_locations(UWCA_ROOT)
-        if not self.use_default_ciphers:
-            self.context.set_ciphers('DEFAULT@SECLEVEL=1')
-        self.connection = http.client.HTTPSConnection(
+        if self.context is None:
+            self.context = ssl_context(
+                self.certfile, self.keyfile, self.use_default_ciphers,
+                self.cafile)
+        session = None
+        if self.pool is not None:
+            self.pool.close()
+            session = self.pool.session
+        self.pool = ConnectionPool(
             host=self.gws_host,
+            port=self.gws_port,
+            context=self.context,
             timeout=timeout or self.timeout,
-            port=GWS_PORT,
-            context=self.context)
-        log.info(f'connected to {self.gws_host}:{GWS_PORT}')
+            maxsize=self.pool_size,
+            idle_timeout=self.idle_timeout,
+            on_connect=self.metrics.handshake if self.metrics else None,
+            session=session)
+        log.info(f'connected to {self.gws_host}:{self.gws_port}')
 
     def __enter__(self):
         self.connect()
@@ -149,25 +413,64 @@ class UWGroups(object):
         self.close()
 
     def close(self):
-        """Close the connection"""
-        self.connection.close()
+        """Close all idle connections"""
+        self.pool.close()
 
     def reset(self):
-        """Close and reopen the connection; may be necessary after an
-        exception"""
+        """Close all idle connections. It is no longer necessary to call
+        this method after an exception: connections are discarded
+        automatically after errors."""
         self.close()
-        self.connect()
+
+    def _send(self, connection, method, url, args):
+        """Send a request using ``connection`` and return the response.
+        If ``connection`` is an idle keep-alive connection that the
+        server has already closed, the request is sent again on a new
+        connection; this is not counted as a failed attempt.
+
+        """
+
+        reused = connection.sock is not None
+        try:
+            connection.request(method, url, **args)
+            return connection.getresponse()
+        except (http.client.RemoteDisconnected, ConnectionResetError,
+                BrokenPipeError) as err:
+            if not reused:
+                raise
+            log.debug('idle connection was closed ({!r}); reconnecting'.format(err))
+            connection.close()
+            connection.request(method, url, **args)
+            return connection.getresponse()
 
     @check_types(method=str, endpoint=str, headers=dict,
-                 body=str, expect_status=int, attempts=int)
+                 body=str, expect_status=(int, tuple), attempts=(int, type(None)))
     def _request(self, method, endpoint, headers=None, body=None,
-                 expect_status=200, attempts=5):
+                 expect_status=200, attempts=None, return_response=False,
+                 stream=False):
+        """Perform a request and return the response body. Raises
+        ``APIError`` (or a subclass) if the response status is not
+        ``expect_status`` (an int or a tuple of ints). If
+        ``return_response`` is True, return a tuple (response, body)
+        so that the status and headers can be inspected. If ``stream``
+        is True, return a ``ResponseStream`` from which the body can
+        be read incrementally; it must be closed after use.
+
+        Requests are sent subject to the rate and concurrency limits of
+        ``self.scheduler``. Network errors and responses with
+        retryable status codes (eg, 429 or 503) are retried up to
+        ``attempts`` times (by default, ``self.scheduler.attempts``)
+        with exponential backoff.
+
+        """
         methods = {'GET', 'PUT', 'DELETE'}
         if method not in methods:
             raise ValueError(
                 'method must be one of {}'.format(', '.join(methods)))
 
         url = path.join(API_PATH, endpoint)
+        if not isinstance(expect_status, tuple):
+            expect_status = (expect_status,)
 
         args = {}
         if headers:
@@ -175,24 +478,73 @@ class UWGroups(object):
         if body:
             args['body'] = body
 
+        scheduler = self.scheduler
+        attempts = attempts or scheduler.attempts
+
+        metrics = self.metrics
+        if metrics:
+            # approximate size of the request line, headers and body
+            sent = len(method) + len(url) + len(body or '') + sum(
+                len(k) + len(v) + 4 for k, v in (headers or {}).items())
+
         for attempt in range(attempts):
+            retry_after = None
+            connection = self.pool.get()
             try:
-                self.connection.request(method, url, **args)
-                response = self.connection.getresponse()
-            except http.client.BadStatusLine as err:
+                with scheduler.slot():
+                    started = time.monotonic()
+                    response = self._send(connection, method, url, args)
+                    # always drain the response so that the connection
+                    # can be reused, even if the status indicates an
+                    # error, unless the caller will read it
+                    if stream and response.status in expect_status:
+                        response_body = None
+                    else:
+                        response_body = response.read()
+                    elapsed = time.monotonic() - started
+            except (http.client.BadStatusLine, http.client.IncompleteRead,
+                    ConnectionError, socket.timeout) as err:
+                # includes a keep-alive connection closed by the server
+                self.pool.put(connection)
                 caught_err = err
-                log.warning('failure on attempt {}: {}'.format(attempt, err))
-                self.reset()
+                if metrics:
+                    metrics.request(method, endpoint, time.monotonic() - started,
+                                    sent=sent, error=err)
             except socket.error as err:
+                self.pool.put(connection)
                 caught_err = err
+                if metrics:
+                    metrics.request(method, endpoint, time.monotonic() - started,
+                                    sent=sent, error=err)
                 if err.errno != errno.ETIMEDOUT:
                     log.warning('failure on attempt {}: {}'.format(attempt, err))
                     # response isn't set at all for this case, reraise
                     # the exception.
                     raise
-                self.reset()
+            except BaseException:
+                self.pool.put(connection)
+                raise
             else:
-                break
+                if response_body is not None:
+                    self.pool.put(connection, response)
+                if metrics:
+                    metrics.request(
+                        method, endpoint, elapsed, status=response.status,
+                        sent=sent, received=len(response_body or b'') + sum(
+                            len(k) + len(v) + 4 for k, v in response.getheaders()))
+                if (response.status in expect_status
+                        or not scheduler.retryable(response.status)
+                        or attempt + 1 == attempts):
+                    break
+                caught_err = '{} {}'.format(response.status, response.reason)
+                retry_after = response.getheader('Retry-After')
+
+            log.warning('failure on attempt {}: {}: {} {}'.format(
+                attempt, caught_err, method, url))
+            if attempt + 1 < attempts:
+                if metrics:
+                    metrics.retry(method, endpoint, attempt, caught_err)
+                scheduler.wait(attempt, retry_after=retry_after)
         else:
             # Hit the limit of attempts. The response variable never got set.
             msg = '{}: {} {}'.format(caught_err, method, url)
@@ -206,22 +558,25 @@ class UWGroups(object):
             raise MissingResourceError(msg)
         elif response.status == 401:
             raise AuthorizationError(msg)
-        elif response.status != expect_status:
+        elif response.status not in expect_status:
             raise APIError(msg)
 
-        body = response.read()
-        return body
+        if response_body is None:
+            return ResponseStream(self.pool, connection, response)
+        if return_response:
+            return response, response_body
+        return response_body
 
     @check_types(group_name=str)
     def group_exists(self, group_name):
         """Return True if the group exists"""
+        exists = self.group_cache.exists(group_name)
+        if exists is not None:
+            return exists
+
         try:
             self.get_group(group_name)
         except MissingResourceError:
-            # closing and reopening the connection seems to be
-            # necessary to prevent an httplib.ResponseNotReady error
-            # after an exception caused by a missing group.
-            self.reset()
             return False
         else:
             return True
@@ -230,11 +585,25 @@ class UWGroups(object):
     def get_group(self, group_name):
         """Return deserialized json representation of a group"""
         endpoint = path.join('group', group_name)
-        response = self._request(
-            'GET', endpoint,
-            headers={"Accept": "application/json",
-                     "Content-Type": "application/json"})
-        return json.loads(response)
+
+        cached, data = self.group_cache.get(group_name)
+        if cached:
+            if data is None:
+                raise MissingResourceError(f'{endpoint} does not exist (cached)')
+            return data
+
+        try:
+            response = self._request(
+                'GET', endpoint,
+                headers={"Accept": "application/json",
+                         "Content-Type": "application/json"})
+        except MissingResourceError:
+            self.group_cache.put(group_name, None)
+            raise
+
+        data = json.loads(response)
+        self.group_cache.put(group_name, data)
+        return data
 
     @check_types(group_name=str, admin_users=list)
     def create_group(self, group_name, admin_users=None):
@@ -248,124 +617,452 @@ class UWGroups(object):
         Note that the API requires that a parent group ('root_parent')
         must be created before any of its children
         ('root_parent_child'). This method will recursively create
-        parent groups if necessary.
+        parent groups if necessary. Concurrent calls from multiple
+        threads for the same group are serialized, so only one of
+        them attempts to create it.
 
         """
 
-        if self.group_exists(group_name):
-            log.info(f'group {group_name} exists, skipping creation')
-            return {}
+        with self._create_locks_lock:
+            lock = self._create_locks[group_name]
 
-        # create parents as necessary, skipping the first (root) group
-        hierarchy = group_name.split('_')
-        for i in range(2, len(hierarchy)):
-            parent = '_'.join(hierarchy[:i])
-            self.create_group(parent, admin_users=admin_users or [])
+        with lock:
+            if self.group_exists(group_name):
+                log.info(f'group {group_name} exists, skipping creation')
+                return {}
 
-        endpoint = path.join('group', group_name)
+            # create parents as necessary, skipping the first (root) group
+            for parent in parents(group_name):
+                self.create_group(parent, admin_users=admin_users or [])
 
-        admins = self.admins[:]
-        if admin_users:
-            for uwnetid in admin_users:
-                admins.append(User(uwnetid, type='uwnetid'))
-
-        body = {
-            "data": {
-                "id": group_name,
-                "displayName": group_name,
-                "description": group_name,
-                "contact": "ngh2",
-                "authnfactor": 1,
-                "classification": "u",
-                "admins": [{'id': u.uwnetid, 'type': u.type} for u in admins],
-                "updaters": [],
-                "creators": [],
-                "readers": [],
-                "optins": [],
-                "optouts": [],
-            }
-        }
+            return self._put_group(group_name, admin_users)
 
-        response = self._request(
-            'PUT', endpoint,
-            headers={"Accept": "application/json",
-                     "Content-Type": "application/json"},
-            body=json.dumps(body),
-            expect_status=201)
+    def _put_group(self, group_name, admin_users=None):
+        endpoint = path.join('group', group_name)
+        body = group_definition(group_name, self.admins, admin_users)
+
+        try:
+            response = self._request(
+                'PUT', endpoint,
+                headers={"Accept": "application/json",
+                         "Content-Type": "application/json"},
+                body=json.dumps(body),
+                expect_status=201)
+        except Exception:
+            self.group_cache.invalidate(group_name)
+            raise
+        self.group_cache.put_exists(group_name)
         log.debug(response)
         return response
 
+    @check_types(group_names=list, admin_users=list, jobs=int,
+                 group_admins=(dict, type(None)))
+    def create_groups(self, group_names, admin_users=None, jobs=1,
+                      group_admins=None):
+        """Create the groups in ``group_names`` along with any missing
+        parents (see ``create_group()`` for a description of
+        ``admin_users``), using up to ``jobs`` concurrent requests.
+        ``group_admins`` is an optional dict of {group_name:
+        [uwnetids]} providing admin users for individual groups in
+        place of ``admin_users``.
+
+        The tree formed by all groups and their parents (see
+        ``uwgroups.utils.hierarchy_levels()``) is examined one level
+        at a time, starting at the top: each group is checked for
+        existence once, and only if its parent exists. Missing groups
+        are then created level by level, with the groups in each level
+        created concurrently. Groups whose parent could not be checked
+        or created are not attempted; a failure to check or create one
+        group does not prevent the others from being created.
+
+        Returns a dict with keys 'exists' and 'created' (lists of
+        group names), 'failed' (a dict of {group_name: exception}),
+        and 'skipped' (a list of groups not attempted).
+
+        """
+
+        levels = hierarchy_levels(group_names)
+        missing = set()
+        # groups whose existence could not be determined
+        unknown = set()
+        result = {'exists': [], 'created': [], 'failed': {}, 'skipped': []}
+
+        for level in levels:
+            probe = []
+            for group_name in level:
+                group_parents = parents(group_name)
+                parent = group_parents[-1] if group_parents else None
+                if parent in unknown:
+                    unknown.add(group_name)
+                    result['skipped'].append(group_name)
+                elif parent in missing:
+                    missing.add(group_name)
+                else:
+                    probe.append(group_name)
+
+            for group_name, exists, err in imap_concurrent(
+                    self.group_exists, probe, jobs=jobs):
+                if err:
+                    log.error('failed to check {}: {}'.format(group_name, err))
+                    unknown.add(group_name)
+                    result['failed'][group_name] = err
+                elif exists:
+                    result['exists'].append(group_name)
+                else:
+                    missing.add(group_name)
+
+        log.info('{} of {} groups exist'.format(
+            len(result['exists']), sum(len(level) for level in levels)))
+
+        failed = set()
+        for level in levels:
+            todo = []
+            for group_name in level:
+                if group_name not in missing:
+                    continue
+                group_parents = parents(group_name)
+                if group_parents and group_parents[-1] in failed:
+                    failed.add(group_name)
+                    result['skipped'].append(group_name)
+                else:
+                    todo.append(group_name)
+
+            group_admins = group_admins or {}
+            for group_name, _, err in imap_concurrent(
+                    lambda name: self._put_group(
+                        name, group_admins.get(name, admin_users)),
+                    todo, jobs=jobs):
+                if err:
+                    log.error('failed to create {}: {}'.format(group_name, err))
+                    failed.add(group_name)
+                    result['failed'][group_name] = err
+                else:
+                    log.info('created group {}'.format(group_name))
+                    result['created'].append(group_name)
+
+        return result
+
     @check_types(group_name=str)
     def delete_group(self, group_name):
         endpoint = path.join('group', group_name)
-        response = self._request('DELETE', endpoint)
+        try:
+            response = self._request('DELETE', endpoint)
+        except Exception:
+            self.group_cache.invalidate(group_name)
+            raise
+        self.group_cache.put(group_name, None)
+        self._invalidate_members(group_name)
         return response
 
+    @check_types(stem=str, jobs=int)
+    def delete_tree(self, stem, jobs=1, dry_run=False):
+        """Delete the group ``stem`` and all of its descendants (groups
+        with names beginning with ``stem + '_'``), deleting the
+        descendants first. Groups are ordered into levels by depth,
+        starting with the deepest, and the groups in each level are
+        deleted using up to ``jobs`` concurrent requests. A group is
+        not attempted if deletion of any of its descendants failed.
+        When ``dry_run`` is True, nothing is deleted.
+
+        Returns a dict with keys 'levels' (a list of lists of group
+        names in order of deletion), 'deleted' (a list of group names),
+        'failed' (a dict of {group_name: exception}), and 'skipped' (a
+        list of groups not attempted).
+
+        """
+
+        group_names = set(self.search_groups(stem + '_*'))
+        if self.group_exists(stem):
+            group_names.add(stem)
+
+        by_depth = defaultdict(list)
+        for group_name in group_names:
+            by_depth[group_name.count('_')].append(group_name)
+        levels = [sorted(by_depth[depth]) for depth in sorted(by_depth, reverse=True)]
+
+        result = {'levels': levels, 'deleted': [], 'failed': {}, 'skipped': []}
+        log.info('{} groups in {} levels'.format(len(group_names), len(levels)))
+        if dry_run:
+            return result
+
+        def failed_descendant(group_name):
+            prefix = group_name + '_'
+            return any(name.startswith(prefix)
+                       for name in chain(result['failed'], result['skipped']))
+
+        for level in levels:
+            todo = []
+            for group_name in level:
+                if failed_descendant(group_name):
+                    result['skipped'].append(group_name)
+                else:
+                    todo.append(group_name)
+
+            for group_name, _, err in imap_concurrent(
+                    self.delete_group, todo, jobs=jobs):
+                if err:
+                    log.error('failed to delete {}: {}'.format(group_name, err))
+                    result['failed'][group_name] = err
+                else:
+                    log.info('deleted group {}'.format(group_name))
+                    result['deleted'].append(group_name)
+
+        return result
+
+    @check_types(group_name=str, jobs=int)
+    def effective_members(self, group_name, jobs=1):
+        """Return a sorted list of ``User`` objects representing members
+        of ``group_name``, replacing members of type 'group' with their members,
+        recursively. Subgroups are fetched one level of nesting at a
+        time, up to ``jobs`` concurrently. Each group is fetched only
+        once, even if it is a member of several groups, and groups
+        that are (directly or indirectly) members of themselves are
+        not expanded again. Raises ``MissingResourceError`` or
+        ``AuthorizationError`` if any subgroup can't be read.
+
+        """
+
+        members = set()
+        seen = {group_name}
+        level = [group_name]
+        while level:
+            subgroups = []
+            results = imap_concurrent(self.get_members, level, jobs=jobs)
+            for parent, group_members, err in results:
+                if err:
+                    raise err
+                for user in group_members:
+                    if user.type != 'group':
+                        members.add(user)
+                    elif user.id in seen:
+                        log.info('{}: subgroup {} was already expanded'.format(
+                            parent, user.id))
+                    else:
+                        seen.add(user.id)
+                        subgroups.append(user.id)
+            log.info('{}: expanding {} subgroups'.format(group_name, len(subgroups)))
+            level = subgroups
+
+        return sorted(members)
+
+    @check_types(group_name=str)
+    def iter_members(self, group_name):
+        """Yield ``User`` objects representing members of ``group_name``
+        as the response is received and decoded, so that memory use
+        does not depend on the size of the group. The membership cache
+        is not used.
+
+        """
+
+        endpoint = path.join('group', group_name, 'member')
+        with self._request('GET', endpoint, headers={'accept': 'application/json'},
+                           stream=True) as response:
+            for member in iter_json_array(response, 'data'):
+                yield User._from_api(member['id'], member.get('type', 'uwnetid'))
+
     @check_types(group_name=str)
     def get_members(self, group_name):
-        """Return a list of uwnetids"""
+        """Return a list of ``User`` objects representing members of
+        ``group_name`` (use ``User.id`` for the member id). If a
+        membership cache is configured, a
+        conditional request is made using the ETag and Last-Modified
+        values from the cached response; if the server reports that
+        the membership is unchanged (304 Not Modified), the cached
+        list is returned without downloading and parsing the
+        membership.
+
+        """
+
+        cache = self.member_cache
         endpoint = path.join('group', group_name, 'member')
-        response = self._request(
-            'GET', endpoint, headers={'accept': 'application/json'})
-        data = json.loads(response)['data']
-        members = [d['id'] for d in data]
+        headers = {'accept': 'application/json'}
+
+        entry = cache.get(self.environment, group_name) if cache else None
+        if entry:
+            if entry.etag:
+                headers['If-None-Match'] = entry.etag
+            if entry.last_modified:
+                headers['If-Modified-Since'] = entry.last_modified
+
+        try:
+            response, body = self._request(
+                'GET', endpoint, headers=headers, expect_status=(200, 304),
+                return_response=True)
+        except MissingResourceError:
+            self.group_cache.put(group_name, None)
+            if entry:
+                cache.invalidate(self.environment, group_name)
+            raise
+
+        if response.status == 304:
+            if not entry:
+                raise APIError(f'unexpected 304 response for {endpoint}')
+            log.info(f'{group_name}: membership unchanged, using cached data')
+            cache.validated(self.environment, group_name)
+            return [User._from_api(*m) for m in entry.members]
+
+        content = json.loads(body)
+        members = [User._from_api(d['id'], d.get('type', 'uwnetid'))
+                   for d in content['data']]
+
+        if cache:
+            cache.put(
+                self.environment, group_name, members,
+                etag=response.getheader('ETag'),
+                last_modified=response.getheader('Last-Modified'),
+                regid=content.get('meta', {}).get('regid'))
+
         return members
 
-    @check_types(group_name=str, members=list, batchsize=int)
-    def add_members(self, group_name, members, batchsize=50):
+    def _invalidate_members(self, group_name):
+        if self.member_cache:
+            self.member_cache.invalidate(self.environment, group_name)
+
+    def _modify_members(self, method, group_name, members, batchsize,
+                        on_batch=None):
+        """Add (``method='PUT'``) or remove (``method='DELETE'``) members in
+        batches. Each batch is limited by ``self.max_url_length`` and
+        contains at most ``batchsize`` members, or a number determined
+        by ``self.batch_sizer`` if ``batchsize`` is None. A batch that
+        fails with an error other than a missing group or an
+        authorization failure is retried with half as many members.
+        If provided, ``on_batch`` is called with the list of members in
+        each batch once it has succeeded.
+
+        """
+
+        prefix = path.join(API_PATH, 'group', group_name, 'member', '')
+        max_length = self.max_url_length - len(prefix)
+        sizer = self.batch_sizer
+
+        try:
+            start = 0
+            while start < len(members):
+                window = members[start:start + (batchsize or sizer.size)]
+                count = pack_count(window, max_length)
+                chunk = members[start:start + count]
+                endpoint = path.join('group', group_name, 'member', ','.join(chunk))
+                started = time.monotonic()
+                try:
+                    self._request(method, endpoint)
+                except (MissingResourceError, AuthorizationError):
+                    raise
+                except APIError as err:
+                    if batchsize or count == 1:
+                        raise
+                    sizer.failure(count)
+                    log.warning('{} {} members of {} failed ({}); retrying with '
+                                'batch size {}'.format(
+                                    method, count, group_name, err, sizer.size))
+                    continue
+                elapsed = time.monotonic() - started
+                if on_batch:
+                    on_batch(chunk)
+                if not batchsize:
+                    sizer.success(count, elapsed)
+                log.debug('{} {}: {} members in {:.3f}s; next batch size {}'.format(
+                    method, group_name, count, elapsed, batchsize or sizer.size))
+                start += count
+        finally:
+            self.group_cache.invalidate(group_name)
+            self._invalidate_members(group_name)
+
+    @check_types(group_name=str, members=list, batchsize=(int, type(None)))
+    def add_members(self, group_name, members, batchsize=None, on_batch=None):
         """Add uwnetids in list ``members`` to the specified group in batches
-        of size ``batchsize``.
+        of size ``batchsize``. If ``batchsize`` is None, the size of
+        each batch is chosen adaptively (see ``UWGroups``). If provided,
+        ``on_batch`` is called with the members of each completed batch.
 
         """
-        for chunk in grouper(members, batchsize):
-            endpoint = path.join('group', group_name, 'member', ','.join(chunk))
-            self._request('PUT', endpoint)
+        self._modify_members('PUT', group_name, members, batchsize, on_batch)
 
-    @check_types(group_name=str, members=list, batchsize=int)
-    def delete_members(self, group_name, members, batchsize=50):
+    @check_types(group_name=str, members=list, batchsize=(int, type(None)))
+    def delete_members(self, group_name, members, batchsize=None, on_batch=None):
         """Remove uwnetids in list ``members`` from the specified group in
-        batches of size ``batchsize``.
+        batches of size ``batchsize``. If ``batchsize`` is None, the
+        size of each batch is chosen adaptively (see ``UWGroups``). If
+        provided, ``on_batch`` is called with the members of each
+        completed batch.
 
         """
-        for chunk in grouper(members, batchsize):
-            endpoint = path.join('group', group_name, 'member', ','.join(chunk))
-            self._request('DELETE', endpoint)
+        self._modify_members('DELETE', group_name, members, batchsize, on_batch)
 
     @check_types(group_name=str, members=list)
-    def sync_members(self, group_name, members, batchsize=50, dry_run=False):
-        """Add or remove users from the specified group as necessary so that
-        the group contains ``members`` (a list or uwnetids). When
-        ``dry_run`` is True, log the necessary actions but don't
-        modify the group. The group is created if it does not already
-        exist.
+    def plan_members(self, group_name, members):
+        """Return a dict describing the changes needed for the specified
+        group to contain ``members`` (a list of member ids or ``User``
+        objects) without modifying the group. The dict has keys 'group'
+        (the group name), 'create' (True if the group does not exist),
+        and 'add' and 'remove' (sorted lists of member ids). Members are
+        compared as described for ``member_changes()``. See
+        ``apply_plan()``.
 
         """
 
-        desired_members = set(members)
-
         try:
             current_members = set(self.get_members(group_name))
         except MissingResourceError:
-            self.reset()
             current_members = set()
+            create = True
+        else:
+            create = False
+
+        log.info('{} current members'.format(len(current_members)))
+        log.debug('current members: {}'.format(current_members))
+        add, remove = member_changes(group_name, current_members, members)
+
+        return {'group': group_name, 'create': create,
+                'add': add, 'remove': remove}
+
+    @check_types(plan=dict)
+    def apply_plan(self, plan, batchsize=None, dry_run=False, on_batch=None):
+        """Make the changes described in ``plan``, a dict as returned by
+        ``plan_members()``: create the group if necessary, then add
+        and remove members in batches (see ``add_members()``). When
+        ``dry_run`` is True, log the changes but don't make them. If
+        provided, ``on_batch`` is called with arguments ('add' or
+        'remove', members) as each batch is completed.
+
+        """
+
+        group_name = plan['group']
+
+        if plan.get('create'):
             log.warning('creating group {}'.format(group_name))
             if not dry_run:
                 self.create_group(group_name)
 
-        log.info('{} current members'.format(len(current_members)))
-        log.debug('current members: {}'.format(current_members))
-        to_add, to_delete = reconcile(current_members, desired_members)
+        to_add, to_delete = plan.get('add'), plan.get('remove')
 
         if to_add:
             log.info('[+] {}: {}'.format(group_name, ','.join(to_add)))
             if not dry_run:
-                self.add_members(group_name, sorted(to_add), batchsize=batchsize)
+                self.add_members(
+                    group_name, to_add, batchsize=batchsize,
+                    on_batch=on_batch and functools.partial(on_batch, 'add'))
 
         if to_delete:
             log.info('[-] {}: {}'.format(group_name, ','.join(to_delete)))
             if not dry_run:
                 self.delete_members(
-                    group_name, sorted(to_delete), batchsize=batchsize)
+                    group_name, to_delete, batchsize=batchsize,
+                    on_batch=on_batch and functools.partial(on_batch, 'remove'))
+
+    @check_types(group_name=str, members=list)
+    def sync_members(self, group_name, members, batchsize=None, dry_run=False):
+        """Add or remove users from the specified group as necessary so that
+        the group contains ``members`` (a list of member ids or
+        ``User`` objects, compared as described for
+        ``member_changes()``). When ``dry_run`` is True, log the
+        necessary actions but don't modify the group. The group is
+        created if it does not already exist.
+
+        """
+
+        plan = self.plan_members(group_name, members)
+        self.apply_plan(plan, batchsize=batchsize, dry_run=dry_run)
+        return plan
 
     @check_types(group_name=str, service=str, active=bool)
     def set_affiliate(self, group_name, service, active=True):
@@ -375,15 +1072,54 @@ class UWGroups(object):
 
         """
 
-        services = {'exchange': 'email', 'google': 'google'}
-        if service not in services:
+        if service not in AFFILIATES:
             raise ValueError('service must be one of {}'.format(
-                list(services.keys())))
-        endpoint = path.join('group', group_name, 'affiliate', services[service])
+                list(AFFILIATES.keys())))
+        endpoint = path.join('group', group_name, 'affiliate', AFFILIATES[service])
         endpoint += '?status=' + ('active' if active else 'inactive')
-        response = self._request('PUT', endpoint)
+        try:
+            response = self._request('PUT', endpoint)
+        finally:
+            self.group_cache.invalidate(group_name)
         return response
 
+    @check_types(group_name=str)
+    def get_affiliates(self, group_name):
+        """Return a dict of {service: active} (see ``set_affiliate()``)
+        describing the affiliates of the specified group; services that
+        have never been activated are reported as inactive.
+
+        """
+
+        names = {name: service for service, name in AFFILIATES.items()}
+        data = self.get_group(group_name)['data']
+        affiliates = dict.fromkeys(AFFILIATES, False)
+        for affiliate in data.get('affiliates', []):
+            if affiliate.get('name') in names:
+                affiliates[names[affiliate['name']]] = affiliate.get('status') == 'active'
+        return affiliates
+
+    @check_types(group_name=str, affiliates=dict)
+    def sync_affiliates(self, group_name, affiliates, current=None):
+        """Call ``set_affiliate()`` for each item in ``affiliates``, a dict
+        of {service: active}, for which the group's current state
+        differs. The current state is read using ``get_affiliates()``
+        unless provided as ``current`` (for example, ``{}`` for a group
+        that was just created, which has no active affiliates). Returns
+        a list of the services that were changed.
+
+        """
+
+        if current is None:
+            current = self.get_affiliates(group_name)
+
+        changed = []
+        for service, active in sorted(affiliates.items()):
+            if current.get(service, False) != active:
+                self.set_affiliate(group_name, service, active=active)
+                changed.append(service)
+        return changed
+
     @check_types(netid=str)
     def search_user(self, netid):
         """Return groups in which `netid` is a member
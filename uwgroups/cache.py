@@ -0,0 +1,287 @@
+"""Caches of group metadata and membership"""
+
+import copy
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple, OrderedDict
+from os import path
+
+from uwgroups import cache_var_name
+
+log = logging.getLogger(__name__)
+
+CacheEntry = namedtuple(
+    'CacheEntry', ['members', 'etag', 'last_modified', 'regid', 'validated'])
+CacheEntry.__doc__ = """A cached membership list. ``members`` is a list of
+(id, type) tuples; ``validated`` is the time (seconds since the epoch)
+at which the list was last fetched or confirmed by the server."""
+
+
+def default_cache_file():
+    """Return the path to the membership cache, either from the
+    environment variable UWGROUPS_CACHE or in the user's cache
+    directory.
+
+    """
+
+    if cache_var_name in os.environ:
+        return os.environ[cache_var_name]
+
+    cache_home = os.environ.get('XDG_CACHE_HOME') or path.expanduser('~/.cache')
+    return path.join(cache_home, 'uwgroups', 'members.db')
+
+
+class MembershipCache(object):
+    """Cache of group membership lists stored in an sqlite database at
+    ``filename``, keyed by API environment and group name. Each entry
+    retains the ETag and Last-Modified headers and the regid reported
+    by the server so that the membership can be revalidated using a
+    conditional request.
+
+    Entries that have not been validated within ``ttl`` seconds are
+    ignored. When the total size of stored membership lists exceeds
+    ``max_size`` bytes, the least recently used entries are
+    evicted. The cache may be shared by multiple threads.
+
+    Since the cache contains group membership, the database is
+    readable only by its owner (and its directory, if created, is
+    accessible only by its owner).
+
+    """
+
+    def __init__(self, filename=None, ttl=7 * 24 * 3600, max_size=256 * 2 ** 20):
+        self.filename = filename or default_cache_file()
+        self.ttl = ttl
+        self.max_size = max_size
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        dirname = path.dirname(self.filename)
+        if dirname:
+            os.makedirs(dirname, mode=0o700, exist_ok=True)
+        os.close(os.open(self.filename, os.O_WRONLY | os.O_CREAT, 0o600))
+        try:
+            # restrict a database created by an earlier version
+            os.chmod(self.filename, 0o600)
+        except OSError as err:
+            log.warning('could not restrict permissions of {}: {}'.format(
+                self.filename, err))
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            self.filename, timeout=30, check_same_thread=False)
+        with self._db:
+            self._db.execute("""
+            create table if not exists members (
+              environment text,
+              group_name text,
+              members text,
+              etag text,
+              last_modified text,
+              regid text,
+              validated real,
+              accessed real,
+              size integer,
+              primary key (environment, group_name)
+            )""")
+
+    def close(self):
+        self._db.close()
+
+    def get(self, environment, group_name):
+        """Return a ``CacheEntry`` or None if the group is not cached or
+        the entry has expired.
+
+        """
+
+        with self._lock:
+            row = self._db.execute(
+                'select members, etag, last_modified, regid, validated '
+                'from members where environment = ? and group_name = ?',
+                (environment, group_name)).fetchone()
+
+            if row is None or time.time() - row[-1] > self.ttl:
+                self.misses += 1
+                return None
+
+            with self._db:
+                self._db.execute(
+                    'update members set accessed = ? '
+                    'where environment = ? and group_name = ?',
+                    (time.time(), environment, group_name))
+
+        members = [tuple(line.split('\t', 1)) for line in row[0].splitlines()]
+        return CacheEntry(members, *row[1:])
+
+    def put(self, environment, group_name, members, etag=None,
+            last_modified=None, regid=None):
+        """Store ``members``, a list of (id, type) tuples"""
+
+        text = '\n'.join('{}\t{}'.format(*m) for m in members)
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                'insert or replace into members values (?,?,?,?,?,?,?,?,?)',
+                (environment, group_name, text, etag, last_modified, regid,
+                 now, now, len(text)))
+            self._evict()
+
+    def validated(self, environment, group_name):
+        """Record that the cached entry was confirmed by the server"""
+
+        now = time.time()
+        with self._lock, self._db:
+            self.hits += 1
+            self._db.execute(
+                'update members set validated = ?, accessed = ? '
+                'where environment = ? and group_name = ?',
+                (now, now, environment, group_name))
+
+    def invalidate(self, environment, group_name):
+        """Remove the entry for a single group"""
+
+        with self._lock, self._db:
+            self._db.execute(
+                'delete from members where environment = ? and group_name = ?',
+                (environment, group_name))
+
+    def clear(self):
+        with self._lock, self._db:
+            self._db.execute('delete from members')
+
+    def _evict(self):
+        # caller must hold the lock and a transaction
+        total, = self._db.execute(
+            'select coalesce(sum(size), 0) from members').fetchone()
+        if total <= self.max_size:
+            return
+
+        rows = self._db.execute(
+            'select environment, group_name, size from members '
+            'order by accessed').fetchall()
+        for environment, group_name, size in rows:
+            if total <= self.max_size:
+                break
+            self._db.execute(
+                'delete from members where environment = ? and group_name = ?',
+                (environment, group_name))
+            total -= size
+            self.evictions += 1
+
+    def stats(self):
+        """Return a dict of cache counters"""
+        with self._lock:
+            entries, size = self._db.execute(
+                'select count(*), coalesce(sum(size), 0) from members').fetchone()
+            return {'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions, 'entries': entries,
+                    'size': size}
+
+
+# markers for GroupCache entries without metadata
+_EXISTS = object()
+_NOT_FOUND = object()
+
+
+class GroupCache(object):
+    """In-memory cache of group metadata (the deserialized response
+    for a group) keyed by group name, including groups that do not
+    exist (stored as None) and groups known to exist for which no
+    metadata is available (see ``put_exists()``). At most
+    ``maxsize`` entries are retained, discarding the least recently
+    used; entries expire after ``ttl`` seconds. A ``ttl`` of 0
+    disables the cache. The cache may be shared by multiple threads.
+
+    """
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, group_name):
+        """Return a tuple (cached, data): ``cached`` is False if there is
+        no unexpired entry for ``group_name``; otherwise ``data`` is a
+        copy of the group data, or None if the group does not exist.
+
+        """
+
+        with self._lock:
+            entry = self._lookup(group_name)
+            if entry is None or entry is _EXISTS:
+                self.misses += 1
+                return False, None
+            self.hits += 1
+            return True, None if entry is _NOT_FOUND else copy.deepcopy(entry)
+
+    def exists(self, group_name):
+        """Return True or False if ``group_name`` is known to exist or
+        not to exist, or None if there is no unexpired entry.
+
+        """
+
+        with self._lock:
+            entry = self._lookup(group_name)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry is not _NOT_FOUND
+
+    def _lookup(self, group_name):
+        # caller must hold the lock
+        entry = self._entries.get(group_name)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        self._entries.move_to_end(group_name)
+        return entry[1]
+
+    def put(self, group_name, data):
+        """Store ``data`` for ``group_name``, or record that the group
+        does not exist if ``data`` is None.
+
+        """
+
+        self._put(group_name, _NOT_FOUND if data is None else copy.deepcopy(data))
+
+    def put_exists(self, group_name):
+        """Record that ``group_name`` exists (for example, after creating
+        it) without storing its metadata
+
+        """
+
+        self._put(group_name, _EXISTS)
+
+    def _put(self, group_name, value):
+        if not self.ttl:
+            return
+
+        with self._lock:
+            self._entries[group_name] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(group_name)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, group_name):
+        with self._lock:
+            self._entries.pop(group_name, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Return a dict of cache counters"""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'entries': len(self._entries)}
@@ -0,0 +1,281 @@
+"""Serve ``UWGroups`` methods over a local Unix socket
+
+A long-running process (``uwgroups serve``) keeps a single
+``UWGroups`` object, and therefore its pool of authenticated
+connections, warm between invocations of short-lived clients. Clients
+connect to the socket using ``DaemonClient``, which provides the
+methods in ``EXPORTED`` with the same signatures as ``UWGroups``.
+
+The protocol is newline-delimited JSON: each request is an object
+{"method": name, "args": [...], "kwargs": {...}}, answered by either
+{"result": value} or {"error": {"type": name, "message": message}}.
+Several requests may be sent over one connection. Exceptions raised
+by the server are raised again by the client with the same type if
+it is one of the exceptions defined in ``uwgroups.models``, or
+``ValueError`` or ``TypeError``; other exceptions are raised as
+``APIError``.
+
+The socket is created with permissions allowing only its owner to
+connect, since any client can act using the server's certificate.
+"""
+
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+from os import path
+
+from uwgroups import socket_var_name
+from uwgroups.models import APIError, MissingResourceError, AuthorizationError, User
+
+log = logging.getLogger(__name__)
+
+# UWGroups methods available to clients
+EXPORTED = {
+    'group_exists', 'get_group', 'create_group', 'create_groups',
+    'delete_group', 'get_members', 'effective_members', 'add_members',
+    'delete_members', 'plan_members', 'apply_plan', 'sync_members',
+    'set_affiliate', 'get_affiliates', 'sync_affiliates', 'search_user',
+    'search_groups',
+}
+
+# methods returning a list of User objects
+_MEMBER_METHODS = {'get_members', 'effective_members'}
+
+# default number of seconds a client waits for a response
+CLIENT_TIMEOUT = 120
+
+
+def socket_path(environment):
+    """Return the path to the socket of the server for ``environment``:
+    the value of the environment variable UWGROUPS_SOCKET if defined,
+    otherwise a file in ~/.cache/uwgroups.
+
+    """
+
+    if os.environ.get(socket_var_name):
+        return os.environ[socket_var_name]
+    return path.join(path.expanduser('~'), '.cache', 'uwgroups',
+                     'daemon-{}.sock'.format(environment))
+
+
+def _encode(obj):
+    if isinstance(obj, (set, frozenset)):
+        return sorted(obj)
+    if isinstance(obj, Exception):
+        return '{}: {}'.format(type(obj).__name__, obj)
+    raise TypeError('{} is not serializable'.format(type(obj).__name__))
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                method = request['method']
+                response = {'result': self.server.call(
+                    method, request.get('args', []), request.get('kwargs', {}))}
+            except Exception as err:
+                log.info('{}: {}'.format(type(err).__name__, err))
+                response = {'error': {'type': type(err).__name__,
+                                      'message': str(err)}}
+            self.wfile.write(json.dumps(response, default=_encode).encode() + b'\n')
+            self.wfile.flush()
+
+
+class Daemon(socketserver.ThreadingUnixStreamServer):
+    """Serve the methods in ``EXPORTED`` of ``UWGroups`` object ``conn``
+    on a Unix socket at ``filename``; each client connection is
+    handled in a separate thread. A stale socket file left by a server
+    that is no longer running is replaced; ``OSError`` is raised if
+    another server is listening at ``filename``. Call
+    ``serve_forever()`` to handle requests and ``shutdown()`` (from
+    another thread) to stop; the socket file is removed by
+    ``server_close()``.
+
+    """
+
+    daemon_threads = True
+
+    def __init__(self, conn, filename):
+        self.conn = conn
+        self.filename = filename
+        self.requests = 0
+        self._lock = threading.Lock()
+
+        dirname = path.dirname(filename)
+        if dirname:
+            os.makedirs(dirname, mode=0o700, exist_ok=True)
+        if path.exists(filename):
+            if DaemonClient.available(filename):
+                raise OSError('a server is already listening at {}'.format(filename))
+            os.remove(filename)
+
+        umask = os.umask(0o177)
+        try:
+            super().__init__(filename, _Handler)
+        finally:
+            os.umask(umask)
+
+    def call(self, method, args, kwargs):
+        with self._lock:
+            self.requests += 1
+        if method == 'ping':
+            return self.info()
+        if method not in EXPORTED:
+            raise ValueError('unsupported method "{}"'.format(method))
+        return getattr(self.conn, method)(*args, **kwargs)
+
+    def info(self):
+        """Return a dict describing the server"""
+        conn = self.conn
+        return {'pid': os.getpid(), 'environment': conn.environment,
+                'certfile': path.abspath(conn.certfile),
+                'keyfile': conn.keyfile and path.abspath(conn.keyfile),
+                'requests': self.requests, 'pool': conn.pool.stats()}
+
+    def server_close(self):
+        super().server_close()
+        if path.exists(self.filename):
+            os.remove(self.filename)
+
+
+class DaemonClient(object):
+    """Client of a ``Daemon`` listening at ``filename``. Methods in
+    ``EXPORTED`` are forwarded to the server and have the same
+    signatures as the corresponding ``UWGroups`` methods (arguments
+    must be serializable as JSON). Each thread uses its own
+    connection to the server, so a client may be shared by threads.
+    A call raises ``socket.timeout`` if the server does not respond
+    within ``timeout`` seconds (None to wait indefinitely).
+
+    """
+
+    def __init__(self, filename, timeout=CLIENT_TIMEOUT):
+        self.filename = filename
+        self.timeout = timeout
+        self._local = threading.local()
+        self._sockets = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def available(cls, filename):
+        """Return True if a server is accepting connections at ``filename``"""
+        if not path.exists(filename):
+            return False
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(filename)
+        except OSError:
+            return False
+        finally:
+            sock.close()
+        return True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        with self._lock:
+            for sock, fobj in self._sockets:
+                fobj.close()
+                sock.close()
+            self._sockets = []
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.filename)
+            conn = self._local.conn = (sock, sock.makefile('rb'))
+            with self._lock:
+                self._sockets.append(conn)
+        return conn
+
+    def call(self, method, *args, **kwargs):
+        """Call ``method`` on the server and return the result"""
+        sock, fobj = self._connection()
+        request = {'method': method, 'args': args, 'kwargs': kwargs}
+        sock.sendall(json.dumps(request).encode() + b'\n')
+        line = fobj.readline()
+        if not line:
+            raise APIError('connection to {} was closed'.format(self.filename))
+        response = json.loads(line)
+
+        if 'error' in response:
+            error = response['error']
+            exc_type = {
+                'APIError': APIError,
+                'MissingResourceError': MissingResourceError,
+                'AuthorizationError': AuthorizationError,
+                'ValueError': ValueError,
+                'TypeError': TypeError,
+            }.get(error['type'])
+            if exc_type:
+                raise exc_type(error['message'])
+            raise APIError('{}: {}'.format(error['type'], error['message']))
+
+        result = response['result']
+        if method in _MEMBER_METHODS:
+            result = [User._from_api(*member) for member in result]
+        return result
+
+    def ping(self):
+        """Return a dict describing the server"""
+        return self.call('ping')
+
+    @property
+    def environment(self):
+        return self.ping()['environment']
+
+    def __getattr__(self, name):
+        if name in EXPORTED:
+            return lambda *args, **kwargs: self.call(name, *args, **kwargs)
+        raise AttributeError(name)
+
+
+def daemon_client(environment, certfile=None, keyfile=None,
+                  timeout=CLIENT_TIMEOUT):
+    """Return a ``DaemonClient`` connected to a server for
+    ``environment`` at ``socket_path(environment)``, or None if no such
+    server is running. If ``certfile`` is provided, None is also
+    returned unless the server uses the same ``certfile`` and
+    ``keyfile``, since requests made through the server act with the
+    identity of its certificate.
+
+    """
+
+    filename = socket_path(environment)
+    if not DaemonClient.available(filename):
+        return None
+
+    client = DaemonClient(filename, timeout=timeout)
+    try:
+        info = client.ping()
+    except Exception as err:
+        log.warning('server at {} is not responding: {}'.format(filename, err))
+        client.close()
+        return None
+
+    if info['environment'] != environment:
+        log.warning('server at {} uses environment {}'.format(
+            filename, info['environment']))
+        client.close()
+        return None
+
+    if certfile and (path.abspath(certfile), keyfile and path.abspath(keyfile)) != \
+       (info.get('certfile'), info.get('keyfile')):
+        log.info('server at {} uses a different certificate'.format(filename))
+        client.close()
+        return None
+
+    log.info('using server at {} (pid {})'.format(filename, info['pid']))
+    return client
@@ -0,0 +1,141 @@
+"""Local index of group membership for offline lookups"""
+
+import logging
+import os
+import sqlite3
+import time
+
+from uwgroups.utils import imap_concurrent
+
+log = logging.getLogger(__name__)
+
+
+class MembershipIndex(object):
+    """Index of group membership stored in an sqlite database at
+    ``filename``, supporting lookups of the members of a group and of
+    the groups to which a member belongs. Members are stored as they
+    appear in the API (groups that are members of other groups are not
+    expanded). Use ``export_index()`` to create an index.
+
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._db = sqlite3.connect(filename)
+        with self._db:
+            self._db.executescript("""
+            create table if not exists meta (
+              key text primary key,
+              value text
+            );
+            create table if not exists groups (
+              group_name text primary key,
+              member_count integer
+            );
+            create table if not exists members (
+              group_name text,
+              member_id text,
+              member_type text
+            );
+            create index if not exists members_member_id
+              on members (member_id);
+            create index if not exists members_group_name
+              on members (group_name);
+            """)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._db.close()
+
+    def add_group(self, group_name, members):
+        """Store ``members`` (a list of ``User`` objects) of ``group_name``,
+        replacing any existing entry; changes are visible to other
+        connections after ``commit()``.
+
+        """
+
+        self._db.execute('delete from members where group_name = ?', (group_name,))
+        self._db.execute('insert or replace into groups values (?, ?)',
+                         (group_name, len(members)))
+        self._db.executemany('insert into members values (?, ?, ?)',
+                             ((group_name, user.id, user.type) for user in members))
+
+    def commit(self):
+        self._db.commit()
+
+    def set_meta(self, **kwargs):
+        with self._db:
+            self._db.executemany('insert or replace into meta values (?, ?)',
+                                 [(k, str(v)) for k, v in kwargs.items()])
+
+    def meta(self):
+        """Return a dict of metadata describing the index"""
+        return dict(self._db.execute('select key, value from meta'))
+
+    def groups(self):
+        """Return a sorted list of indexed groups"""
+        return [name for name, in self._db.execute(
+            'select group_name from groups order by group_name')]
+
+    def groups_for(self, member_id):
+        """Return a sorted list of indexed groups containing ``member_id``"""
+        return [name for name, in self._db.execute(
+            'select group_name from members where member_id = ? '
+            'order by group_name', (member_id,))]
+
+    def members_of(self, group_name):
+        """Return a sorted list of members of ``group_name``, or None if
+        the group is not in the index
+
+        """
+
+        if not self._db.execute('select 1 from groups where group_name = ?',
+                                (group_name,)).fetchone():
+            return None
+        return [member_id for member_id, in self._db.execute(
+            'select member_id from members where group_name = ? '
+            'order by member_id', (group_name,))]
+
+
+def export_index(conn, patterns, filename, jobs=1):
+    """Create an index at ``filename`` containing the membership of
+    all groups matching any of ``patterns`` (see
+    ``UWGroups.search_groups()``) using ``UWGroups`` object ``conn``,
+    fetching the membership of up to ``jobs`` groups concurrently. The
+    index is written to a temporary file that replaces ``filename``
+    once complete. Returns a dict of {group_name: exception} for
+    groups that could not be read.
+
+    """
+
+    group_names = sorted({name for pattern in patterns
+                          for name in conn.search_groups(pattern)})
+    log.info('exporting membership of {} groups'.format(len(group_names)))
+
+    tmpfile = filename + '.tmp'
+    if os.path.exists(tmpfile):
+        os.remove(tmpfile)
+
+    failures = {}
+    with MembershipIndex(tmpfile) as index:
+        index.set_meta(environment=conn.environment, patterns=' '.join(patterns),
+                       created=time.strftime('%Y-%m-%dT%H:%M:%S'))
+        results = imap_concurrent(conn.get_members, group_names, jobs=jobs)
+        for i, (group_name, members, err) in enumerate(results, 1):
+            if err:
+                log.error('failed to read {}: {}'.format(group_name, err))
+                failures[group_name] = err
+                continue
+            index.add_group(group_name, members)
+            if i % 1000 == 0:
+                index.commit()
+                log.info('{} of {} groups'.format(i, len(group_names)))
+        index.commit()
+
+    os.replace(tmpfile, filename)
+    return failures
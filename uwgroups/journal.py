@@ -0,0 +1,197 @@
+"""Write-ahead journal allowing interrupted synchronizations to resume"""
+
+import functools
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+
+def members_digest(members):
+    """Return a digest identifying the set of member ids in ``members``
+    (a list of ids or ``User`` objects), independent of order
+
+    """
+
+    ids = sorted({getattr(m, 'id', m) for m in members})
+    return hashlib.sha1('\n'.join(ids).encode('utf-8')).hexdigest()
+
+
+class SyncJournal(object):
+    """Newline-delimited JSON journal of the synchronization of groups
+    stored in ``filename``. Before a group is modified, its plan (see
+    ``UWGroups.plan_members()``) is recorded, followed by each batch
+    of members once it has been added or removed, and finally the
+    outcome ('done' or 'failed'). Each record identifies the desired
+    membership of the group by a digest of its members so that changes
+    to the groupfile between runs are detected.
+
+    Use ``sync_members()`` to synchronize a group while recording its
+    progress. When an existing journal is opened, groups recorded as done with
+    the same members are skipped (``is_done()``), and a group that was
+    interrupted resumes from its recorded plan without the batches
+    already applied (``pending_plan()``). A partial record at the end
+    of the file (for example, if the process was killed while writing)
+    is ignored. Records are flushed as they are written; if ``sync``
+    is True they are also written to disk using ``os.fsync()``.
+
+    """
+
+    def __init__(self, filename, sync=False):
+        self.filename = filename
+        self.sync = sync
+        self.done = {}
+        self.plans = {}
+        self.applied = {}
+        self.failed = {}
+        self._lock = threading.Lock()
+        self._complete = True
+
+        if os.path.exists(filename):
+            self._load()
+            log.info('journal {}: {} group(s) done, {} in progress, {} failed'.format(
+                filename, len(self.done), len(self.plans), len(self.failed)))
+
+        self._fobj = open(filename, 'a')
+        if self._fobj.tell() and not self._complete:
+            # terminate a partial record
+            self._fobj.write('\n')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._fobj.close()
+
+    def _load(self):
+        self._complete = True
+        with open(self.filename) as f:
+            for lineno, line in enumerate(f, 1):
+                self._complete = line.endswith('\n')
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    log.warning('{}: ignoring invalid record on line {}'.format(
+                        self.filename, lineno))
+                    continue
+                self._replay(record)
+
+    def _replay(self, record):
+        event, group_name = record['event'], record['group']
+        if event == 'plan':
+            self.plans[group_name] = (record['digest'], record['plan'])
+            self.applied[group_name] = {'add': set(), 'remove': set()}
+            self.done.pop(group_name, None)
+        elif event == 'batch':
+            applied = self.applied.setdefault(
+                group_name, {'add': set(), 'remove': set()})
+            applied[record['op']].update(record['members'])
+        elif event == 'done':
+            self.done[group_name] = record['digest']
+            self.failed.pop(group_name, None)
+            self.plans.pop(group_name, None)
+            self.applied.pop(group_name, None)
+        elif event == 'failed':
+            self.failed[group_name] = record['error']
+
+    def _write(self, **record):
+        record['time'] = round(time.time(), 3)
+        line = json.dumps(record) + '\n'
+        with self._lock:
+            self._fobj.write(line)
+            self._fobj.flush()
+            if self.sync:
+                os.fsync(self._fobj.fileno())
+            self._replay(record)
+
+    def is_done(self, group_name, digest):
+        """Return True if ``group_name`` was synchronized with members
+        identified by ``digest``
+
+        """
+
+        return self.done.get(group_name) == digest
+
+    def pending_plan(self, group_name, digest):
+        """Return the remaining part of an interrupted plan for
+        ``group_name`` with members identified by ``digest``, or None if
+        there is no such plan
+
+        """
+
+        digest_, plan = self.plans.get(group_name, (None, None))
+        if digest_ != digest:
+            return None
+
+        applied = self.applied[group_name]
+        return dict(
+            plan,
+            create=plan['create'] and not (applied['add'] or applied['remove']),
+            add=[m for m in plan['add'] if m not in applied['add']],
+            remove=[m for m in plan['remove'] if m not in applied['remove']])
+
+    def plan(self, group_name, digest, plan):
+        """Record ``plan`` before it is applied"""
+        self._write(event='plan', group=group_name, digest=digest, plan=plan)
+
+    def batch(self, group_name, op, members):
+        """Record that ``members`` were added to (``op='add'``) or removed
+        from (``op='remove'``) ``group_name``
+
+        """
+
+        self._write(event='batch', group=group_name, op=op, members=members)
+
+    def finish(self, group_name, digest):
+        self._write(event='done', group=group_name, digest=digest)
+
+    def fail(self, group_name, digest, err):
+        self._write(event='failed', group=group_name, digest=digest,
+                    error='{}: {}'.format(type(err).__name__, err))
+
+    def sync_members(self, conn, group_name, members, dry_run=False):
+        """Synchronize ``group_name`` using ``UWGroups`` object ``conn``
+        (see ``UWGroups.sync_members()``), recording progress in the
+        journal. Returns False if the group was skipped because it was
+        already synchronized, otherwise True. When ``dry_run`` is True,
+        nothing is recorded.
+
+        """
+
+        digest = members_digest(members)
+        if self.is_done(group_name, digest):
+            log.info('{}: already synchronized'.format(group_name))
+            return False
+
+        plan = self.pending_plan(group_name, digest)
+        if plan:
+            log.info('{}: resuming ({} to add, {} to remove)'.format(
+                group_name, len(plan['add']), len(plan['remove'])))
+        else:
+            try:
+                plan = conn.plan_members(group_name, members)
+            except Exception as err:
+                if not dry_run:
+                    self.fail(group_name, digest, err)
+                raise
+            if not dry_run:
+                self.plan(group_name, digest, plan)
+
+        if dry_run:
+            conn.apply_plan(plan, dry_run=True)
+            return True
+
+        try:
+            conn.apply_plan(plan, on_batch=functools.partial(self.batch, group_name))
+        except Exception as err:
+            self.fail(group_name, digest, err)
+            raise
+        self.finish(group_name, digest)
+        return True
@@ -0,0 +1,221 @@
+"""Request metrics and tracing hooks"""
+
+import bisect
+import logging
+import re
+import threading
+from collections import Counter, defaultdict
+
+log = logging.getLogger(__name__)
+
+# upper bounds (seconds) of latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30,
+                   float('inf'))
+
+
+def endpoint_template(endpoint):
+    """Return a tuple (template, group_name) for an API endpoint, where
+    ``template`` replaces group names and member ids with
+    placeholders so that requests to the same kind of resource can be
+    aggregated, for example::
+
+        >>> endpoint_template('group/u_foo/member/a,b')
+        ('group/{group}/member/{ids}', 'u_foo')
+        >>> endpoint_template('search?member=netid')
+        ('search?member', None)
+
+    """
+
+    resource, _, query = endpoint.partition('?')
+    parts = resource.split('/')
+    group_name = None
+    if parts[0] == 'group' and len(parts) > 1:
+        group_name = parts[1]
+        parts[1] = '{group}'
+        if len(parts) > 3 and parts[2] == 'member':
+            parts[3] = '{ids}'
+    template = '/'.join(parts)
+    if query:
+        template += '?' + ','.join(re.findall(r'([^&=]+)=', query))
+    return template, group_name
+
+
+class Histogram(object):
+    """Counts of observations in fixed buckets"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Return the upper bound of the bucket containing quantile
+        ``q`` (or the maximum observation if smaller)
+
+        """
+
+        if not self.count:
+            return None
+        threshold = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= threshold:
+                return min(bound, self.max)
+        return self.max
+
+
+class Metrics(object):
+    """Collects statistics describing requests made by one or more
+    ``UWGroups`` objects (pass as ``UWGroups(metrics=...)``).
+
+    Statistics are aggregated by endpoint template (see
+    ``endpoint_template()``): request count, latency histogram, bytes
+    sent and received, and errors. Retries, TLS handshakes, error
+    classes and the total time spent on requests for each group are
+    also recorded.
+
+    Each event is also passed to the callables in ``callbacks`` as
+    keyword arguments; the 'event' argument is one of 'request',
+    'retry' or 'handshake'. For example, to trace every request::
+
+        metrics = Metrics(callbacks=[lambda **kw: print(kw)])
+
+    Callbacks are invoked in the thread making the request and must
+    be thread-safe.
+
+    """
+
+    def __init__(self, callbacks=None):
+        self.callbacks = list(callbacks or [])
+        self.endpoints = defaultdict(lambda: {
+            'latency': Histogram(), 'sent': 0, 'received': 0, 'errors': 0})
+        self.group_time = Counter()
+        self.errors = Counter()
+        self.retries = 0
+        self.handshakes = 0
+        self.resumed_handshakes = 0
+        self._lock = threading.Lock()
+
+    def _emit(self, **kwargs):
+        for callback in self.callbacks:
+            try:
+                callback(**kwargs)
+            except Exception as err:
+                log.warning('metrics callback {!r} failed: {}'.format(callback, err))
+
+    def request(self, method, endpoint, elapsed, status=None, sent=0,
+                received=0, error=None):
+        """Record a single request (one attempt). ``status`` is None and
+        ``error`` is the exception if no response was received.
+
+        """
+
+        template, group_name = endpoint_template(endpoint)
+        key = '{} {}'.format(method, template)
+        if error is not None:
+            error_class = type(error).__name__
+        elif status >= 400:
+            error_class = 'HTTP {}'.format(status)
+        else:
+            error_class = None
+
+        with self._lock:
+            data = self.endpoints[key]
+            data['latency'].add(elapsed)
+            data['sent'] += sent
+            data['received'] += received
+            if error_class:
+                data['errors'] += 1
+                self.errors[error_class] += 1
+            if group_name:
+                self.group_time[group_name] += elapsed
+
+        self._emit(event='request', method=method, endpoint=endpoint,
+                   template=template, group=group_name, status=status,
+                   elapsed=elapsed, sent=sent, received=received,
+                   error=error_class)
+
+    def retry(self, method, endpoint, attempt, reason):
+        with self._lock:
+            self.retries += 1
+        self._emit(event='retry', method=method, endpoint=endpoint,
+                   attempt=attempt, reason=str(reason))
+
+    def handshake(self, host, port, resumed=False):
+        """Record a TLS handshake; ``resumed`` is True if a previous
+        session was resumed
+
+        """
+
+        with self._lock:
+            self.handshakes += 1
+            if resumed:
+                self.resumed_handshakes += 1
+        self._emit(event='handshake', host=host, port=port, resumed=resumed)
+
+    def summary(self):
+        """Return a list of dicts, one per endpoint template, sorted by
+        total time
+
+        """
+
+        with self._lock:
+            rows = []
+            for key, data in self.endpoints.items():
+                latency = data['latency']
+                rows.append({
+                    'endpoint': key,
+                    'requests': latency.count,
+                    'errors': data['errors'],
+                    'total_s': latency.total,
+                    'mean_ms': 1000 * latency.total / latency.count,
+                    'p50_ms': 1000 * latency.quantile(0.5),
+                    'p95_ms': 1000 * latency.quantile(0.95),
+                    'max_ms': 1000 * latency.max,
+                    'sent': data['sent'],
+                    'received': data['received'],
+                })
+        return sorted(rows, key=lambda row: row['total_s'], reverse=True)
+
+    def report(self, fobj, top=10):
+        """Write a summary table to file object ``fobj``, including the
+        ``top`` groups with the greatest total request time.
+
+        """
+
+        rows = self.summary()
+        columns = ['endpoint', 'requests', 'errors', 'total_s', 'mean_ms',
+                   'p50_ms', 'p95_ms', 'max_ms', 'sent', 'received']
+        table = [columns] + [
+            [row['endpoint']] +
+            ['{:.1f}'.format(row[c]) if isinstance(row[c], float) else str(row[c])
+             for c in columns[1:]]
+            for row in rows]
+        widths = [max(len(r[i]) for r in table) for i in range(len(columns))]
+        for r in table:
+            print('  '.join([r[0].ljust(widths[0])] +
+                            [v.rjust(w) for v, w in zip(r[1:], widths[1:])]),
+                  file=fobj)
+
+        with self._lock:
+            print('\nhandshakes: {} ({} resumed)  retries: {}  errors: {}'.format(
+                self.handshakes, self.resumed_handshakes, self.retries,
+                ', '.join('{} ({})'.format(k, v)
+                          for k, v in self.errors.most_common()) or 'none'),
+                  file=fobj)
+            slowest = self.group_time.most_common(top)
+
+        if slowest:
+            print('\ngroups by total request time:', file=fobj)
+            width = max(len(name) for name, _ in slowest)
+            for name, elapsed in slowest:
+                print('{}  {:.3f}s'.format(name.ljust(width), elapsed), file=fobj)
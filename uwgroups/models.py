@@ -0,0 +1,72 @@
+"""Exceptions and member records used by the groups API client
+
+These are defined apart from ``uwgroups.api`` (which re-exports them)
+so that they can be imported without the cost of importing the HTTP
+and SSL modules, for example by clients of ``uwgroups.daemon``.
+"""
+
+from collections import namedtuple
+
+
+class APIError(Exception):
+    pass
+
+
+class MissingResourceError(APIError):
+    pass
+
+
+class AuthorizationError(APIError):
+    pass
+
+
+# a single instance of each type string is shared by all User objects
+_USER_TYPES = {t: t for t in ['uwnetid', 'group', 'dns', 'eppn']}
+
+
+class User(namedtuple('User', ['uwnetid', 'type'])):
+    """A group member or administrator identified by ``uwnetid`` (the
+    member id, also available as ``id``, which is a group name, dns
+    name or eppn for other types) and ``type``, one of
+    ``user_types``. Users are immutable tuples without a per-instance
+    ``__dict__``; they compare and hash by (id, type), so they may be
+    used in sets and compared using ``reconcile()``.
+
+    """
+
+    __slots__ = ()
+    user_types = set(_USER_TYPES)
+
+    def __new__(cls, uwnetid, type='uwnetid'):
+        if type not in _USER_TYPES:
+            raise ValueError('user_type must be in {}'.format(cls.user_types))
+        return super().__new__(cls, uwnetid, _USER_TYPES[type])
+
+    @property
+    def id(self):
+        return self.uwnetid
+
+    @classmethod
+    def from_id(cls, member_id):
+        """Return a ``User`` with a type inferred from ``member_id``: 'eppn'
+        if it contains '@', 'group' if it contains '_' (group names may
+        also contain '.'), 'dns' if it contains '.', and otherwise
+        'uwnetid'.
+
+        """
+
+        if '@' in member_id:
+            member_type = 'eppn'
+        elif '_' in member_id:
+            member_type = 'group'
+        elif '.' in member_id:
+            member_type = 'dns'
+        else:
+            member_type = 'uwnetid'
+        return tuple.__new__(cls, (member_id, _USER_TYPES[member_type]))
+
+    @classmethod
+    def _from_api(cls, member_id, member_type):
+        # trusted input; types unknown to this module are retained
+        return tuple.__new__(
+            cls, (member_id, _USER_TYPES.get(member_type, member_type)))
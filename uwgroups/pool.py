@@ -0,0 +1,159 @@
+"""Thread-safe pool of keep-alive HTTPS connections"""
+
+import http.client
+import logging
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+
+class PooledHTTPSConnection(http.client.HTTPSConnection):
+    """``HTTPSConnection`` that offers the TLS session of the pool that
+    owns it for resumption and reports each (re)connection - and thus
+    each TLS handshake - to the pool.
+
+    """
+
+    def __init__(self, *args, pool=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool = pool
+
+    def connect(self):
+        # as in HTTPSConnection.connect(), but passing a session to wrap_socket()
+        http.client.HTTPConnection.connect(self)
+        self.sock = self._context.wrap_socket(
+            self.sock, server_hostname=self._tunnel_host or self.host,
+            session=self.pool.session)
+        self.pool._connected(self)
+
+
+class ConnectionPool(object):
+    """Maintain up to ``maxsize`` connections to ``host``:``port``, all
+    sharing the prebuilt ``ssl.SSLContext`` in ``context``. Idle
+    connections are reused most-recently-used first; connections idle
+    for longer than ``idle_timeout`` seconds are closed rather than
+    reused, since the server has likely dropped them. ``get()`` blocks
+    when ``maxsize`` connections are already checked out.
+
+    The TLS session of the most recently used connection is retained
+    as ``session`` and offered to the server when a new connection is
+    established, so that reconnecting requires only an abbreviated
+    handshake if the server supports session resumption; pass
+    ``session`` (for example, the ``session`` of a previous pool using
+    the same ``context``) to resume a session from the first connection.
+
+    Counters ``handshakes`` (TLS connections established), ``resumed``
+    (the subset of handshakes resuming a previous session) and
+    ``requests`` (responses received) are available as attributes or
+    via ``stats()``. If provided, ``on_connect`` is called with
+    arguments (host, port, resumed) after each new connection is
+    established.
+
+    """
+
+    def __init__(self, host, port, context, timeout=30, maxsize=10,
+                 idle_timeout=5, on_connect=None, session=None):
+        if maxsize < 1:
+            raise ValueError('maxsize must be a positive integer')
+
+        self.host = host
+        self.port = port
+        self.context = context
+        self.timeout = timeout
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self.on_connect = on_connect
+        self.session = session
+
+        self.handshakes = 0
+        self.resumed = 0
+        self.requests = 0
+        self.discarded = 0
+
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(maxsize)
+
+    def _connected(self, connection):
+        resumed = connection.sock.session_reused
+        with self._lock:
+            self.handshakes += 1
+            if resumed:
+                self.resumed += 1
+            if self.session is None:
+                self.session = connection.sock.session
+        log.debug('connected to {}:{} ({} handshake)'.format(
+            self.host, self.port, 'resumed' if resumed else 'full'))
+        if self.on_connect:
+            self.on_connect(self.host, self.port, resumed)
+
+    def get(self):
+        """Check out a connection, reusing an idle one if possible"""
+
+        self._slots.acquire()
+        now = time.monotonic()
+        stale = []
+        connection = None
+        with self._lock:
+            while self._idle:
+                candidate, last_used = self._idle.pop()
+                if now - last_used > self.idle_timeout:
+                    stale.append(candidate)
+                else:
+                    connection = candidate
+                    break
+        for conn in stale:
+            conn.close()
+
+        if connection is None:
+            connection = PooledHTTPSConnection(
+                host=self.host, port=self.port, timeout=self.timeout,
+                context=self.context, pool=self)
+        return connection
+
+    def put(self, connection, response=None):
+        """Return a connection checked out using ``get()`` along with the
+        ``response`` it produced, which must have been read
+        completely. The connection is retained for reuse unless
+        ``response`` is None (indicating an error) or the server
+        indicated that it will close the connection.
+
+        """
+
+        reuse = (response is not None and not response.will_close
+                 and connection.sock is not None)
+        try:
+            if not reuse:
+                connection.close()
+            with self._lock:
+                if response is not None:
+                    self.requests += 1
+                if reuse:
+                    # with TLS 1.3, a resumable session is available
+                    # only once the server has sent a session ticket,
+                    # which is processed along with the response
+                    self.session = connection.sock.session
+                    self._idle.append((connection, time.monotonic()))
+                else:
+                    self.discarded += 1
+        finally:
+            self._slots.release()
+
+    def close(self):
+        """Close all idle connections"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection, _ in idle:
+            connection.close()
+
+    def stats(self):
+        """Return a dict of pool counters"""
+        with self._lock:
+            return {
+                'handshakes': self.handshakes,
+                'resumed': self.resumed,
+                'requests': self.requests,
+                'discarded': self.discarded,
+                'idle': len(self._idle),
+            }
@@ -0,0 +1,163 @@
+"""Rate limiting and retry policy for API requests"""
+
+import contextlib
+import email.utils
+import logging
+import random
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+# responses indicating that the request may succeed if repeated
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+
+def parse_retry_after(value):
+    """Return the number of seconds specified by a Retry-After header,
+    which may be either a number of seconds or an HTTP date, or None
+    if ``value`` can't be parsed.
+
+    """
+
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+class RequestScheduler(object):
+    """Controls when requests are sent and whether failed requests are
+    retried. A single scheduler is shared by all requests made using
+    a ``UWGroups`` object, including requests made concurrently from
+    multiple threads.
+
+    * ``rate``: maximum average number of requests per second, or
+      None for no limit; up to ``burst`` requests may be sent at once
+      after a period of inactivity (token bucket).
+    * ``max_concurrency``: maximum number of requests in flight, or
+      None for no limit.
+    * ``attempts``: default maximum number of attempts for each
+      request, including failures due to network errors.
+    * ``backoff`` and ``max_backoff``: before attempt n (counting
+      from 0), wait a random interval between 0 and
+      ``min(max_backoff, backoff * 2 ** n)`` seconds (exponential
+      backoff with full jitter).
+    * ``retry_statuses``: HTTP status codes that are retried.
+
+    If a response includes a Retry-After header, all requests wait
+    for the specified interval (but no longer than ``max_backoff``)
+    before the next attempt.
+
+    """
+
+    def __init__(self, rate=None, burst=None, max_concurrency=None, attempts=5,
+                 backoff=0.5, max_backoff=60, retry_statuses=RETRY_STATUSES):
+        if rate is not None and rate <= 0:
+            raise ValueError('rate must be positive')
+        if attempts < 1:
+            raise ValueError('attempts must be a positive integer')
+
+        self.rate = rate
+        self.burst = burst or (max(1, rate) if rate else 1)
+        self.attempts = attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.retry_statuses = frozenset(retry_statuses)
+
+        self.retries = 0
+        self.throttled = 0.0
+
+        self._lock = threading.Lock()
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._slots = (threading.BoundedSemaphore(max_concurrency)
+                       if max_concurrency else None)
+
+    def _delay(self):
+        """Return the time to wait before the next request may be sent,
+        consuming a token.
+
+        """
+
+        with self._lock:
+            now = time.monotonic()
+            wait = max(0.0, self._paused_until - now)
+            if self.rate:
+                elapsed = now - self._updated
+                self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+                self._updated = now
+                # tokens may go negative: each request reserves the
+                # next available slot
+                self._tokens -= 1
+                if self._tokens < 0:
+                    wait = max(wait, -self._tokens / self.rate)
+            self.throttled += wait
+            return wait
+
+    @contextlib.contextmanager
+    def slot(self):
+        """Context manager that waits until a request may be sent and
+        holds a concurrency slot for the duration of the request.
+
+        """
+
+        if self._slots:
+            self._slots.acquire()
+        try:
+            wait = self._delay()
+            if wait:
+                log.debug('throttling for {:.3f}s'.format(wait))
+                time.sleep(wait)
+            yield
+        finally:
+            if self._slots:
+                self._slots.release()
+
+    def retryable(self, status):
+        """Return True if a response with status ``status`` should be
+        retried.
+
+        """
+
+        return status in self.retry_statuses
+
+    def wait(self, attempt, retry_after=None):
+        """Sleep before retrying a request that failed on attempt number
+        ``attempt``. ``retry_after`` is the value of a Retry-After
+        header, if any, in which case all requests are paused (for at
+        most ``max_backoff`` seconds).
+
+        """
+
+        with self._lock:
+            self.retries += 1
+
+        seconds = parse_retry_after(retry_after)
+        if seconds is not None:
+            seconds = min(seconds, self.max_backoff)
+            with self._lock:
+                self._paused_until = max(
+                    self._paused_until, time.monotonic() + seconds)
+        else:
+            seconds = random.uniform(
+                0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+        log.info('retrying in {:.2f}s'.format(seconds))
+        time.sleep(seconds)
+
+    def stats(self):
+        """Return a dict of scheduler counters"""
+        with self._lock:
+            return {'retries': self.retries,
+                    'throttled_seconds': round(self.throttled, 3)}
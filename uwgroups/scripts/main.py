@@ -6,13 +6,30 @@ import os
 import argparse
 from argparse import RawDescriptionHelpFormatter
 import logging
-import pkgutil
 import sys
 from importlib import import_module
 from uwgroups import (subcommands, __version__ as version,
                       __doc__ as docstring,
-                      cert_var_name, key_var_name)
-from uwgroups.api import GWS_HOSTS
+                      cert_var_name, key_var_name, GWS_HOSTS)
+from uwgroups.subcommands import HELP_INDEX, positive_int, positive_float
+
+
+class LazySubParsersAction(argparse._SubParsersAction):
+    """Subparsers action that imports the module implementing a
+    subcommand and adds its arguments only once argparse has
+    determined that the subcommand was selected, so that a single
+    module is imported for each invocation. Modules are loaded using
+    ``self.load(name, subparser)``.
+
+    """
+
+    load = None
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        name = values[0]
+        if name in HELP_INDEX and self.load:
+            self.load(name, self._name_parser_map[name])
+        super().__call__(parser, namespace, values, option_string)
 
 
 def parse_arguments(argv):
@@ -52,12 +69,30 @@ def parse_arguments(argv):
                         default=os.environ.get('GWS_HOST', 'PROD'),
                         help="""Selects UW groups API endpoint; uses GWS_GROUP
                              environment variable if set [%(default)s]""")
+    parser.add_argument('--rate', type=positive_float, metavar='N',
+                        help="""Send no more than N requests per second on
+                        average [no limit]""")
+    parser.add_argument('--max-concurrency', type=positive_int, metavar='N',
+                        help="""Send no more than N requests at once [no limit]""")
+    parser.add_argument('--attempts', type=positive_int, default=5, metavar='N',
+                        help="""Maximum number of attempts for each request
+                        failing with a network error or a retryable status
+                        (429, 5xx) [%(default)s]""")
+    parser.add_argument('--no-daemon', action='store_false', dest='use_daemon',
+                        default=True,
+                        help="""Do not send requests through a server
+                        started using 'serve', even if one is running""")
+    parser.add_argument('--stats', action='store_true', default=False,
+                        help="""Print a summary of requests (latency, bytes
+                        transferred, retries, errors, and slowest groups)
+                        to stderr on exit""")
 
     ##########################
     # Setup all sub-commands #
     ##########################
 
-    subparsers = parser.add_subparsers(dest='subparser_name', title='actions')
+    subparsers = parser.add_subparsers(
+        dest='subparser_name', title='actions', action=LazySubParsersAction)
 
     # Begin help sub-command
     parser_help = subparsers.add_parser(
@@ -65,38 +100,25 @@ def parse_arguments(argv):
     parser_help.add_argument('action', nargs=1)
     # End help sub-command
 
-    # Organize submodules by argv
-    modules = [name for _, name, _ in pkgutil.iter_modules(subcommands.__path__)]
-    modules = [m for m in modules if not m.startswith('_')]
-    run = [name for name in modules if name in argv]
-
     actions = {}
 
-    # `run` will contain the module corresponding to a single
-    # subcommand if provided; otherwise, generate top-level help
-    # message from all submodules in `modules`.
-    for name in run or modules:
-        # set up subcommand help text. The first line of the dosctring
-        # in the module is displayed as the help text in the
-        # script-level help message (`script -h`). The entire
-        # docstring is displayed in the help message for the
-        # individual subcommand ((`script action -h`))
-        # if no individual subcommand is specified (run_action[False]),
-        # a full list of docstrings is displayed
+    # The help text for each subcommand in the script-level help
+    # message (`script -h`) is read from HELP_INDEX (the first line of
+    # the module docstring). The module implementing a subcommand is
+    # imported only when the subcommand is selected, at which point
+    # its arguments are added and the entire docstring is used as
+    # the description (`script action -h`).
+    def load(name, subparser):
         mod = import_module('{}.{}'.format(subcommands.__name__, name))
-
-        if mod.__doc__.strip():
-            helpstr = mod.__doc__.lstrip().split('\n', 1)[0]
-        else:
-            helpstr = '<add help text in docstring>'
-
-        subparser = subparsers.add_parser(
-            name, help=helpstr,
-            description=mod.__doc__,
-            formatter_class=RawDescriptionHelpFormatter)
+        subparser.description = mod.__doc__
         mod.build_parser(subparser)
         actions[name] = mod.action
 
+    subparsers.load = load
+    for name, helpstr in sorted(HELP_INDEX.items()):
+        subparsers.add_parser(
+            name, help=helpstr, formatter_class=RawDescriptionHelpFormatter)
+
     # Determine we have called ourself (e.g. "help <action>")
     # Set arguments to display help if parameter is set
     #           *or*
@@ -134,4 +156,14 @@ def main(argv=None):
 
     logging.basicConfig(stream=arguments.logfile, format=logformat, level=loglevel)
 
-    return action(arguments)
+    if arguments.stats:
+        from uwgroups.metrics import Metrics
+        arguments.metrics = Metrics()
+    else:
+        arguments.metrics = None
+
+    try:
+        return action(arguments)
+    finally:
+        if arguments.metrics:
+            arguments.metrics.report(sys.stderr)
@@ -1,14 +1,41 @@
-import glob
+import argparse
 import logging
 import os
 from os.path import splitext, split, join
 
-from uwgroups import cert_var_name, key_var_name
+from uwgroups import cert_var_name, key_var_name, cache_var_name
 
 log = logging.getLogger(__name__)
 
+# default value of --cache-ttl (hours)
+CACHE_TTL = 7 * 24
+
+
+# Help text for each subcommand (the first line of the module
+# docstring) used to build the top-level help message without
+# importing every module; tests.test_subcommands checks that it is
+# consistent with the modules.
+HELP_INDEX = {
+    'add_users': 'Add one or more users to a group',
+    'apply': 'Apply changes to group membership computed by the "plan" command',
+    'connect': 'Create a connection - useful mainly for testing credentials',
+    'create': 'Create one or more groups',
+    'delete': 'Delete a group',
+    'diff': 'Compare group membership between two API environments',
+    'export': 'Export group membership to a local index',
+    'get': 'Show the API response for information about a group',
+    'members': 'List group members',
+    'plan': 'Compute the changes needed to synchronize group membership',
+    'rm_users': 'Remove one or more users from a group',
+    'search_groups': 'List groups matching a pattern',
+    'search_user': 'List groups to which netid belongs',
+    'serve': 'Serve requests from other commands using a persistent connection',
+    'sync_groups': 'Syncronize group membership, creating groups if necessary',
+}
+
 
 def itermodules(subcommands_path, root=__name__):
+    import glob
 
     commands = [x for x in [splitext(split(p)[1])[0]
                             for p in glob.glob(join(subcommands_path, '*.py'))]
@@ -41,3 +68,168 @@ def find_credentials(args):
         log.info('environment variable {}={}'.format(key_var_name, keyfile))
 
     return certfile, keyfile
+
+
+def get_client(args, daemon=False, **kwargs):
+    """Return a ``UWGroups`` object configured using global command line
+    arguments (credentials, environment, request scheduling and
+    metrics).
+    Additional keyword arguments are passed to the ``UWGroups``
+    constructor.
+
+    If ``daemon`` is True and a server started using 'serve' is
+    running for the selected environment, a
+    ``uwgroups.daemon.DaemonClient`` connected to the server is
+    returned instead, unless --no-daemon, --stats or any membership
+    cache option was specified, or the server uses different
+    credentials than those specified. Subcommands should set
+    ``daemon`` only if they use nothing but the methods in
+    ``uwgroups.daemon.EXPORTED``; other keyword arguments are ignored
+    by the server.
+
+    """
+
+    certfile, keyfile = find_credentials(args)
+
+    if daemon and args.use_daemon and not getattr(args, 'metrics', None) \
+       and not cache_options_specified(args):
+        from uwgroups.daemon import daemon_client
+        client = daemon_client(args.environment, certfile, keyfile)
+        if client:
+            return client
+
+    from uwgroups.api import UWGroups
+    from uwgroups.scheduler import RequestScheduler
+
+    scheduler = RequestScheduler(
+        rate=args.rate, max_concurrency=args.max_concurrency,
+        attempts=args.attempts)
+    return UWGroups(certfile, keyfile, environment=args.environment,
+                    scheduler=scheduler, metrics=getattr(args, 'metrics', None),
+                    **kwargs)
+
+
+def add_cache_arguments(parser):
+    """Add arguments controlling the membership cache to ``parser``"""
+
+    group = parser.add_argument_group('membership cache')
+    group.add_argument(
+        '--no-cache', action='store_false', dest='use_cache', default=True,
+        help="""Do not read or update the on-disk membership cache""")
+    group.add_argument(
+        '--cache-file', metavar='FILE',
+        help="""Path to the membership cache; may also be specified
+        using the environment variable {} [~/.cache/uwgroups/members.db]
+        """.format(cache_var_name))
+    group.add_argument(
+        '--cache-ttl', type=float, default=CACHE_TTL, metavar='HOURS',
+        help="""Ignore cached entries older than HOURS [%(default)s]""")
+
+
+def cache_options_specified(args):
+    """Return True if any of the arguments defined by
+    ``add_cache_arguments()`` differ from their defaults
+
+    """
+
+    return (not getattr(args, 'use_cache', True)
+            or getattr(args, 'cache_file', None) is not None
+            or getattr(args, 'cache_ttl', CACHE_TTL) != CACHE_TTL)
+
+
+def get_member_cache(args):
+    """Return a ``MembershipCache`` configured from command line
+    arguments defined by ``add_cache_arguments()``, or None if caching
+    is disabled.
+
+    """
+
+    if not args.use_cache:
+        return None
+
+    from uwgroups.cache import MembershipCache
+    cache = MembershipCache(args.cache_file, ttl=args.cache_ttl * 3600)
+    log.info('using membership cache {}'.format(cache.filename))
+    return cache
+
+
+def positive_int(value):
+    """argparse type for arguments such as -j/--jobs"""
+    try:
+        value = int(value)
+    except ValueError:
+        value = 0
+    if value < 1:
+        raise argparse.ArgumentTypeError('must be a positive integer')
+    return value
+
+
+def positive_float(value):
+    """argparse type for arguments such as --rate"""
+    try:
+        value = float(value)
+    except ValueError:
+        value = 0
+    if not value > 0:
+        raise argparse.ArgumentTypeError('must be a positive number')
+    return value
+
+
+def add_jobs_argument(parser, what='groups'):
+    parser.add_argument(
+        '-j', '--jobs', type=positive_int, default=1, metavar='N',
+        help='number of {} to process concurrently [%(default)s]'.format(what))
+
+
+def add_groupfile_arguments(parser):
+    """Add a positional argument 'groupfile' and option --format to
+    ``parser``. Use ``read_groups()`` to read the file.
+
+    """
+
+    parser.add_argument(
+        'groupfile', type=argparse.FileType(),
+        help="""json file containing a mapping of {group: [netids]}, or
+        newline-delimited json containing objects {"group": group,
+        "members": [netids]}""")
+    parser.add_argument(
+        '--format', choices=['json', 'ndjson'],
+        help="""format of groupfile [ndjson if the file name ends with
+        .ndjson or .jsonl, otherwise json]""")
+
+
+def read_groups(args):
+    """Incrementally read (group_name, members) tuples from the file
+    specified by arguments defined by ``add_groupfile_arguments()``.
+
+    """
+
+    from uwgroups.utils import read_groupfile
+
+    return read_groupfile(args.groupfile, file_format(args.groupfile, args.format))
+
+
+def file_format(fobj, fmt=None):
+    """Return ``fmt`` if specified, otherwise 'ndjson' if the name of
+    ``fobj`` ends with .ndjson or .jsonl, or 'json'
+
+    """
+
+    if fmt:
+        return fmt
+    return 'ndjson' if fobj.name.endswith(('.ndjson', '.jsonl')) else 'json'
+
+
+def report_failures(failures, what='failure(s)'):
+    """Log a summary of ``failures``, a dict of {name: exception}, and
+    return an exit status (1 if there were any failures).
+
+    """
+
+    if not failures:
+        return None
+
+    log.error('{} {}:'.format(len(failures), what))
+    for name, err in sorted(failures.items()):
+        log.error('{}: {}: {}'.format(name, type(err).__name__, err))
+    return 1
@@ -0,0 +1,73 @@
+"""Apply changes to group membership computed by the "plan" command
+
+Groups are created as necessary (parents before children) and members
+are added and removed in batches. Up to N groups are modified
+concurrently (-j/--jobs). No current membership is retrieved, so the
+plan should be applied soon after it is computed. The plan must have
+been computed against the same API environment.
+"""
+
+import argparse
+import json
+import logging
+import sys
+
+from uwgroups.subcommands import (
+    get_client, add_jobs_argument, report_failures)
+from uwgroups.utils import imap_concurrent
+
+log = logging.getLogger(__name__)
+
+
+def build_parser(parser):
+    parser.add_argument('planfile', type=argparse.FileType(),
+                        help='output of the "plan" command')
+    parser.add_argument('-n', '--dry-run', action='store_true', default=False)
+    add_jobs_argument(parser)
+
+
+def read_plan(planfile, environment):
+    """Yield records describing changes to groups, exiting unless the
+    first record is a header identifying ``environment``
+
+    """
+
+    header = False
+    for line in planfile:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        if not header and 'environment' not in record:
+            sys.exit('plan does not begin with a record identifying '
+                     'the environment')
+        if 'group' in record:
+            yield record
+        elif record.get('environment') != environment:
+            sys.exit('plan was computed for environment {} but the '
+                     'current environment is {}'.format(
+                         record.get('environment'), environment))
+        header = True
+
+
+def action(args):
+    failures = {}
+
+    with get_client(args, pool_size=args.jobs) as conn:
+        def apply(record):
+            conn.apply_plan(record, dry_run=args.dry_run)
+
+        def todo():
+            for record in read_plan(args.planfile, args.environment):
+                if failures:
+                    return
+                yield record
+
+        for record, _, err in imap_concurrent(apply, todo(), jobs=args.jobs):
+            if err:
+                log.error('failed to apply changes to {}: {}'.format(
+                    record['group'], err))
+                failures[record['group']] = err
+
+        log.info('batch sizes: {}'.format(conn.batch_sizer.stats()))
+
+    return report_failures(failures, 'group(s) could not be modified')
@@ -3,8 +3,7 @@
 
 import logging
 
-from uwgroups.api import UWGroups
-from uwgroups.subcommands import find_credentials
+from uwgroups.subcommands import get_client
 
 log = logging.getLogger(__name__)
 
@@ -14,10 +13,9 @@ def build_parser(parser):
 
 
 def action(args):
-    certfile, keyfile = find_credentials(args)
-    with UWGroups(certfile, keyfile, environment=args.environment) as conn:
+    with get_client(args) as conn:
         for attr in ['host', 'port']:
-            print(('{}: {}'.format(attr, getattr(conn.connection, attr))))
+            print(('{}: {}'.format(attr, getattr(conn.pool, attr))))
         for attr in ['certfile', 'keyfile']:
             print(('{}: {}'.format(attr, getattr(conn, attr))))
 
@@ -1,22 +1,130 @@
-"""Create a group
+"""Create one or more groups
+
+Parent groups are created as necessary. When more than one group is
+specified, the tree of groups and their parents is checked for
+existing groups once, and missing groups are created one level of the
+hierarchy at a time, with up to -j/--jobs groups in each level created
+concurrently.
+
+Groups may also be described by a manifest (-m/--manifest): either a
+JSON object mapping group names to objects with optional keys
+"admins" (a list of uwnetids added as admins of the group), and
+"exchange" and "google" (true to activate or false to inactivate the
+affiliate), or newline-delimited JSON with one such object per line
+including the key "group" (--manifest-format ndjson; the default for
+files with extension .ndjson or .jsonl). For example:
+
+  {"u_labmed_course_a": {"admins": ["netid"], "google": true},
+   "u_labmed_course_b": {"exchange": false}}
+
+Exchange is activated (or inactivated with --exchange no) for groups
+specified on the command line and for those for which "exchange" is
+not specified in the manifest. Affiliates are modified only if their
+current state differs. A line is written for each group with the
+outcome (created, exists, failed, or skipped if a parent group could
+not be checked or created) and the affiliates that were changed.
 """
 
+import argparse
 import logging
+import sys
 
-from uwgroups.api import UWGroups
-from uwgroups.subcommands import find_credentials
+from uwgroups.subcommands import (
+    get_client, add_jobs_argument, report_failures, file_format)
+from uwgroups.utils import imap_concurrent, read_manifest
 
 log = logging.getLogger(__name__)
 
 
 def build_parser(parser):
-    parser.add_argument('group_name', help="name of a group")
+    parser.add_argument('group_names', metavar='group_name', nargs='*',
+                        help="name of a group")
+    parser.add_argument('-f', '--infile', type=argparse.FileType(),
+                        help="""file containing group names, one per line""")
+    parser.add_argument('-m', '--manifest', type=argparse.FileType(),
+                        help="""json or ndjson file describing groups to
+                        create (see above)""")
+    parser.add_argument('--manifest-format', choices=['json', 'ndjson'],
+                        help="""format of the manifest [ndjson if the file
+                        name ends with .ndjson or .jsonl, otherwise json]""")
     parser.add_argument('--exchange', choices=['yes', 'no'], default='yes')
+    add_jobs_argument(parser)
+
+
+def read_specs(args):
+    """Return a dict of {group_name: spec} (see
+    ``uwgroups.utils.read_manifest()``) for all groups specified on
+    the command line
+
+    """
+
+    names = list(args.group_names)
+    if args.infile:
+        names.extend(line.strip() for line in args.infile if line.strip())
+    specs = {name: {} for name in names}
+
+    if args.manifest:
+        fmt = file_format(args.manifest, args.manifest_format)
+        try:
+            specs.update(read_manifest(args.manifest, fmt))
+        except ValueError as err:
+            sys.exit('invalid manifest: {}'.format(err))
+
+    return specs
 
 
 def action(args):
-    certfile, keyfile = find_credentials(args)
-    with UWGroups(certfile, keyfile, environment=args.environment) as conn:
-        conn.create_group(args.group_name)
-        conn.set_affiliate(
-            args.group_name, service='exchange', active=args.exchange == 'yes')
+    specs = read_specs(args)
+    if not specs:
+        log.error('no groups were specified')
+        return 1
+
+    group_admins = {name: spec['admins'] for name, spec in specs.items()
+                    if 'admins' in spec}
+    affiliates = {}
+    for name, spec in specs.items():
+        affiliates[name] = {'exchange': spec.get('exchange', args.exchange == 'yes')}
+        if 'google' in spec:
+            affiliates[name]['google'] = spec['google']
+
+    with get_client(args, pool_size=args.jobs) as conn:
+        result = conn.create_groups(list(specs), jobs=args.jobs,
+                                    group_admins=group_admins)
+        failures = dict(result['failed'])
+        created = set(result['created'])
+        log.info('created {} group(s); {} already existed'.format(
+            len(result['created']), len(result['exists'])))
+
+        def sync_affiliates(name):
+            # a group that was just created has no active affiliates
+            return conn.sync_affiliates(
+                name, affiliates[name], current={} if name in created else None)
+
+        changed = {}
+        todo = [name for name in specs
+                if name not in failures and name not in result['skipped']]
+        for group_name, services, err in imap_concurrent(
+                sync_affiliates, todo, jobs=args.jobs):
+            if err:
+                failures[group_name] = err
+            else:
+                changed[group_name] = services
+
+    for group_name in specs:
+        if group_name in result['skipped']:
+            outcome = 'skipped'
+        elif group_name in failures:
+            outcome = 'failed'
+        elif group_name in created:
+            outcome = 'created'
+        else:
+            outcome = 'exists'
+        services = ['{}={}'.format(s, 'active' if affiliates[group_name][s] else 'inactive')
+                    for s in changed.get(group_name, [])]
+        print('{}\t{}\t{}'.format(group_name, outcome, ','.join(services) or '-'))
+
+    for group_name in result['skipped']:
+        log.error('{}: not created because a parent group could not be '
+                  'checked or created'.format(group_name))
+
+    return report_failures(failures, 'group(s) could not be created')
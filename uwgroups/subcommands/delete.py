@@ -1,19 +1,57 @@
 """Delete a group
+
+With -r/--recursive, the group and all of its descendants (groups
+with names beginning with group_name + '_') are deleted, starting
+with the most deeply nested groups; up to -j/--jobs groups at each
+level of the hierarchy are deleted concurrently. A group is not
+deleted if any of its descendants could not be deleted. Use
+-n/--dry-run to list the groups in the order in which they would be
+deleted, each preceded by its level, without deleting them.
 """
 
 import logging
+import sys
 
-from uwgroups.api import UWGroups
-from uwgroups.subcommands import find_credentials
+from uwgroups.subcommands import get_client, add_jobs_argument, report_failures
 
 log = logging.getLogger(__name__)
 
 
 def build_parser(parser):
     parser.add_argument('group_name', help="name of a group")
+    parser.add_argument('-r', '--recursive', action='store_true', default=False,
+                        help="""delete all descendants of the group""")
+    parser.add_argument('-n', '--dry-run', action='store_true', default=False,
+                        help="""with --recursive, list the groups that would
+                        be deleted""")
+    add_jobs_argument(parser)
 
 
 def action(args):
-    certfile, keyfile = find_credentials(args)
-    with UWGroups(certfile, keyfile, environment=args.environment) as conn:
-        conn.delete_group(args.group_name)
+    if args.dry_run and not args.recursive:
+        sys.exit('-n/--dry-run requires -r/--recursive')
+
+    if not args.recursive:
+        with get_client(args, daemon=True) as conn:
+            conn.delete_group(args.group_name)
+        return
+
+    with get_client(args, pool_size=args.jobs) as conn:
+        result = conn.delete_tree(args.group_name, jobs=args.jobs,
+                                  dry_run=args.dry_run)
+
+    levels = result['levels']
+    count = sum(len(level) for level in levels)
+    if args.dry_run:
+        for i, level in enumerate(levels, 1):
+            for group_name in level:
+                print('{}\t{}'.format(i, group_name))
+        log.warning('{} group(s) in {} level(s) would be deleted using {} '
+                    'request(s)'.format(count, len(levels), count))
+        return
+
+    log.warning('deleted {} of {} group(s)'.format(len(result['deleted']), count))
+    for group_name in result['skipped']:
+        log.error('{}: not deleted because a descendant could not be '
+                  'deleted'.format(group_name))
+    return report_failures(result['failed'], 'group(s) could not be deleted')
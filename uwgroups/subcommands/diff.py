@@ -0,0 +1,125 @@
+"""Compare group membership between two API environments
+
+Writes the changes needed for groups in the current environment
+(-e/--environment) to match the same groups in environment OTHER,
+for example to review changes validated in EVAL before making them
+in PROD:
+
+  uwgroups -e PROD diff EVAL --stem u_foo > changes.jsonl
+  uwgroups -e PROD apply changes.jsonl
+
+Groups are either those named in a groupfile (see sync_groups; the
+members listed in the file are ignored) or, with -s/--stem, a group
+and all of its descendants in either environment. Membership is
+fetched from both environments concurrently for up to N groups at a
+time (-j/--jobs), and results are written as each group is compared,
+so that memory use does not depend on the number of groups.
+
+The output is a plan as written by the "plan" command and can be
+executed using "apply". Groups with identical membership are omitted;
+groups that do not exist in OTHER are reported but not included.
+"""
+
+import argparse
+import json
+import logging
+import sys
+
+from uwgroups import GWS_HOSTS
+from uwgroups.subcommands import (
+    get_client, add_cache_arguments, get_member_cache,
+    add_jobs_argument, read_groups, report_failures)
+
+log = logging.getLogger(__name__)
+
+
+def build_parser(parser):
+    parser.add_argument('other', metavar='OTHER', choices=list(GWS_HOSTS.keys()),
+                        help="""environment to compare with the current
+                        environment (one of {})""".format(', '.join(GWS_HOSTS)))
+    groups = parser.add_mutually_exclusive_group(required=True)
+    groups.add_argument('-g', '--groupfile', type=argparse.FileType(),
+                        help="""json or newline-delimited json file of
+                        groups (see sync_groups)""")
+    groups.add_argument('-s', '--stem', metavar='GROUP',
+                        help="""compare GROUP and all of its descendants""")
+    parser.add_argument('--format', choices=['json', 'ndjson'],
+                        help="""format of groupfile [ndjson if the file name
+                        ends with .ndjson or .jsonl, otherwise json]""")
+    parser.add_argument('-o', '--outfile', type=argparse.FileType('w'),
+                        default=sys.stdout,
+                        help='output file [stdout]')
+    add_jobs_argument(parser)
+    add_cache_arguments(parser)
+
+
+def find_groups(conns, stem):
+    """Return a sorted list of ``stem`` and its descendants existing
+    using any of the clients in ``conns``, searched concurrently
+
+    """
+
+    from uwgroups.utils import imap_concurrent
+
+    def search(conn):
+        group_names = set(conn.search_groups(stem + '_*'))
+        if conn.group_exists(stem):
+            group_names.add(stem)
+        return group_names
+
+    found = set()
+    for _, group_names, err in imap_concurrent(search, conns, jobs=len(conns)):
+        if err:
+            raise err
+        found |= group_names
+    return sorted(found)
+
+
+def action(args):
+    from uwgroups.api import diff_members
+
+    if args.other == args.environment:
+        sys.exit('OTHER must differ from the current environment')
+
+    failures = {}
+    counts = dict.fromkeys(['groups', 'changed', 'create', 'missing',
+                            'add', 'remove'], 0)
+    out = args.outfile
+    other_args = argparse.Namespace(**dict(vars(args), environment=args.other))
+
+    with get_client(args, daemon=True, pool_size=args.jobs,
+                    member_cache=get_member_cache(args)) as conn, \
+            get_client(other_args, daemon=True, pool_size=args.jobs,
+                       member_cache=get_member_cache(args)) as other:
+        if args.stem:
+            group_names = find_groups([conn, other], args.stem)
+        else:
+            group_names = (group_name for group_name, _ in read_groups(args))
+
+        out.write(json.dumps({'environment': args.environment,
+                              'source': args.other}) + '\n')
+
+        results = diff_members(conn, other, group_names, jobs=args.jobs)
+        for group_name, record, err in results:
+            counts['groups'] += 1
+            if err:
+                log.error('failed to compare {}: {}'.format(group_name, err))
+                failures[group_name] = err
+            elif record.pop('missing'):
+                counts['missing'] += 1
+                log.warning('{}: does not exist in {}'.format(group_name, args.other))
+            elif record['create'] or record['add'] or record['remove']:
+                counts['changed'] += 1
+                counts['create'] += record['create']
+                counts['add'] += len(record['add'])
+                counts['remove'] += len(record['remove'])
+                out.write(json.dumps(record, separators=(',', ':')) + '\n')
+                out.flush()
+
+    print('{groups} groups: {changed} differ ({create} missing from {env}, '
+          '{missing} missing from {other}), {add} members to add, '
+          '{remove} members to remove'.format(
+              env=args.environment, other=args.other, **counts),
+          file=sys.stderr)
+
+    return report_failures(failures, 'group(s) could not be compared')
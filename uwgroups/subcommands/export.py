@@ -0,0 +1,37 @@
+"""Export group membership to a local index
+
+The membership of every group matching one or more patterns (for
+example, 'u_labmed_*'; see search_groups) is fetched, up to -j/--jobs
+groups at a time, and written to an sqlite database. The index can be
+queried without contacting the API using 'search_user --index' or
+directly using sqlite3, for example:
+
+  sqlite3 index.db "select group_name from members where member_id = 'netid'"
+"""
+
+import logging
+
+from uwgroups.subcommands import (
+    get_client, add_cache_arguments, get_member_cache,
+    add_jobs_argument, report_failures)
+
+log = logging.getLogger(__name__)
+
+
+def build_parser(parser):
+    parser.add_argument('patterns', metavar='pattern', nargs='+',
+                        help="group name pattern (may contain * as a wildcard)")
+    parser.add_argument('-o', '--index', required=True, metavar='FILE',
+                        help="sqlite database to create (replaced if it exists)")
+    add_jobs_argument(parser)
+    add_cache_arguments(parser)
+
+
+def action(args):
+    from uwgroups.index import export_index
+
+    with get_client(args, pool_size=args.jobs,
+                    member_cache=get_member_cache(args)) as conn:
+        failures = export_index(conn, args.patterns, args.index, jobs=args.jobs)
+
+    return report_failures(failures, 'group(s) could not be exported')
@@ -2,11 +2,9 @@
 """
 
 import logging
-import pprint
 import sys
 
-from uwgroups.api import UWGroups
-from uwgroups.subcommands import find_credentials
+from uwgroups.subcommands import get_client
 
 log = logging.getLogger(__name__)
 
@@ -16,10 +14,12 @@ def build_parser(parser):
 
 
 def action(args):
-    certfile, keyfile = find_credentials(args)
-    with UWGroups(certfile, keyfile, environment=args.environment) as conn:
-        if conn.group_exists(args.group_name):
+    import pprint
+    from uwgroups.models import MissingResourceError
+
+    with get_client(args, daemon=True) as conn:
+        try:
             body = conn.get_group(args.group_name)
-            pprint.pprint(body)
-        else:
+        except MissingResourceError:
             sys.exit(f'group "{args.group_name}" does not exist')
+        pprint.pprint(body)
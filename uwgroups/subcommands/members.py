@@ -1,26 +1,58 @@
 """List group members
+
+Members are sorted unless --stream is specified, in which case each
+member is printed as the response is received (in the order provided
+by the API) without holding the whole membership in memory; use this
+for very large groups.
+
+With --effective, members that are groups are replaced by their
+members, recursively; up to -j/--jobs subgroups are fetched
+concurrently.
 """
 
 import logging
-import pprint
 import sys
 
-from uwgroups.api import UWGroups
-from uwgroups.subcommands import find_credentials
+from uwgroups.subcommands import (
+    get_client, add_cache_arguments, get_member_cache, add_jobs_argument)
 
 log = logging.getLogger(__name__)
 
 
 def build_parser(parser):
     parser.add_argument('group_name', help="name of a group")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--stream', action='store_true', default=False,
+                      help="""print members as they are received
+                      (unsorted; the membership cache is not used)""")
+    mode.add_argument('--effective', action='store_true', default=False,
+                      help="""expand members that are groups recursively""")
+    add_jobs_argument(parser, what='subgroups')
+    add_cache_arguments(parser)
 
 
 def action(args):
-    certfile, keyfile = find_credentials(args)
-    with UWGroups(certfile, keyfile, environment=args.environment) as conn:
-        if conn.group_exists(args.group_name):
-            members = conn.get_members(args.group_name)
-            for m in sorted(members):
-                print(m)
-        else:
+    from uwgroups.models import MissingResourceError
+
+    if args.stream:
+        with get_client(args) as conn:
+            try:
+                for m in conn.iter_members(args.group_name):
+                    print(m.id)
+            except MissingResourceError:
+                sys.exit(f'group "{args.group_name}" does not exist')
+        return
+
+    with get_client(args, daemon=True, pool_size=args.jobs,
+                    member_cache=get_member_cache(args)) as conn:
+        try:
+            if args.effective:
+                members = conn.effective_members(args.group_name, jobs=args.jobs)
+            else:
+                members = conn.get_members(args.group_name)
+        except MissingResourceError as err:
+            if args.effective:
+                sys.exit(f'a group or subgroup does not exist: {err}')
             sys.exit(f'group "{args.group_name}" does not exist')
+        for m in sorted(members):
+            print(m.id)
@@ -0,0 +1,72 @@
+"""Compute the changes needed to synchronize group membership
+
+Writes a plan describing the changes needed to make the membership of
+each group in groupfile (see sync_groups) match the file, without
+modifying any groups. Current membership is fetched for up to N groups
+concurrently (-j/--jobs). The plan can be reviewed and then executed
+using the "apply" command.
+
+The plan is newline-delimited json. The first line identifies the API
+environment; each subsequent line describes a group that requires
+changes, for example:
+
+  {"environment": "PROD"}
+  {"group": "u_foo_bar", "create": false, "add": ["netid1"], "remove": []}
+
+Groups that are already up to date are omitted. Groups appear in the
+order in which their current membership was retrieved.
+"""
+
+import argparse
+import json
+import logging
+import sys
+
+from uwgroups.subcommands import (
+    get_client, add_cache_arguments, get_member_cache,
+    add_jobs_argument, add_groupfile_arguments, read_groups, report_failures)
+from uwgroups.utils import imap_concurrent
+
+log = logging.getLogger(__name__)
+
+
+def build_parser(parser):
+    add_groupfile_arguments(parser)
+    parser.add_argument('-o', '--outfile', type=argparse.FileType('w'),
+                        default=sys.stdout,
+                        help='output file [stdout]')
+    add_jobs_argument(parser)
+    add_cache_arguments(parser)
+
+
+def action(args):
+    failures = {}
+    counts = dict.fromkeys(['groups', 'changed', 'create', 'add', 'remove'], 0)
+    out = args.outfile
+
+    out.write(json.dumps({'environment': args.environment}) + '\n')
+
+    with get_client(args, pool_size=args.jobs,
+                    member_cache=get_member_cache(args)) as conn:
+        def plan(item):
+            group_name, members = item
+            return conn.plan_members(group_name, members)
+
+        results = imap_concurrent(plan, read_groups(args), jobs=args.jobs)
+        for (group_name, _), record, err in results:
+            counts['groups'] += 1
+            if err:
+                log.error('failed to plan {}: {}'.format(group_name, err))
+                failures[group_name] = err
+            elif record['create'] or record['add'] or record['remove']:
+                counts['changed'] += 1
+                counts['create'] += record['create']
+                counts['add'] += len(record['add'])
+                counts['remove'] += len(record['remove'])
+                out.write(json.dumps(record, separators=(',', ':')) + '\n')
+
+    print('{groups} groups: {changed} to modify, {create} to create, '
+          '{add} members to add, {remove} members to remove'.format(**counts),
+          file=sys.stderr)
+
+    return report_failures(failures, 'group(s) could not be planned')
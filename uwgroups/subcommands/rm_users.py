@@ -3,8 +3,7 @@
 
 import logging
 
-from uwgroups.api import UWGroups
-from uwgroups.subcommands import find_credentials
+from uwgroups.subcommands import get_client
 
 log = logging.getLogger(__name__)
 
@@ -15,6 +14,5 @@ def build_parser(parser):
 
 
 def action(args):
-    certfile, keyfile = find_credentials(args)
-    with UWGroups(certfile, keyfile, environment=args.environment) as conn:
+    with get_client(args, daemon=True) as conn:
         conn.delete_members(args.group, args.users)
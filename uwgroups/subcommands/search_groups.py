@@ -3,8 +3,7 @@
 
 import logging
 
-from uwgroups.api import UWGroups
-from uwgroups.subcommands import find_credentials
+from uwgroups.subcommands import get_client
 
 log = logging.getLogger(__name__)
 
@@ -14,8 +13,7 @@ def build_parser(parser):
 
 
 def action(args):
-    certfile, keyfile = find_credentials(args)
-    with UWGroups(certfile, keyfile, environment=args.environment) as conn:
+    with get_client(args, daemon=True) as conn:
         groups = conn.search_groups(args.name)
         for group in groups:
             print(group)
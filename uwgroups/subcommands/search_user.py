@@ -1,21 +1,94 @@
 """List groups to which netid belongs
+
+With -f/--infile, netids are read from a file (or stdin if '-'), one
+per line, and up to -j/--jobs searches are made concurrently using a
+single pool of connections. One line is written for each netid as
+soon as the search completes, so results are not in input order: in
+tsv format, the netid and a comma-delimited list of groups (or, if
+the search failed, the netid, an empty list of groups and the error
+message); in ndjson format, an object {"netid": netid, "groups":
+[groups]} (or {"netid": netid, "error": message}). Failures are also
+summarized on exit.
+
+With --index, groups are looked up in an index created using 'export'
+rather than by querying the API; only groups included in the export
+are listed.
 """
 
+import argparse
+import json
 import logging
+import sys
+from os import path
 
-from uwgroups.api import UWGroups
-from uwgroups.subcommands import find_credentials
+from uwgroups.subcommands import get_client, add_jobs_argument, report_failures
+from uwgroups.utils import imap_concurrent
 
 log = logging.getLogger(__name__)
 
 
 def build_parser(parser):
-    parser.add_argument('netid')
+    parser.add_argument('netid', nargs='?')
+    parser.add_argument('-f', '--infile', type=argparse.FileType(),
+                        help="""file containing netids, one per line
+                        ('-' for stdin)""")
+    parser.add_argument('--format', choices=['tsv', 'ndjson'], default='tsv',
+                        help="""output format with -f/--infile [%(default)s]""")
+    parser.add_argument('--index', metavar='FILE',
+                        help="""sqlite database created by the 'export'
+                        subcommand""")
+    add_jobs_argument(parser, what='netids')
+
+
+def read_netids(infile):
+    for line in infile:
+        netid = line.strip()
+        if netid:
+            yield netid
+
+
+def write_result(netid, groups, err, fmt):
+    error = err and '{}: {}'.format(type(err).__name__, err)
+    if fmt == 'ndjson':
+        if err:
+            obj = {'netid': netid, 'error': error}
+        else:
+            obj = {'netid': netid, 'groups': groups}
+        print(json.dumps(obj), flush=True)
+    elif err:
+        print('{}\t\t{}'.format(netid, error), flush=True)
+    else:
+        print('{}\t{}'.format(netid, ','.join(groups)), flush=True)
 
 
 def action(args):
-    certfile, keyfile = find_credentials(args)
-    with UWGroups(certfile, keyfile, environment=args.environment) as conn:
-        groups = conn.search_user(args.netid)
-        for group in groups:
-            print(group)
+    if bool(args.netid) == bool(args.infile):
+        sys.exit('specify either a netid or -f/--infile')
+
+    if args.index:
+        from uwgroups.index import MembershipIndex
+        if not path.exists(args.index):
+            sys.exit(f'index "{args.index}" does not exist')
+        with MembershipIndex(args.index) as index:
+            if args.netid:
+                groups = index.groups_for(args.netid)
+            else:
+                for netid in read_netids(args.infile):
+                    write_result(netid, index.groups_for(netid), None, args.format)
+                return
+    elif args.netid:
+        with get_client(args, daemon=True) as conn:
+            groups = conn.search_user(args.netid)
+    else:
+        failures = {}
+        with get_client(args, pool_size=args.jobs) as conn:
+            results = imap_concurrent(
+                conn.search_user, read_netids(args.infile), jobs=args.jobs)
+            for netid, groups, err in results:
+                if err:
+                    failures[netid] = err
+                write_result(netid, groups, err, args.format)
+        return report_failures(failures, 'search(es) failed')
+
+    for group in groups:
+        print(group)
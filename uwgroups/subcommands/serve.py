@@ -0,0 +1,65 @@
+"""Serve requests from other commands using a persistent connection
+
+A server is started in the foreground, listening on a Unix socket
+(~/.cache/uwgroups/daemon-<environment>.sock unless --socket is
+specified or the environment variable UWGROUPS_SOCKET is defined)
+that only the current user may connect to. While it is running, the
+commands add_users, rm_users, delete, get, members (without
+--stream), search_groups and search_user (with a single netid) send
+their requests through the server rather than connecting to the API
+themselves, avoiding the cost of loading the certificate and
+establishing a TLS connection for each command; use --no-daemon to
+bypass the server. Commands specifying a certificate or key other
+than the server's, or any membership cache option, also bypass the
+server. Connections to the API are kept open for
+--idle-timeout seconds; the TLS session is retained, so reconnecting
+after a longer pause requires only an abbreviated handshake. Stop the server with SIGINT or SIGTERM.
+"""
+
+import logging
+import signal
+import sys
+
+from uwgroups.subcommands import get_client, add_cache_arguments, get_member_cache
+
+log = logging.getLogger(__name__)
+
+
+def build_parser(parser):
+    parser.add_argument('-s', '--socket', metavar='FILE',
+                        help="""path to the socket [see above]""")
+    parser.add_argument('--pool-size', type=int, default=10, metavar='N',
+                        help="""maximum number of connections to the API
+                        [%(default)s]""")
+    parser.add_argument('--idle-timeout', type=float, default=5, metavar='SECONDS',
+                        help="""close connections to the API that have been
+                        idle for SECONDS; should be less than the time for
+                        which the API keeps idle connections open
+                        [%(default)s]""")
+    add_cache_arguments(parser)
+
+
+def action(args):
+    from uwgroups.daemon import Daemon, socket_path
+
+    filename = args.socket or socket_path(args.environment)
+
+    def stop(signum, frame):
+        sys.exit(0)
+
+    with get_client(args, pool_size=args.pool_size, idle_timeout=args.idle_timeout,
+                    member_cache=get_member_cache(args)) as conn:
+        try:
+            server = Daemon(conn, filename)
+        except OSError as err:
+            sys.exit(str(err))
+
+        signal.signal(signal.SIGTERM, stop)
+        log.warning('serving {} on {}'.format(conn.gws_host, filename))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            log.warning('stopped after {} requests'.format(server.requests))
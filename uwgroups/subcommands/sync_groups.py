@@ -1,27 +1,95 @@
 """Syncronize group membership, creating groups if necessary
+
+Groups are synchronized one at a time unless -j/--jobs is greater than
+one, in which case up to N groups are reconciled concurrently using a
+pool of N connections. Parent groups are created before any of
+their children are synchronized (concurrent workers never attempt to
+create the same group twice). If synchronization of a group fails,
+no further groups are started (unless --continue-on-error is
+specified); a summary of failures is reported once groups already in
+progress have finished.
+
+With --resume, progress is recorded in a journal file (created if it
+does not exist): the changes planned for each group, each batch of
+members added or removed, and whether the group was synchronized or
+failed. When the command is run again with the same journal, groups
+that were already synchronized with the same members are skipped, and
+a group that was interrupted continues with the remaining changes in
+its plan without downloading its membership again.
+
+Group membership is cached on disk (see --no-cache): on subsequent runs,
+membership of groups that have not changed on the server is not
+downloaded again.
+
+The groupfile is read incrementally and groups are synchronized in the
+order in which they appear, so memory use does not depend on the size
+of the file. Two formats are supported: a single JSON object mapping
+group names to lists of members ({group: [netids]}), or newline-delimited
+JSON with one object per line in the form {"group": group, "members":
+[netids]} (--format ndjson; the default for files with extension
+.ndjson or .jsonl).
 """
 
 
-import argparse
 import logging
-import json
 
-from uwgroups.api import UWGroups
-from uwgroups.subcommands import find_credentials
+from uwgroups.subcommands import (
+    get_client, add_cache_arguments, get_member_cache,
+    add_jobs_argument, add_groupfile_arguments, read_groups, report_failures)
+from uwgroups.utils import imap_concurrent
 
 log = logging.getLogger(__name__)
 
 
 def build_parser(parser):
-    parser.add_argument('groupfile', type=argparse.FileType(),
-                        help='json file containing a mapping of {group: [netids]}')
+    add_groupfile_arguments(parser)
     parser.add_argument('-n', '--dry-run', action='store_true', default=False)
+    parser.add_argument('--resume', metavar='JOURNAL',
+                        help="""record progress in JOURNAL and skip groups
+                        already synchronized according to JOURNAL""")
+    parser.add_argument('--continue-on-error', action='store_true', default=False,
+                        help="""continue with the remaining groups when a
+                        group cannot be synchronized""")
+    add_jobs_argument(parser)
+    add_cache_arguments(parser)
 
 
 def action(args):
-    certfile, keyfile = find_credentials(args)
-    groupdict = json.load(args.groupfile)
+    failures = {}
+    skipped = 0
+    journal = None
+    if args.resume:
+        from uwgroups.journal import SyncJournal
+        journal = SyncJournal(args.resume)
 
-    with UWGroups(certfile, keyfile, environment=args.environment) as conn:
-        for group_name, members in sorted(groupdict.items()):
+    with get_client(args, pool_size=args.jobs,
+                    member_cache=get_member_cache(args)) as conn:
+        def sync(item):
+            group_name, members = item
+            if journal:
+                return journal.sync_members(conn, group_name, members,
+                                            dry_run=args.dry_run)
             conn.sync_members(group_name, members, dry_run=args.dry_run)
+            return True
+
+        def todo():
+            for group_name, members in read_groups(args):
+                if failures and not args.continue_on_error:
+                    return
+                yield group_name, members
+
+        results = imap_concurrent(sync, todo(), jobs=args.jobs)
+        for (group_name, _), synced, err in results:
+            if err:
+                log.error('failed to sync {}: {}'.format(group_name, err))
+                failures[group_name] = err
+            elif not synced:
+                skipped += 1
+
+        log.info('batch sizes: {}'.format(conn.batch_sizer.stats()))
+
+    if journal:
+        journal.close()
+        log.info('{} group(s) skipped (already synchronized)'.format(skipped))
+
+    return report_failures(failures, 'group(s) could not be synchronized')
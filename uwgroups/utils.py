@@ -1,7 +1,12 @@
+import codecs
 import os
+import json
 import logging
 import shutil
-from itertools import zip_longest, filterfalse
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from itertools import zip_longest, filterfalse, islice
 from functools import wraps
 
 from os import path
@@ -96,3 +101,367 @@ def grouper(iterable, n, fill=False, fillvalue=None):
             yield chunk
         else:
             yield tuple(filterfalse(lambda x: x is None, chunk))
+
+
+@check_types(group_name=str)
+def parents(group_name):
+    """Return a list of the parents of ``group_name`` that must exist
+    before it can be created, in order of creation. The first (root)
+    element of the hierarchy is not included: for example,
+    'u_ngh2_foo_bar' has parents ['u_ngh2', 'u_ngh2_foo'].
+
+    """
+
+    hierarchy = group_name.split('_')
+    return ['_'.join(hierarchy[:i]) for i in range(2, len(hierarchy))]
+
+
+def hierarchy_levels(group_names):
+    """Return the tree of groups formed by ``group_names`` and all of
+    their parents (see ``parents()``) as a list of levels, each a
+    sorted list of group names, in order of creation. Every group
+    appears once, in a level following that of its parent: for
+    example, ['u_a_b_c', 'u_a_d'] has levels [['u_a'], ['u_a_b',
+    'u_a_d'], ['u_a_b_c']].
+
+    """
+
+    levels = []
+    for group_name in set(group_names):
+        for depth, name in enumerate(parents(group_name) + [group_name]):
+            while len(levels) <= depth:
+                levels.append(set())
+            levels[depth].add(name)
+    return [sorted(level) for level in levels]
+
+
+@check_types(jobs=int)
+def imap_concurrent(func, iterable, jobs=1):
+    """Call ``func(item)`` for each element of ``iterable`` using up
+    to ``jobs`` worker threads, yielding tuples of (item, result,
+    exception) as each call completes; exactly one of ``result`` or
+    ``exception`` is None. No more than ``jobs`` calls are in flight
+    at once, so ``iterable`` is consumed lazily and may be a
+    generator. When ``jobs`` is 1, calls are made serially in the
+    calling thread.
+
+    """
+
+    if jobs < 1:
+        raise ValueError('jobs must be a positive integer')
+
+    items = iter(iterable)
+
+    if jobs == 1:
+        for item in items:
+            try:
+                result = func(item)
+            except Exception as err:
+                yield item, None, err
+            else:
+                yield item, result, None
+        return
+
+    executor = ThreadPoolExecutor(max_workers=jobs)
+    pending = {}
+    try:
+        for item in islice(items, jobs):
+            pending[executor.submit(func, item)] = item
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                item = pending.pop(future)
+                # refill before yielding so workers stay busy
+                for nextitem in islice(items, 1):
+                    pending[executor.submit(func, nextitem)] = nextitem
+                err = future.exception()
+                if err is None:
+                    yield item, future.result(), None
+                else:
+                    yield item, None, err
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+
+class JSONStream(object):
+    """Incrementally decode JSON text read from file-like object
+    ``fobj`` in chunks of ``chunksize`` characters (or bytes, which
+    are decoded as utf-8), so that the elements of a large document
+    can be processed without holding the whole document in memory.
+    Only the unprocessed portion of the input (plus the value being
+    decoded) is retained.
+
+    """
+
+    whitespace = ' \t\n\r'
+
+    def __init__(self, fobj, chunksize=2 ** 16):
+        self.fobj = fobj
+        self.chunksize = chunksize
+        self.decoder = json.JSONDecoder()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self._decode = codecs.getincrementaldecoder('utf-8')().decode
+
+    def _read(self, size=None):
+        """Append at least one more chunk to the buffer; return False at
+        end of input.
+
+        """
+
+        if self.eof:
+            return False
+
+        # discard consumed text
+        self.buf = self.buf[self.pos:]
+        self.pos = 0
+
+        data = self.fobj.read(size or self.chunksize)
+        if not data:
+            self.eof = True
+            return False
+        if isinstance(data, bytes):
+            # a multibyte character may span chunks
+            data = self._decode(data)
+        self.buf += data
+        return True
+
+    def peek(self):
+        """Skip whitespace and return the next character, or '' at end of
+        input
+
+        """
+
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in self.whitespace:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._read():
+                return ''
+
+    def expect(self, chars):
+        """Consume the next non-whitespace character, raising ValueError
+        unless it is one of ``chars``; return the character.
+
+        """
+
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError('expected one of {!r} at offset {} but found {!r}'.format(
+                chars, self.pos, char))
+        self.pos += 1
+        return char
+
+    def value(self):
+        """Decode and return the next complete JSON value"""
+
+        self.peek()
+        while True:
+            try:
+                obj, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                # value is incomplete; read more, growing the request
+                # geometrically to avoid quadratic behavior for large
+                # values
+                if not self._read(max(self.chunksize, len(self.buf))):
+                    raise
+            else:
+                # a number may be truncated at the end of the buffer,
+                # in which case only a prefix is decoded (for example,
+                # 0 of 0.5): accept it only if followed by a
+                # character that cannot continue the number
+                if self.buf[self.pos] in '"[{tfn' or self.eof or \
+                   (end < len(self.buf) and self.buf[end] not in '.eE+-'):
+                    self.pos = end
+                    return obj
+                self._read()
+
+
+def iter_json_object(fobj, chunksize=2 ** 16):
+    """Yield (key, value) pairs from a JSON document in ``fobj``
+    consisting of a single object, decoding one item at a time.
+
+    """
+
+    stream = JSONStream(fobj, chunksize)
+    stream.expect('{')
+    if stream.peek() == '}':
+        return
+
+    while True:
+        key = stream.value()
+        if not isinstance(key, str):
+            raise ValueError('object keys must be strings')
+        stream.expect(':')
+        yield key, stream.value()
+        if stream.expect(',}') == '}':
+            break
+
+
+def iter_json_array(fobj, key, chunksize=2 ** 16):
+    """Yield the elements of the array that is the value of ``key`` in
+    a JSON document in ``fobj`` consisting of a single object,
+    decoding one element at a time. Other values in the object are
+    decoded and discarded, and the input is consumed to the end.
+
+    """
+
+    stream = JSONStream(fobj, chunksize)
+    stream.expect('{')
+    if stream.peek() == '}':
+        return
+
+    while True:
+        name = stream.value()
+        stream.expect(':')
+        if name == key and stream.peek() == '[':
+            stream.expect('[')
+            if stream.peek() == ']':
+                stream.expect(']')
+            else:
+                while True:
+                    yield stream.value()
+                    if stream.expect(',]') == ']':
+                        break
+        else:
+            stream.value()
+        if stream.expect(',}') == '}':
+            break
+
+
+def read_groupfile(fobj, fmt='json'):
+    """Yield tuples of (group_name, members) from a group file, reading
+    it incrementally. If ``fmt`` is 'json', the file contains a single
+    object mapping group names to lists of members. If ``fmt`` is
+    'ndjson', each line contains an object with keys 'group' and
+    'members'.
+
+    """
+
+    if fmt == 'json':
+        yield from iter_json_object(fobj)
+    elif fmt == 'ndjson':
+        for line in fobj:
+            if line.strip():
+                record = json.loads(line)
+                yield record['group'], record['members']
+    else:
+        raise ValueError('fmt must be one of json, ndjson')
+
+
+def read_manifest(fobj, fmt='json'):
+    """Yield tuples of (group_name, spec) from a manifest describing
+    groups to create. ``spec`` is a dict with optional keys 'admins'
+    (a list of uwnetids), and 'exchange' and 'google' (True to
+    activate or False to inactivate the affiliate). If ``fmt`` is
+    'json', the file contains a single object mapping group names to
+    specs; if 'ndjson', each line contains a spec with an additional
+    key 'group'. Raises ValueError if a spec is invalid.
+
+    """
+
+    types = {'admins': list, 'exchange': bool, 'google': bool}
+
+    if fmt == 'json':
+        records = iter_json_object(fobj)
+    elif fmt == 'ndjson':
+        records = ((record.pop('group'), record)
+                   for record in (json.loads(line) for line in fobj if line.strip()))
+    else:
+        raise ValueError('fmt must be one of json, ndjson')
+
+    for group_name, spec in records:
+        for key, value in spec.items():
+            if key not in types:
+                raise ValueError('{}: unknown key "{}"'.format(group_name, key))
+            if not isinstance(value, types[key]):
+                raise ValueError('{}: "{}" must be of type {}'.format(
+                    group_name, key, types[key].__name__))
+        yield group_name, spec
+
+
+def pack_count(items, max_length, max_items=None, sep=','):
+    """Return the number of leading elements of the list ``items``
+    that can be joined using ``sep`` into a string no longer than
+    ``max_length``, up to a maximum of ``max_items``. At least one
+    item is always included if ``items`` is not empty.
+
+    """
+
+    limit = len(items) if max_items is None else min(max_items, len(items))
+    length = 0
+    for i, item in enumerate(items[:limit]):
+        length += len(item) + (len(sep) if i else 0)
+        if length > max_length:
+            return max(i, 1)
+    return limit
+
+
+class AdaptiveBatchSize(object):
+    """Choose the number of items to send in each of a series of
+    batched requests. The batch size starts at ``initial`` and is
+    increased by a factor of ``growth`` after each request that
+    completes in less than ``target_latency`` seconds, decreased in
+    proportion to the excess time for slower requests, and halved
+    after a failure, always remaining between ``minimum`` and
+    ``maximum``. The sizes of completed batches are tallied in
+    ``history``. An instance may be shared by multiple threads.
+
+    """
+
+    def __init__(self, initial=50, minimum=1, maximum=1000,
+                 target_latency=2.0, growth=1.5):
+        self.size = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.growth = growth
+        self.history = Counter()
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    def _clamp(self, size):
+        return int(max(self.minimum, min(self.maximum, size)))
+
+    def success(self, count, elapsed):
+        """Record a batch of ``count`` items completed in ``elapsed``
+        seconds.
+
+        """
+
+        with self._lock:
+            self.history[count] += 1
+            # a short final batch says nothing about larger sizes
+            if count < self.size and elapsed < self.target_latency:
+                return
+            if elapsed < self.target_latency:
+                self.size = self._clamp(max(self.size * self.growth, self.size + 1))
+            else:
+                self.size = self._clamp(count * self.target_latency / elapsed)
+
+    def failure(self, count):
+        """Record a failed batch of ``count`` items"""
+
+        with self._lock:
+            self.failures += 1
+            self.size = self._clamp(count // 2)
+
+    def stats(self):
+        """Return a dict summarizing batch sizes"""
+
+        with self._lock:
+            sizes = sorted(self.history.elements())
+            return {
+                'batches': len(sizes),
+                'items': sum(sizes),
+                'min': sizes[0] if sizes else None,
+                'median': sizes[len(sizes) // 2] if sizes else None,
+                'max': sizes[-1] if sizes else None,
+                'failures': self.failures,
+                'current': self.size,
+            }